@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Measure the CPU time spent decoding and flattening one OMS page.
+
+The pages are shaped like OMS responses: a 10000 row hltpathrates page and a
+runs page whose rows carry the units of their fields in meta.row.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_decode --rows 10000
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import time
+
+from wbmcrawlr import utils
+from wbmcrawlr.urls import OMS_API_URL
+from wbmcrawlr.utils import flatten_resource
+
+COLUMNS = ["page", "decode", "units", "ms/page"]
+
+RUN_UNITS = {
+    "b_field": "T",
+    "delivered_lumi": "{\\mu}b^{-1}",
+    "recorded_lumi": "{\\mu}b^{-1}",
+    "init_lumi": "10^{27}cm^{-2}s^{-1}",
+    "end_lumi": "10^{27}cm^{-2}s^{-1}",
+    "energy": "GeV",
+    "l1_rate": "Hz",
+    "hlt_physics_rate": "Hz",
+    "hlt_physics_size": "GB",
+    "hlt_physics_throughput": "GB/s",
+}
+
+
+def hltpathrates_page(rows):
+    data = [
+        {
+            "id": None,
+            "type": "hltpathrates",
+            "attributes": {
+                "run_number": 319579,
+                "path_name": "HLT_AK8PFJet400_TrimMass30_v12",
+                "first_lumisection_number": number,
+                "last_lumisection_number": number,
+                "rate": 1.5 + number / 1000.0,
+                "counter": number * 23,
+            },
+            "meta": {"row": {"rate": {"units": "Hz"}}},
+        }
+        for number in range(1, rows + 1)
+    ]
+    return page("hltpathrates", data)
+
+
+def runs_page(rows):
+    data = [
+        {
+            "id": str(number),
+            "type": "runs",
+            "attributes": dict(
+                [("run_number", number), ("fill_number", 7000 + number // 10)]
+                + [(key, 1.5) for key in RUN_UNITS]
+                + [("start_time", "2018-07-01T00:00:00Z"), ("end_time", None)]
+            ),
+            "links": {"self": "{}runs/{}".format(OMS_API_URL, number)},
+            "meta": {"row": dict((k, {"units": u}) for k, u in RUN_UNITS.items())},
+        }
+        for number in range(300000, 300000 + rows)
+    ]
+    return page("runs", data)
+
+
+def page(table, data):
+    content = {
+        "data": data,
+        "links": {"self": "{}{}".format(OMS_API_URL, table)},
+        "meta": {"totalResourceCount": len(data)},
+    }
+    return json.dumps(content).encode("utf-8")
+
+
+def process(content, units_once):
+    response = utils.loads(content)
+    units = {} if units_once else None
+    return [flatten_resource(resource, units) for resource in response["data"]]
+
+
+def measure(content, fast, units_once, repeat):
+    orjson = utils.orjson
+    if not fast:
+        utils.orjson = None
+    try:
+        best = None
+        for _ in range(repeat):
+            start = time.process_time()
+            process(content, units_once)
+            elapsed = time.process_time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+    finally:
+        utils.orjson = orjson
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    decoders = [False, True] if utils.orjson is not None else [False]
+    if utils.orjson is None:
+        print("orjson is not installed, only measuring the json module")
+
+    pages = [
+        ("hltpathrates", hltpathrates_page(args.rows)),
+        ("runs", runs_page(args.rows)),
+    ]
+    print("{:14s} {:>8s} {:>8s} {:>10s}".format(*COLUMNS))
+    for name, content in pages:
+        for fast in decoders:
+            for units_once in [False, True]:
+                seconds = measure(content, fast, units_once, args.repeat)
+                print(
+                    "{:14s} {:>8s} {:>8s} {:10.1f}".format(
+                        name,
+                        "orjson" if fast else "json",
+                        "once" if units_once else "per row",
+                        seconds * 1000,
+                    )
+                )
+
+
+if __name__ == "__main__":
+    main()
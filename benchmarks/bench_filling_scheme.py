@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Compare splitting the filling scheme of every fill on its own with the batch
+parsers of wbmcrawlr.utils.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_filling_scheme --fills 10000 --schemes 300
+"""
+from __future__ import print_function
+
+import argparse
+import random
+import time
+
+from wbmcrawlr.utils import (
+    iter_split_filling_scheme,
+    split_filling_scheme,
+    split_filling_schemes,
+)
+
+COLUMNS = ["method", "fills", "seconds", "speedup"]
+
+
+def make_fills(fill_count, scheme_count):
+    """
+    :return: Fills sharing scheme_count filling schemes, some of them
+        malformed or missing like in the LHC history
+    """
+    random.seed(42)
+    schemes = [
+        "25ns_{0}b_{1}_{2}_{3}_{4}bpi_{5}inj_V{6}".format(
+            random.randint(2, 2556),
+            random.randint(0, 2544),
+            random.randint(0, 2215),
+            random.randint(0, 2332),
+            random.choice([12, 36, 48, 72, 144]),
+            random.randint(1, 40),
+            random.randint(1, 3),
+        )
+        for _ in range(scheme_count)
+    ]
+    schemes += ["Single_12b_9_1_9_1bpi_12inj", "multiple_injections", None]
+    return [
+        {"fill_number": number, "injection_scheme": random.choice(schemes)}
+        for number in range(fill_count)
+    ]
+
+
+def per_fill(fills):
+    return [split_filling_scheme(fill) for fill in fills]
+
+
+def streaming(fills):
+    return list(iter_split_filling_scheme(fills))
+
+
+def streaming_typed(fills):
+    return list(iter_split_filling_scheme(fills, typed=True))
+
+
+def columnar(fills):
+    return split_filling_schemes([fill["injection_scheme"] for fill in fills])
+
+
+def columnar_typed(fills):
+    schemes = [fill["injection_scheme"] for fill in fills]
+    return split_filling_schemes(schemes, typed=True)
+
+
+METHODS = [per_fill, streaming, streaming_typed, columnar, columnar_typed]
+
+
+def measure(method, fills, repeat):
+    best = None
+    for _ in range(repeat):
+        copies = [dict(fill) for fill in fills]
+        start = time.time()
+        method(copies)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fills", type=int, default=10000)
+    parser.add_argument("--schemes", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    fills = make_fills(args.fills, args.schemes)
+    baseline = measure(per_fill, fills, args.repeat)
+
+    print("{:16s} {:>10s} {:>10s} {:>10s}".format(*COLUMNS))
+    for method in METHODS:
+        seconds = baseline
+        if method is not per_fill:
+            seconds = measure(method, fills, args.repeat)
+        print(
+            "{:16s} {:10d} {:10.4f} {:9.1f}x".format(
+                method.__name__, len(fills), seconds, baseline / seconds
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Compare the PER_PATH and BULK strategies of oms.get_all_hltpathrates against
+the local OMS stub server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_hltpathrates --paths 300 --lumisections 500
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from tests.stub_server import OMSStubServer, make_hltpath_tables
+from wbmcrawlr import oms
+
+COLUMNS = ["strategy", "rows", "requests", "seconds"]
+
+
+def run(server, strategy, workers):
+    counter = oms.RequestCounter()
+    oms.add_request_hook(counter)
+    start = time.time()
+    try:
+        rates = oms.get_all_hltpathrates(
+            1000, silent=True, inside_cern_gpn=True, strategy=strategy, workers=workers
+        )
+    finally:
+        oms.remove_request_hook(counter)
+    return len(rates), counter.count, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--paths", type=int, default=300)
+    parser.add_argument("--lumisections", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    tables = make_hltpath_tables(
+        path_count=args.paths, lumisection_count=args.lumisections
+    )
+
+    with OMSStubServer(tables, latency=args.latency) as server:
+        oms.OMS_API_URL = server.url
+        print("{:10s} {:>10s} {:>10s} {:>10s}".format(*COLUMNS))
+        for strategy in oms.HLTPATHRATES_STRATEGIES:
+            result = run(server, strategy, args.workers)
+            print("{:10s} {:10d} {:10d} {:10.2f}".format(strategy, *result))
+
+
+if __name__ == "__main__":
+    main()
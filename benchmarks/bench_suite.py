@@ -0,0 +1,314 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Measure the main getters of oms and wbm against local OMS and WBM stub servers.
+
+For every getter the wall time (best of --repeat), the number of requests,
+the bytes of all response bodies and the peak memory allocated by Python
+(tracemalloc, in a separate run) are measured. The results are saved as
+benchmarks/results/<version>.json, pass --compare to see the change against
+the results of another version.
+
+By default the stub servers serve generated resources. To replay records of a
+real crawl instead, point --recorded to a directory with the files written by
+wbmcrawl: oms_runs.json, oms_lumisections.json, oms_hltrates.json and
+wbm_runs.json, missing files are generated.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite --latency 0.01 --compare 1.2.1
+"""
+from __future__ import print_function
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from collections import OrderedDict
+
+from benchmarks.bench_decode import RUN_UNITS
+from tests.stub_server import (
+    NoCookiesCredentialsManager,
+    OMSStubServer,
+    WBMStubServer,
+    make_hltpath_tables,
+    make_lumisections,
+    make_resource,
+    make_run_summaries,
+    make_runs,
+)
+from wbmcrawlr import __version__, oms, wbm
+from wbmcrawlr.cache import set_cache
+from wbmcrawlr.throttle import set_throttle
+
+RESULTS_DIRECTORY = os.path.join(os.path.dirname(__file__), "results")
+
+COLUMNS = ["getter", "rows", "requests", "kB", "seconds", "peak MB"]
+METRICS = ["requests", "bytes", "seconds", "peak_memory"]
+
+
+RUN_ATTRIBUTES = dict(
+    [(key, 1.5) for key in RUN_UNITS],
+    start_time="2018-07-01T00:00:00Z",
+    end_time=None,
+)
+LUMISECTION_ATTRIBUTES = {
+    "delivered_lumi": 0.57,
+    "recorded_lumi": 0.55,
+    "beams_stable": True,
+}
+
+
+def _read_json(directory, filename):
+    path = os.path.join(directory or "", filename)
+    if not directory or not os.path.exists(path):
+        return None
+    with io.open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def load_tables(args):
+    """
+    :return: OMS tables and WBM tables, recorded ones where available
+    """
+    runs = _read_json(args.recorded, "oms_runs.json")
+    lumisections = _read_json(args.recorded, "oms_lumisections.json")
+    hltpathrates = _read_json(args.recorded, "oms_hltrates.json")
+    run_summaries = _read_json(args.recorded, "wbm_runs.json")
+
+    tables = {}
+    if runs is None:
+        tables["runs"] = make_runs(300000, 300000 + args.runs - 1, **RUN_ATTRIBUTES)
+    else:
+        tables["runs"] = [make_resource("runs", run) for run in runs]
+
+    if lumisections is None:
+        tables["lumisections"] = make_lumisections(
+            300000, 1, args.lumisections, **LUMISECTION_ATTRIBUTES
+        )
+    else:
+        tables["lumisections"] = [
+            make_resource("lumisections", ls) for ls in lumisections
+        ]
+
+    if hltpathrates is None:
+        tables.update(
+            make_hltpath_tables(300000, args.paths, args.path_lumisections)
+        )
+    else:
+        path_names = OrderedDict((rate["path_name"], None) for rate in hltpathrates)
+        run_number = hltpathrates[0]["run_number"]
+        tables["hltpathinfo"] = [
+            make_resource("hltpathinfo", {"run_number": run_number, "path_name": name})
+            for name in path_names
+        ]
+        tables["hltpathrates"] = [
+            make_resource("hltpathrates", rate) for rate in hltpathrates
+        ]
+
+    if run_summaries is None:
+        run_summaries = make_run_summaries(300000, 300000 + args.runs - 1)
+    return tables, {"RunSummary": run_summaries}
+
+
+def cases(tables, wbm_tables, args):
+    """
+    :return: (name, function) tuples, function returns the retrieved records
+    """
+    run_numbers = [run["attributes"]["run_number"] for run in tables["runs"]]
+    ls_run_number = tables["lumisections"][0]["attributes"]["run_number"]
+    rates_run_number = tables["hltpathinfo"][0]["attributes"]["run_number"]
+    wbm_run_numbers = [int(run["run"]) for run in wbm_tables["RunSummary"]]
+    kwargs = {"inside_cern_gpn": True, "workers": args.workers}
+
+    return [
+        (
+            "get_runs",
+            lambda: oms.get_runs(min(run_numbers), max(run_numbers), **kwargs),
+        ),
+        (
+            "get_lumisections",
+            lambda: oms.get_lumisections(ls_run_number, **kwargs),
+        ),
+        (
+            "get_all_hltpathrates",
+            lambda: oms.get_all_hltpathrates(rates_run_number, silent=True, **kwargs),
+        ),
+        (
+            "get_run_summary_by_range",
+            lambda: wbm._run_infos(
+                wbm.get_run_summary_by_range(
+                    min(wbm_run_numbers), max(wbm_run_numbers), workers=args.workers
+                )
+            ),
+        ),
+    ]
+
+
+def measure(function, servers, repeat):
+    """
+    :return: OrderedDict of rows, requests, bytes, seconds and peak_memory
+    """
+    best = None
+    for _ in range(repeat):
+        requests = sum(server.request_count for server in servers)
+        sent = sum(server.bytes_sent for server in servers)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows = len(function())
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best["seconds"]:
+            best = OrderedDict(
+                [
+                    ("rows", rows),
+                    (
+                        "requests",
+                        sum(server.request_count for server in servers) - requests,
+                    ),
+                    ("bytes", sum(server.bytes_sent for server in servers) - sent),
+                    ("seconds", seconds),
+                ]
+            )
+
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            function()
+        best["peak_memory"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best
+
+
+def _git_commit():
+    try:
+        output = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+def results_path(label):
+    return os.path.join(RESULTS_DIRECTORY, "{}.json".format(label))
+
+
+def save_results(label, parameters, results):
+    if not os.path.exists(RESULTS_DIRECTORY):
+        os.makedirs(RESULTS_DIRECTORY)
+    content = OrderedDict(
+        [
+            ("version", label),
+            ("commit", _git_commit()),
+            ("date", datetime.datetime.now().isoformat()),
+            ("python", platform.python_version()),
+            ("parameters", parameters),
+            ("results", results),
+        ]
+    )
+    with io.open(results_path(label), "w", encoding="utf-8") as file:
+        file.write(json.dumps(content, indent=2))
+    return results_path(label)
+
+
+def print_comparison(results, label):
+    path = results_path(label)
+    if not os.path.exists(path):
+        print("No results of version {} in '{}'".format(label, path))
+        return
+
+    with io.open(path, encoding="utf-8") as file:
+        previous = json.load(file)["results"]
+
+    print()
+    print("Change against {}:".format(label))
+    print("{:26s}".format("getter") + "".join("{:>14s}".format(m) for m in METRICS))
+    for name, metrics in results.items():
+        if name not in previous:
+            continue
+        changes = []
+        for metric in METRICS:
+            before = previous[name][metric]
+            change = (metrics[metric] - before) / before * 100 if before else 0
+            changes.append("{:>+13.1f}%".format(change))
+        print("{:26s}{}".format(name, "".join(changes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=2000)
+    parser.add_argument("--lumisections", type=int, default=3000)
+    parser.add_argument("--paths", type=int, default=100)
+    parser.add_argument("--path-lumisections", type=int, default=200)
+    parser.add_argument("--recorded", metavar="DIRECTORY", help="replay records")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--label", default=__version__, help="results file name")
+    parser.add_argument("--compare", metavar="VERSION")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    tables, wbm_tables = load_tables(args)
+
+    # Measure the client, not the rate limit or the response cache
+    set_throttle(None)
+    set_cache(None)
+    wbm.get_credentials_manager = NoCookiesCredentialsManager
+    wbm.default_user_certificate_paths = lambda: None
+
+    with OMSStubServer(tables, latency=args.latency) as oms_server:
+        with WBMStubServer(wbm_tables, latency=args.latency) as wbm_server:
+            oms.OMS_API_URL = oms_server.url
+            wbm.WBM_URL = wbm_server.url
+            servers = [oms_server, wbm_server]
+
+            print("{:26s} {:>8s} {:>8s} {:>10s} {:>8s} {:>8s}".format(*COLUMNS))
+            results = OrderedDict()
+            for name, function in cases(tables, wbm_tables, args):
+                result = measure(function, servers, args.repeat)
+                results[name] = result
+                print(
+                    "{:26s} {:8d} {:8d} {:10.1f} {:8.2f} {:8.1f}".format(
+                        name,
+                        result["rows"],
+                        result["requests"],
+                        result["bytes"] / 1000,
+                        result["seconds"],
+                        result["peak_memory"] / 1e6,
+                    )
+                )
+
+    if args.compare:
+        print_comparison(results, args.compare)
+
+    if not args.no_save:
+        parameters = OrderedDict(
+            (name, getattr(args, name))
+            for name in ["runs", "lumisections", "paths", "path_lumisections"]
+            + ["recorded", "latency", "workers", "repeat"]
+        )
+        path = save_results(args.label, parameters, results)
+        print()
+        print("Saved results in '{}'".format(path))
+
+
+if __name__ == "__main__":
+    main()
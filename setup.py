@@ -41,5 +41,6 @@ setup(
     author_email="peter.stein@cern.ch",
     packages=find_packages(),
     install_requires=["cernrequests", "xmltodict", "future"],
+    extras_require={"async": ["aiohttp"], "fast": ["orjson"]},
     entry_points={"console_scripts": ["wbmcrawl=wbmcrawlr.main:main"]},
 )
\ No newline at end of file
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import pytest
+
+from stub_server import OMSStubServer, make_runs
+from wbmcrawlr import auth, oms, oms_async, wbm
+from wbmcrawlr.auth import CredentialsManager
+
+
+@pytest.fixture
+def runs_stub(monkeypatch):
+    """
+    OMS stub server with the global runs 1000 to 1249, used by oms
+    """
+    with OMSStubServer({"runs": make_runs(1000, 1249)}) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        yield server
+
+
+@pytest.fixture
+def handshakes(monkeypatch):
+    """
+    Real credentials manager, with SSO handshakes handing out the cookies
+    session=1, session=2, ...
+    """
+    handshakes = []
+
+    def fake_get_sso_cookies(url, cert=None, **kwargs):
+        handshakes.append(url)
+        return {"session": str(len(handshakes))}
+
+    manager = CredentialsManager()
+    monkeypatch.setattr(auth, "get_sso_cookies", fake_get_sso_cookies)
+    monkeypatch.setattr(oms, "get_credentials_manager", lambda: manager)
+    monkeypatch.setattr(oms, "default_user_certificate_paths", lambda: None)
+    monkeypatch.setattr(wbm, "get_credentials_manager", lambda: manager)
+    monkeypatch.setattr(wbm, "default_user_certificate_paths", lambda: None)
+    monkeypatch.setattr(oms_async, "get_credentials_manager", lambda: manager)
+    return handshakes
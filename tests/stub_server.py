@@ -0,0 +1,380 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Local stand-in for the CMS OMS JSON:API used by the offline tests.
+
+Only the subset of the API used by wbmcrawlr is implemented: filters,
+sorting and offset/limit pagination with meta.totalResourceCount.
+WBMStubServer serves the RunSummary servlet of WBM the same way.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl
+
+import xmltodict
+
+FILTER_PATTERN = re.compile(r"^filter\[(\w+)\]\[(\w+)\]$")
+
+OPERATORS = {
+    "EQ": lambda a, b: a == b,
+    "NEQ": lambda a, b: a != b,
+    "GT": lambda a, b: a > b,
+    "GE": lambda a, b: a >= b,
+    "LT": lambda a, b: a < b,
+    "LE": lambda a, b: a <= b,
+}
+
+
+def make_resource(table, attributes, id_field=None):
+    resource = {"type": table, "attributes": attributes}
+    if id_field:
+        resource["id"] = str(attributes[id_field])
+    return resource
+
+
+def make_hltpath_tables(run_number=1000, path_count=20, lumisection_count=30):
+    """
+    :return: hltpathinfo and hltpathrates tables for one run
+    """
+    path_names = ["HLT_Path{:03d}_v1".format(i) for i in range(path_count)]
+    hltpathinfo = [
+        make_resource("hltpathinfo", {"run_number": run_number, "path_name": name})
+        for name in reversed(path_names)
+    ]
+    hltpathrates = [
+        make_resource(
+            "hltpathrates",
+            {
+                "run_number": run_number,
+                "path_name": name,
+                "first_lumisection_number": lumisection,
+                "last_lumisection_number": lumisection,
+                "rate": 1.5,
+                "counter": 23,
+            },
+        )
+        for lumisection in range(1, lumisection_count + 1)
+        for name in path_names
+    ]
+    return {"hltpathinfo": hltpathinfo, "hltpathrates": hltpathrates}
+
+
+def _cast(value, reference):
+    if isinstance(reference, bool):
+        return value.lower() == "true"
+    if isinstance(reference, int):
+        return int(value)
+    if isinstance(reference, float):
+        return float(value)
+    return value
+
+
+def _matches(attributes, filters):
+    for field, operator, value in filters:
+        reference = attributes.get(field)
+        if reference is None:
+            return False
+        if not OPERATORS[operator](reference, _cast(value, reference)):
+            return False
+    return True
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops concurrent connections, which are then
+    # retried by the client after a second
+    request_queue_size = 128
+
+
+class _OMSRequestHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        table = url.path.strip("/").split("/")[-1]
+        parameters = parse_qsl(url.query)
+
+        stub.record(self.path, self.headers.get("Cookie"))
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        failure = stub.next_failure()
+        if failure:
+            status, headers = failure
+            self._send_json(status, {"errors": [{"status": status}]}, headers)
+            return
+
+        cookie = self.headers.get("Cookie") or ""
+        if stub.required_cookie is not None and stub.required_cookie not in cookie:
+            self._send_json(401, {"errors": [{"status": 401}]})
+            return
+
+        if table not in stub.tables:
+            self.send_error(404)
+            return
+
+        self.respond(stub, table, parameters)
+
+    def respond(self, stub, table, parameters):
+        limit = dict(parameters).get("page[limit]")
+        if stub.max_limit and limit and int(limit) > stub.max_limit:
+            self._send_json(400, {"errors": [{"detail": "page[limit] too big"}]})
+            return
+
+        self._send_json(200, stub.query(table, parameters))
+
+    def _send_json(self, status, content, headers=None):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        # Counted first, the client may be done as soon as the body is sent
+        self.server.stub.record_bytes(len(body))
+        self.wfile.write(body)
+
+
+class _WBMRequestHandler(_OMSRequestHandler):
+    def respond(self, stub, servlet, parameters):
+        body = stub.query(servlet, dict(parameters)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        stub.record_bytes(len(body))
+        self.wfile.write(body)
+
+
+class OMSStubServer(object):
+    """
+    >>> with OMSStubServer({"runs": [...]}) as server:
+    ...     requests.get("{}runs?page[limit]=1".format(server.url))
+    """
+
+    handler = _OMSRequestHandler
+
+    def __init__(self, tables, latency=0, max_limit=None):
+        self.tables = tables
+        self.latency = latency
+        self.max_limit = max_limit
+        self.required_cookie = None  # e.g. "session=1", answered with 401 if missing
+        self.shuffle_ties = False
+        self.failures = []
+        self.requests = []
+        self.cookies = []  # Cookie header of every request
+        self.bytes_sent = 0  # Response bodies only
+        self._lock = threading.Lock()
+        self._server = _ThreadingHTTPServer(("127.0.0.1", 0), self.handler)
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return "http://{}:{}/".format(host, port)
+
+    @property
+    def request_count(self):
+        return len(self.requests)
+
+    def record(self, path, cookie=None):
+        with self._lock:
+            self.requests.append(path)
+            self.cookies.append(cookie)
+
+    def record_bytes(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def fail_next(self, status, count=1, headers=None):
+        """
+        Answer the next `count` requests with the given HTTP status
+        """
+        with self._lock:
+            self.failures.extend([(status, headers)] * count)
+
+    def next_failure(self):
+        with self._lock:
+            return self.failures.pop(0) if self.failures else None
+
+    def query(self, table, parameters):
+        filters = []
+        offset = 0
+        limit = None
+        sort = None
+
+        for key, value in parameters:
+            match = FILTER_PATTERN.match(key)
+            if match:
+                filters.append((match.group(1), match.group(2), value))
+            elif key == "page[offset]":
+                offset = int(value)
+            elif key == "page[limit]":
+                limit = int(value)
+            elif key == "sort":
+                sort = value
+
+        rows = [
+            resource
+            for resource in self.tables[table]
+            if _matches(resource["attributes"], filters)
+        ]
+
+        if self.shuffle_ties:  # Like a database, no order among equal rows
+            random.shuffle(rows)
+        for field in reversed(sort.split(",") if sort else []):
+            key = field.lstrip("-")
+            rows.sort(key=lambda r: r["attributes"][key], reverse=field[0] == "-")
+
+        page = rows[offset:] if limit is None else rows[offset : offset + limit]
+        return {"data": page, "meta": {"totalResourceCount": len(rows)}}
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class NoCookiesCredentialsManager(object):
+    """
+    Stand-in for wbmcrawlr.auth.CredentialsManager, the stub servers do not
+    need SSO cookies
+
+    >>> monkeypatch.setattr(wbm, "get_credentials_manager", NoCookiesCredentialsManager)
+    """
+
+    def get_cookies(self, url, cert=None, refresh=False, stale=None):
+        return {}
+
+    def inside_cern_gpn(self):
+        return True
+
+
+def _fill_number(run_number):
+    return 7000 + run_number // 20
+
+
+def make_runs(begin, end, **attributes):
+    """
+    :param attributes: Added to every run, e.g. end_time=None
+    :return: OMS resources of the global runs begin to end
+    """
+    runs = []
+    for number in range(begin, end + 1):
+        run = {
+            "run_number": number,
+            "fill_number": _fill_number(number),
+            "sequence": "GLOBAL-RUN",
+        }
+        run.update(attributes)
+        runs.append(make_resource("runs", run))
+    return runs
+
+
+def make_lumisections(run_number, begin, end, **attributes):
+    """
+    Lumisections of 23 seconds, run 1001 starting on 2018-07-01, 1002 on the
+    next day and so on, repeating every ten runs
+
+    :param attributes: Added to every lumisection, e.g. end_time=None
+    :return: OMS resources of the lumisections begin to end of the run
+    """
+    run_start = datetime(2018, 6, 30) + timedelta(days=run_number % 10)
+    lumisections = []
+    for number in range(begin, end + 1):
+        start_time = run_start + timedelta(seconds=23 * (number - 1))
+        lumisection = {
+            "run_number": run_number,
+            "fill_number": _fill_number(run_number),
+            "lumisection_number": number,
+            "start_time": start_time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "end_time": (start_time + timedelta(seconds=23)).strftime(
+                "%Y-%m-%dT%H:%M:%SZ"
+            ),
+        }
+        lumisection.update(attributes)
+        lumisections.append(make_resource("lumisections", lumisection))
+    return lumisections
+
+
+def make_run_summaries(begin, end):
+    """
+    :return: WBM RunSummary runInfo records of the runs begin to end
+    """
+    return [
+        OrderedDict(
+            [
+                ("run", str(number)),
+                ("lhcFill", str(_fill_number(number))),
+                ("bField", "3.80056399"),
+                ("nLumiSections", str(100 + number % 50)),
+                ("runLumi", "8.117866"),
+                ("recordedLumi", "7.76365353"),
+                ("startTime", "2018.07.01 00:00:00"),
+                ("stopTime", None),
+            ]
+        )
+        for number in range(begin, end + 1)
+    ]
+
+
+class WBMStubServer(OMSStubServer):
+    """
+    Serves the RunSummary servlet of WBM as XML, newest run first
+
+    >>> with WBMStubServer({"RunSummary": make_run_summaries(1000, 1100)}) as server:
+    ...     requests.get("{}RunSummary?RUN_BEGIN=1000&RUN_END=1010".format(server.url))
+    """
+
+    handler = _WBMRequestHandler
+
+    def query(self, servlet, parameters):
+        if "RUN" in parameters:
+            begin = end = int(parameters["RUN"])
+        else:
+            begin = int(parameters["RUN_BEGIN"])
+            end = int(parameters["RUN_END"])
+
+        run_infos = [
+            run_info
+            for run_info in self.tables[servlet]
+            if begin <= int(run_info["run"]) <= end
+        ]
+        run_infos.sort(key=lambda run_info: int(run_info["run"]), reverse=True)
+
+        if len(run_infos) == 1:
+            run_infos = run_infos[0]
+        document = {"cmsdb": {"runInfo": run_infos} if run_infos else None}
+        return xmltodict.unparse(document, pretty=True)
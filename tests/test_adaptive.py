@@ -0,0 +1,96 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from stub_server import OMSStubServer, make_resource
+from wbmcrawlr import oms
+from wbmcrawlr.adaptive import AdaptivePageSize
+
+
+def test_adaptive_page_size_grows_and_shrinks():
+    page_size = AdaptivePageSize(100, minimum=10, maximum=1000, target_seconds=2)
+
+    page_size.record(rows=100, seconds=0.1, size=1000)
+    assert page_size.value == 200
+
+    page_size.record(rows=200, seconds=1.5, size=2000)
+    assert page_size.value == 200
+
+    page_size.record(rows=200, seconds=5, size=2000)
+    assert page_size.value == 100
+
+    page_size.record(rows=50, seconds=0.1, size=500)  # Last page
+    assert page_size.value == 100
+
+
+def test_adaptive_page_size_limits():
+    page_size = AdaptivePageSize(800, maximum=1000, max_bytes=10000)
+    page_size.record(rows=800, seconds=0.1, size=8000)
+    assert page_size.value == 1000
+
+    page_size.record(rows=1000, seconds=0.1, size=20000)  # 20 bytes per row
+    assert page_size.value == 500
+
+    page_size = AdaptivePageSize(20, minimum=10)
+    assert page_size.failed()
+    assert page_size.value == 10
+    assert not page_size.failed()
+
+
+def test_adaptive_page_size_stays_below_failed_size():
+    page_size = AdaptivePageSize(400, maximum=10000, probe_interval=3)
+    page_size.record(rows=400, seconds=0.1, size=4000)
+    assert page_size.value == 800
+    assert page_size.failed()
+    assert page_size.value == 400
+    assert page_size.upper_bound == 800
+
+    for _ in range(2):
+        page_size.record(rows=400, seconds=0.1, size=4000)
+        assert page_size.value == 400
+
+    page_size.record(rows=400, seconds=0.1, size=4000)  # Probe
+    assert page_size.value == 600
+    assert page_size.failed()
+    assert page_size.value == 400
+    assert page_size.upper_bound == 600
+
+
+def _page_limit(path):
+    return int(parse_qs(urlparse(path).query)["page[limit]"][0])
+
+
+@pytest.mark.parametrize("pagination", oms.PAGINATIONS)
+def test_adaptive_get_resources(monkeypatch, pagination):
+    runs = [make_resource("runs", {"run_number": n}) for n in range(20000)]
+    parameters = {"filter[run_number][GE]": 0, "sort": "run_number"}
+
+    with OMSStubServer({"runs": runs}, max_limit=400) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        result = oms.get_resources(
+            "runs",
+            parameters,
+            page_size=100,
+            silent=True,
+            inside_cern_gpn=True,
+            adaptive=True,
+            pagination=pagination,
+        )
+        limits = [_page_limit(path) for path in server.requests]
+
+    assert [run["run_number"] for run in result] == list(range(20000))
+    rejected = [limit for limit in limits if limit > 400]
+    assert len(rejected) <= 5
+    assert len(limits) - len(rejected) <= 20000 // 400 + 5
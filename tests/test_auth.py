@@ -0,0 +1,148 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import pytest
+
+from stub_server import (
+    OMSStubServer,
+    WBMStubServer,
+    make_hltpath_tables,
+    make_resource,
+    make_run_summaries,
+)
+from wbmcrawlr import auth, oms, wbm
+from wbmcrawlr.auth import CredentialsManager
+
+
+def test_connectivity_is_probed_once(monkeypatch):
+    probes = []
+    monkeypatch.setattr(auth, "check_oms_connectivity", lambda: probes.append(1) or True)
+
+    manager = CredentialsManager()
+    assert manager.inside_cern_gpn()
+    assert manager.inside_cern_gpn()
+    assert len(probes) == 1
+
+    manager.connectivity_ttl = -1
+    assert manager.inside_cern_gpn()
+    assert len(probes) == 2
+
+
+def test_cookies_are_cached_per_host(monkeypatch):
+    handshakes = []
+
+    def fake_get_sso_cookies(url, cert=None, **kwargs):
+        handshakes.append(url)
+        return {"cookie": len(handshakes)}
+
+    monkeypatch.setattr(auth, "get_sso_cookies", fake_get_sso_cookies)
+
+    manager = CredentialsManager()
+    assert manager.get_cookies("https://cmswbm.cern.ch/a?RUN=1") == {"cookie": 1}
+    assert manager.get_cookies("https://cmswbm.cern.ch/b?RUN=2") == {"cookie": 1}
+    assert manager.get_cookies("https://cmsoms.cern.ch/agg/") == {"cookie": 2}
+    assert manager.get_cookies("https://cmswbm.cern.ch/", refresh=True) == {
+        "cookie": 3
+    }
+    assert len(handshakes) == 3
+
+
+class ExpiringCredentialsManager(object):
+    """
+    Hands out cookies that the stub servers do not check
+    """
+
+    def __init__(self):
+        self.refreshes = 0
+
+    def get_cookies(self, url, cert=None, refresh=False, stale=None):
+        self.refreshes += refresh
+        return {"session": "new" if refresh else "old"}
+
+
+@pytest.fixture
+def credentials():
+    return ExpiringCredentialsManager()
+
+
+def test_oms_request_is_repeated_once_with_refreshed_cookies(monkeypatch, credentials):
+    monkeypatch.setattr(oms, "get_credentials_manager", lambda: credentials)
+    monkeypatch.setattr(oms, "default_user_certificate_paths", lambda: None)
+    runs = [make_resource("runs", {"run_number": 1000})]
+
+    with OMSStubServer({"runs": runs}) as server:
+        monkeypatch.setattr(oms, "OMS_ALTERNATIVE_API_URL", server.url)
+        server.fail_next(401)
+        response = oms._get_oms_resource_authenticated("runs?page[limit]=1")
+
+    assert response.status_code == 200
+    assert server.cookies == ["session=old", "session=new"]
+    assert credentials.refreshes == 1
+
+
+def test_wbm_request_is_repeated_once_with_refreshed_cookies(monkeypatch, credentials):
+    monkeypatch.setattr(wbm, "get_credentials_manager", lambda: credentials)
+    monkeypatch.setattr(wbm, "default_user_certificate_paths", lambda: None)
+
+    with WBMStubServer({"RunSummary": make_run_summaries(1000, 1009)}) as server:
+        monkeypatch.setattr(wbm, "WBM_URL", server.url)
+        server.fail_next(401, count=2)
+        url = wbm._resource_url("RunSummary", {"RUN": 1000})
+        response = wbm._request(url)
+
+    # Only refreshed once, a second 401 is left to the caller
+    assert response.status_code == 401
+    assert server.cookies == ["session=old", "session=new"]
+    assert credentials.refreshes == 1
+
+
+@pytest.mark.parametrize("strategy", oms.HLTPATHRATES_STRATEGIES)
+@pytest.mark.parametrize("workers", [1, 4])
+def test_hltpathrates_share_refreshed_cookies(
+    monkeypatch, handshakes, workers, strategy
+):
+    with OMSStubServer(make_hltpath_tables(path_count=5)) as server:
+        monkeypatch.setattr(oms, "OMS_ALTERNATIVE_API_URL", server.url)
+        server.required_cookie = "session=1"
+
+        def expire_cookies(table, parameters, response):
+            if table == "hltpathinfo":
+                server.required_cookie = "session=2"
+
+        oms.add_request_hook(expire_cookies)
+        try:
+            rates = oms.get_all_hltpathrates(
+                1000,
+                silent=True,
+                inside_cern_gpn=False,
+                workers=workers,
+                strategy=strategy,
+            )
+        finally:
+            oms.remove_request_hook(expire_cookies)
+
+    assert len(rates) == 5 * 30
+    # One handshake before and one after the cookies expired
+    assert len(handshakes) == 2
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_wbm_chunks_share_refreshed_cookies(monkeypatch, handshakes, workers):
+    with WBMStubServer({"RunSummary": make_run_summaries(1000, 1199)}) as server:
+        monkeypatch.setattr(wbm, "WBM_URL", server.url)
+        server.required_cookie = "session=2"  # The first cookies already expired
+        runs = list(
+            wbm.iter_run_summary_by_range(1000, 1199, chunk_size=20, workers=workers)
+        )
+
+    assert len(runs) == 200
+    assert len(handshakes) == 2
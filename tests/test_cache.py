@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import os
+import time
+
+import pytest
+
+from stub_server import OMSStubServer, make_lumisections, make_runs
+from wbmcrawlr import oms, wbm
+from wbmcrawlr.cache import OPEN_TTL, ResponseCache, set_cache
+
+
+def test_cache_set_get(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    assert cache.get("https://example.com/runs?a=1") is None
+
+    cache.set("https://example.com/runs?a=1", b'{"data": []}')
+    assert cache.get("https://example.com/runs?a=1") == b'{"data": []}'
+    assert cache.get("https://example.com/runs?a=2") is None
+
+    cache.clear()
+    assert cache.get("https://example.com/runs?a=1") is None
+
+
+def test_cache_expiry(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    cache.set("https://example.com/runs", b"expired", ttl=-1)
+    assert cache.get("https://example.com/runs") is None
+
+
+def test_cache_lru_eviction(tmpdir):
+    cache = ResponseCache(str(tmpdir), max_size=350)
+    for i in range(3):
+        cache.set("https://example.com/{}".format(i), b"x" * 100)
+        path = cache._path("https://example.com/{}".format(i))
+        os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+    cache.get("https://example.com/0")  # 0 is now the most recently used
+    cache.set("https://example.com/3", b"x" * 100)
+
+    assert cache.get("https://example.com/0") is not None
+    assert cache.get("https://example.com/1") is None
+    assert cache.size <= 350
+
+
+@pytest.fixture
+def cache(tmpdir):
+    cache = ResponseCache(str(tmpdir))
+    set_cache(cache)
+    yield cache
+    set_cache(None)
+
+
+def test_oms_pages_are_served_from_cache(monkeypatch, cache):
+    runs = make_runs(1000, 1499, end_time="2018")
+    runs[-1]["attributes"]["end_time"] = None  # Ongoing run
+
+    with OMSStubServer({"runs": runs}) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        first = oms.get_runs(1000, 1499, silent=True, inside_cern_gpn=True)
+        assert server.request_count == 5
+
+        second = oms.get_runs(1000, 1499, silent=True, inside_cern_gpn=True)
+        assert second == first
+        assert server.request_count == 5
+
+        future = time.time() + 24 * 60 * 60
+        monkeypatch.setattr(time, "time", lambda: future)
+        oms.get_runs(1000, 1499, silent=True, inside_cern_gpn=True)
+        # Only the last page can change
+        assert server.request_count == 6
+
+
+@pytest.mark.parametrize("pagination", oms.PAGINATIONS)
+def test_cached_pages_with_runs_added_later(monkeypatch, cache, pagination):
+    runs = make_runs(1000, 1499, end_time="2018")
+    runs[-1]["attributes"]["end_time"] = None  # Ongoing run
+    kwargs = {"silent": True, "inside_cern_gpn": True, "pagination": pagination}
+
+    with OMSStubServer({"runs": runs}) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        oms.get_runs(1000, 1999, **kwargs)
+
+        # The first page and its total count are served from the cache
+        runs[-1]["attributes"]["end_time"] = "2018"
+        runs.extend(make_runs(1500, 1549, end_time="2018"))
+        future = time.time() + 24 * 60 * 60
+        monkeypatch.setattr(time, "time", lambda: future)
+        result = oms.get_runs(1000, 1999, **kwargs)
+
+    assert [run["run_number"] for run in result] == list(range(1000, 1550))
+
+
+def test_cached_lumisection_count_with_lumisections_added_later(monkeypatch, cache):
+    lumisections = make_lumisections(1000, 1, 10)
+    with OMSStubServer({"lumisections": lumisections}) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        assert oms.get_lumisection_count(1000, inside_cern_gpn=True) == 10
+
+        lumisections.extend(make_lumisections(1000, 11, 50))
+        future = time.time() + OPEN_TTL + 1
+        monkeypatch.setattr(time, "time", lambda: future)
+        assert oms.get_lumisection_count(1000, inside_cern_gpn=True) == 50
+
+
+def test_wbm_cache_ttl(cache):
+    def run_summary(*stop_times):
+        run_infos = [{"run": "1000", "stopTime": stop} for stop in stop_times]
+        if len(run_infos) == 1:  # A single record instead of a list
+            run_infos = run_infos[0]
+        return {"cmsdb": {"runInfo": run_infos}}
+
+    assert wbm._cache_ttl(cache, "RunSummary", run_summary("2018.07.01")) == 86400
+    assert wbm._cache_ttl(cache, "RunSummary", run_summary("2018", None)) == OPEN_TTL
+    assert wbm._cache_ttl(cache, "RunSummary", {"cmsdb": None}) == OPEN_TTL
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from array import array
+
+import pytest
+
+from stub_server import OMSStubServer, make_hltpath_tables
+from wbmcrawlr import oms
+from wbmcrawlr.columnar import ColumnarTable
+
+LUMISECTIONS = [
+    {
+        "lumisection_number": 1,
+        "recorded_lumi": 0.5,
+        "cms_active": True,
+        "start_time": "2018-06-30T10:00:00Z",
+    },
+    {
+        "lumisection_number": 2,
+        "recorded_lumi": 1,
+        "cms_active": False,
+        "start_time": "2018-06-30T10:00:23Z",
+    },
+]
+
+
+def test_columnar_table_types():
+    table = ColumnarTable().extend(LUMISECTIONS)
+
+    assert len(table) == 2
+    assert table.schema == {
+        "lumisection_number": "q",
+        "recorded_lumi": "d",
+        "cms_active": "b",
+        "start_time": None,
+    }
+    assert table["lumisection_number"] == array("q", [1, 2])
+    assert table["recorded_lumi"] == array("d", [0.5, 1.0])
+    assert table["start_time"] == ["2018-06-30T10:00:00Z", "2018-06-30T10:00:23Z"]
+    assert list(table.rows()) == LUMISECTIONS
+
+
+def test_columnar_table_mixed_values():
+    table = ColumnarTable()
+    table.append({"a": 1, "b": 1})
+    table.append({"a": 1.5, "b": None, "c": "new"})
+    table.append({"a": 2, "b": "text", "c": None})
+
+    assert table["a"] == array("d", [1.0, 1.5, 2.0])
+    assert table["b"] == [1, None, "text"]
+    assert table["c"] == [None, "new", None]
+    assert table.row(0) == {"a": 1.0, "b": 1, "c": None}
+
+
+def test_columnar_table_missing_values():
+    table = ColumnarTable()
+    table.append({"rate": 1.5, "counter": None, "cms_active": True})
+    table.append({"rate": None, "counter": 23, "cms_active": None})
+    table.append({"rate": 2.5, "counter": 24, "cms_active": False, "new": 7})
+
+    assert table.schema == {"rate": "d", "counter": "q", "cms_active": "b", "new": "q"}
+    assert table["rate"] == array("d", [1.5, 0, 2.5])
+    assert table["counter"] == array("q", [0, 23, 24])
+    assert table.nulls == {
+        "rate": {1},
+        "counter": {0},
+        "cms_active": {1},
+        "new": {0, 1},
+    }
+    assert table.row(1) == {
+        "rate": None,
+        "counter": 23,
+        "cms_active": None,
+        "new": None,
+    }
+    assert table.row(2) == {"rate": 2.5, "counter": 24, "cms_active": False, "new": 7}
+
+    table = ColumnarTable.from_columns({"rate": [1.5, None, 2.5]})
+    assert table["rate"] == array("d", [1.5, 0, 2.5])
+    assert [row["rate"] for row in table.rows()] == [1.5, None, 2.5]
+
+
+def test_columnar_table_to_numpy():
+    numpy = pytest.importorskip("numpy")
+    arrays = ColumnarTable().extend(LUMISECTIONS).to_numpy()
+    assert arrays["lumisection_number"].dtype == numpy.int64
+    assert arrays["cms_active"].tolist() == [True, False]
+
+    table = ColumnarTable().extend([{"rate": 1.5}, {"rate": None}, {"rate": 2.5}])
+    rate = table.to_numpy()["rate"]
+    assert rate.dtype == numpy.float64
+    assert rate.tolist() == [1.5, None, 2.5]
+
+
+def test_get_hltpathrates_columnar(monkeypatch):
+    with OMSStubServer(make_hltpath_tables()) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        table = oms.get_hltpathrates_columnar(
+            1000, "HLT_Path003_v1", silent=True, inside_cern_gpn=True
+        )
+
+    assert len(table) == 30
+    assert table["last_lumisection_number"] == array("q", range(1, 31))
+    assert table["rate"] == array("d", [1.5] * 30)
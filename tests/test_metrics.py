@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import json
+
+import pytest
+
+from stub_server import NoCookiesCredentialsManager, WBMStubServer, make_run_summaries
+from wbmcrawlr import metrics, oms, retry, wbm
+from wbmcrawlr.metrics import Metrics
+from wbmcrawlr.sinks import create_sink
+
+
+@pytest.fixture
+def collector(monkeypatch):
+    collector = Metrics()
+    monkeypatch.setattr(metrics, "_metrics", collector)
+    monkeypatch.setattr(retry, "BACKOFF", 0)
+    return collector
+
+
+def test_oms_requests_are_recorded(collector, runs_stub):
+    runs_stub.fail_next(500)
+    runs = oms.get_runs(1000, 1249, silent=True, inside_cern_gpn=True)
+
+    assert len(runs) == 250
+    statuses = [request[2] for request in collector.requests]
+    assert statuses == [500, 200, 200, 200]
+    assert [request[5] for request in collector.requests] == [1, 2, 1, 1]
+    assert collector.retries == 1
+    assert sum(request[4] for request in collector.requests) == runs_stub.bytes_sent
+
+    phases = collector.as_dict()["phases"]
+    assert phases["network"]["count"] == 4
+    assert phases["throttle"]["count"] == 4
+    assert phases["decode"]["count"] == 3
+    assert phases["flatten"]["count"] == 3
+
+
+def test_streamed_wbm_requests_are_recorded(collector, monkeypatch, tmpdir):
+    monkeypatch.setattr(wbm, "get_credentials_manager", NoCookiesCredentialsManager)
+    monkeypatch.setattr(wbm, "default_user_certificate_paths", lambda: None)
+    with WBMStubServer({"RunSummary": make_run_summaries(1000, 1199)}) as server:
+        monkeypatch.setattr(wbm, "WBM_URL", server.url)
+        runs = wbm.iter_run_summary_by_range(1000, 1199, chunk_size=100)
+        with create_sink(str(tmpdir.join("wbm_runs")), "ndjson") as sink:
+            sink.write_all(runs)
+
+    assert [request[:3] for request in collector.requests] == [
+        ("wbm", "RunSummary", 200)
+    ] * 2
+    assert sum(request[4] for request in collector.requests) == server.bytes_sent
+    assert collector.phases["write"][0] == 200
+    assert collector.phases["decode"][0] == 200 + 2
+
+
+def test_nothing_is_recorded_without_collector(runs_stub):
+    assert metrics.get_metrics() is None
+    assert len(oms.get_runs(1000, 1249, silent=True, inside_cern_gpn=True)) == 250
+
+
+def test_export(collector, tmpdir):
+    collector.record_request("oms", "runs", 200, 0.25, 1000)
+    collector.record_request("oms", "runs", 503, 0.5, 10)
+    collector.record_retry()
+    with collector.phase("decode"):
+        pass
+
+    summary = collector.summary()
+    assert "Requests: 2, retries: 1" in summary
+    assert "1x 200, 1x 503" in summary
+
+    prometheus = collector.to_prometheus()
+    lines = prometheus.splitlines()
+    assert "# TYPE wbmcrawlr_requests_total counter" in lines
+    labels = 'source="oms",resource="runs",status="503"'
+    assert "wbmcrawlr_requests_total{%s} 1" % labels in lines
+    assert 'wbmcrawlr_request_seconds_sum{source="oms",resource="runs"} 0.75' in lines
+    assert 'wbmcrawlr_response_bytes_total{source="oms",resource="runs"} 1010' in lines
+    assert "wbmcrawlr_retries_total 1" in lines
+    assert 'wbmcrawlr_phase_calls_total{phase="decode"} 1' in lines
+
+    path = str(tmpdir.join("stats.json"))
+    collector.write(path)
+    with open(path) as file:
+        content = json.load(file)
+    assert content["resources"][0]["statuses"] == {"200": 1, "503": 1}
+    assert content["requests"][1]["status"] == 503
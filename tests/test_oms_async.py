@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import asyncio
+import time
+
+import pytest
+
+from stub_server import make_hltpath_tables, make_resource
+from wbmcrawlr import oms, oms_async, throttle
+from wbmcrawlr.throttle import Throttle
+
+
+def run(coroutine):
+    """
+    run() for Python 3.5 and 3.6
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture(params=["executor", "aiohttp"])
+def client(request, monkeypatch):
+    """
+    Run every test with the blocking client in the executor and, if it is
+    installed, with aiohttp
+    """
+    if request.param == "aiohttp":
+        pytest.importorskip("aiohttp")
+    else:
+        monkeypatch.setattr(oms_async, "aiohttp", None)
+    return request.param
+
+
+@pytest.fixture
+def stub(monkeypatch, runs_stub):
+    runs_stub.tables["fills"] = [
+        make_resource("fills", {"fill_number": n, "injection_scheme": "25ns_2556b"})
+        for n in range(7000, 7030)
+    ]
+    runs_stub.tables.update(make_hltpath_tables(path_count=5, lumisection_count=12))
+    runs_stub.latency = 0.05
+    # Do not inherit the tokens other tests used from the shared throttle
+    monkeypatch.setattr(throttle, "_throttle", Throttle())
+    return runs_stub
+
+
+def test_get_runs(client, stub):
+    runs = run(oms_async.get_runs(1000, 1249, inside_cern_gpn=True))
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250))
+    assert runs == oms.get_runs(1000, 1249, silent=True, inside_cern_gpn=True)
+
+
+def test_get_run_and_fill(client, stub):
+    async def get():
+        return await asyncio.gather(
+            oms_async.get_run(1100, inside_cern_gpn=True),
+            oms_async.get_fill(7010, inside_cern_gpn=True),
+        )
+
+    oms_run, fill = run(get())
+    assert oms_run["attributes"]["run_number"] == 1100
+    assert fill["attributes"]["fill_number"] == 7010
+
+
+def test_pages_are_requested_concurrently(client, stub):
+    async def get():
+        # Keep the event loop busy to check that it is not blocked
+        ticks = []
+
+        async def tick():
+            while True:
+                ticks.append(None)
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.ensure_future(tick())
+        started_at = time.time()
+        runs = await oms_async.get_resources(
+            "runs", oms._runs_parameters(1000, 1249), page_size=25, inside_cern_gpn=True
+        )
+        elapsed = time.time() - started_at
+        ticker.cancel()
+        return runs, len(ticks), elapsed
+
+    runs, ticks, elapsed = run(get())
+    assert len(runs) == 250
+    assert ticks > 3
+
+    # 10 pages with 50ms latency each, the last 9 at the same time
+    assert stub.request_count == 10
+    assert elapsed < 8 * 0.05
+
+
+def test_get_all_hltpathrates(client, stub):
+    rates = run(oms_async.get_all_hltpathrates(1000, inside_cern_gpn=True))
+    expected = oms.get_all_hltpathrates(1000, silent=True, inside_cern_gpn=True)
+    assert rates == expected
+    assert len(rates) == 5 * 12
+
+
+def test_cancelled_request_releases_throttle(stub, monkeypatch):
+    pytest.importorskip("aiohttp")
+    monkeypatch.setattr(throttle, "_throttle", Throttle(max_in_flight=1))
+
+    async def get():
+        first = asyncio.ensure_future(oms_async.get_run(1100, inside_cern_gpn=True))
+        await asyncio.sleep(0.01)
+        # Cancelled while waiting for the request of the first one to finish
+        waiting = asyncio.ensure_future(oms_async.get_run(1101, inside_cern_gpn=True))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await first
+        return await asyncio.wait_for(
+            oms_async.get_run(1102, inside_cern_gpn=True), timeout=2
+        )
+
+    assert run(get())["attributes"]["run_number"] == 1102
+
+
+def test_ssl_context_is_loaded_once(monkeypatch):
+    from cernrequests import certs
+
+    created = []
+
+    def create_ssl_context(cert_paths):
+        created.append(cert_paths)
+        return object()
+
+    monkeypatch.setattr(certs, "default_user_certificate_paths", lambda: ("a", "b"))
+    monkeypatch.setattr(oms_async, "_create_ssl_context", create_ssl_context)
+    monkeypatch.setattr(oms_async, "_ssl_contexts", {})
+
+    async def get():
+        return [await oms_async._ssl_context() for _ in range(3)]
+
+    contexts = run(get())
+    assert created == [("a", "b")]
+    assert contexts[0] is contexts[1] is contexts[2]
+
+
+def test_all_hltpathrates_share_refreshed_cookies(
+    client, stub, handshakes, monkeypatch
+):
+    async def ssl_context():
+        return False  # The stub server does not use TLS
+
+    monkeypatch.setattr(oms_async, "_ssl_context", ssl_context)
+    monkeypatch.setattr(oms, "OMS_ALTERNATIVE_API_URL", stub.url)
+    stub.required_cookie = "session=1"
+
+    def expire_cookies(table, parameters, response):
+        if table == "hltpathinfo":
+            stub.required_cookie = "session=2"
+
+    oms.add_request_hook(expire_cookies)
+    try:
+        rates = run(oms_async.get_all_hltpathrates(1000, inside_cern_gpn=False))
+    finally:
+        oms.remove_request_hook(expire_cookies)
+
+    assert len(rates) == 5 * 12
+    assert len(handshakes) == 2
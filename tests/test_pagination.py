@@ -0,0 +1,262 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import random
+import time
+
+import pytest
+
+from stub_server import OMSStubServer, make_hltpath_tables, make_runs
+from wbmcrawlr import oms, sharding
+
+
+def fake_page(table, parameters, page, page_size, **kwargs):
+    time.sleep(random.random() / 100)
+    return {"data": [page]}
+
+
+def test_iter_resources_pages_keeps_page_order(monkeypatch):
+    monkeypatch.setattr(oms, "_get_resources_page", fake_page)
+
+    pages = range(2, 30)
+    for workers in [1, 4, 50]:
+        result = list(
+            oms._iter_resources_pages("runs", {}, pages, 100, workers=workers)
+        )
+        assert [page for page, _ in result] == list(pages)
+        assert [response["data"] for _, response in result] == [[p] for p in pages]
+
+
+@pytest.fixture
+def counter():
+    counter = oms.RequestCounter()
+    oms.add_request_hook(counter)
+    yield counter
+    oms.remove_request_hook(counter)
+
+
+def test_get_resources_makes_one_request_per_page(runs_stub, counter):
+    runs = oms.get_runs(1000, 1249, silent=True, inside_cern_gpn=True)
+
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250))
+    assert counter.count == 3  # 250 runs with page size 100
+    assert runs_stub.request_count == 3
+
+
+def test_get_resources_concurrently(runs_stub, counter):
+    parameters = {"filter[run_number][GE]": 1000, "sort": "run_number"}
+    runs = oms.get_resources(
+        "runs", parameters, page_size=100, silent=True, inside_cern_gpn=True, workers=3
+    )
+
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250))
+    assert counter.count == 3
+
+
+@pytest.mark.parametrize("shard_size", [30, 100, 1000])
+def test_get_runs_sharded(runs_stub, counter, shard_size):
+    runs = oms.get_runs(
+        900, 1300, silent=True, inside_cern_gpn=True, workers=4, shard_size=shard_size
+    )
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250))
+
+
+def test_get_runs_sharded_with_runs_appended_during_crawl(monkeypatch, runs_stub):
+    def plan_shards(*args):
+        shards = sharding.plan_shards(*args)
+        # A new run starts after the shards were planned
+        runs_stub.tables["runs"].extend(make_runs(900000, 900000))
+        return shards
+
+    monkeypatch.setattr(oms, "plan_shards", plan_shards)
+    runs = oms.get_runs(
+        1000, 999999, silent=True, inside_cern_gpn=True, workers=4, shard_size=100
+    )
+
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250)) + [900000]
+
+
+def test_iter_resources_yields_page_by_page(runs_stub, counter):
+    runs = oms.iter_runs(1000, 1249, silent=True, inside_cern_gpn=True)
+    assert counter.count == 0
+
+    assert next(runs)["run_number"] == 1000
+    assert counter.count == 1
+
+    assert [run["run_number"] for run in runs] == list(range(1001, 1250))
+    assert counter.count == 3
+
+
+@pytest.mark.parametrize(
+    "workers, strategy, request_count",
+    [(1, oms.PER_PATH, 21), (5, oms.PER_PATH, 21), (1, oms.BULK, 2)],
+)
+@pytest.mark.parametrize("pagination", oms.PAGINATIONS)
+def test_get_all_hltpathrates(
+    monkeypatch, workers, strategy, request_count, pagination
+):
+    tables = make_hltpath_tables()
+    with OMSStubServer(tables) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        rates = oms.get_all_hltpathrates(
+            1000,
+            silent=True,
+            inside_cern_gpn=True,
+            workers=workers,
+            strategy=strategy,
+            pagination=pagination,
+        )
+        assert server.request_count == request_count
+
+    expected_order = [info["attributes"]["path_name"] for info in tables["hltpathinfo"]]
+    assert len(rates) == 20 * 30
+    assert [rate["path_name"] for rate in rates[::30]] == expected_order
+    assert [rate["last_lumisection_number"] for rate in rates[:30]] == list(
+        range(1, 31)
+    )
+
+
+def test_run_hltpathrates_page_boundary_within_lumisection(monkeypatch):
+    with OMSStubServer(make_hltpath_tables(path_count=5)) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        server.shuffle_ties = True
+        # 5 rates per lumisection, 7 per page
+        rates = list(
+            oms.iter_run_hltpathrates(
+                1000, page_size=7, silent=True, inside_cern_gpn=True
+            )
+        )
+
+    keys = [(rate["last_lumisection_number"], rate["path_name"]) for rate in rates]
+    assert keys == sorted(set(keys))
+    assert len(keys) == 5 * 30
+
+
+def test_get_all_hltpathrates_retries_failing_path(monkeypatch):
+    get_hltpathrates = oms.get_hltpathrates
+    failures = []
+
+    def flaky_get_hltpathrates(run_number, path_name, **kwargs):
+        if path_name == "HLT_Path007_v1" and not failures:
+            failures.append(path_name)
+            raise ValueError("No JSON object could be decoded")
+        return get_hltpathrates(run_number, path_name, **kwargs)
+
+    monkeypatch.setattr(oms, "get_hltpathrates", flaky_get_hltpathrates)
+
+    with OMSStubServer(make_hltpath_tables()) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        rates = oms.get_all_hltpathrates(
+            1000, silent=True, inside_cern_gpn=True, workers=4
+        )
+
+    assert failures == ["HLT_Path007_v1"]
+    assert len(rates) == 20 * 30
+
+
+def test_keyset_pagination(runs_stub, counter):
+    runs = oms.get_runs(
+        1000, 1249, silent=True, inside_cern_gpn=True, pagination=oms.KEYSET
+    )
+
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250))
+    assert counter.count == 3
+    assert all("page%5Boffset%5D=0&" in path for path in runs_stub.requests)
+
+
+def test_keyset_pagination_with_rows_inserted_during_crawl(runs_stub):
+    def insert_run(table, parameters, response):
+        # A run sorting before the already retrieved ones appears mid-crawl
+        rows = runs_stub.tables["runs"]
+        if rows[0]["attributes"]["run_number"] != 999:
+            run = make_runs(999, 999)[0]
+            rows.insert(0, run)
+
+    oms.add_request_hook(insert_run)
+    try:
+        runs = oms.get_runs(
+            0, 1249, silent=True, inside_cern_gpn=True, pagination=oms.KEYSET
+        )
+    finally:
+        oms.remove_request_hook(insert_run)
+
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250))
+
+
+@pytest.mark.parametrize("adaptive", [False, True])
+def test_keyset_pagination_with_rows_appended_during_crawl(runs_stub, adaptive):
+    def append_run(table, parameters, response):
+        # A new run starts while the range is retrieved
+        rows = runs_stub.tables["runs"]
+        if rows[-1]["attributes"]["run_number"] != 1300:
+            run = make_runs(1300, 1300)[0]
+            rows.append(run)
+
+    oms.add_request_hook(append_run)
+    try:
+        runs = oms.get_runs(
+            0,
+            2000,
+            silent=True,
+            inside_cern_gpn=True,
+            pagination=oms.KEYSET,
+            adaptive=adaptive,
+        )
+    finally:
+        oms.remove_request_hook(append_run)
+
+    assert [run["run_number"] for run in runs] == list(range(1000, 1250)) + [1300]
+
+
+def test_keyset_pagination_requires_unique_sort_key():
+    with pytest.raises(AssertionError, match="unique sort key"):
+        oms.get_lumisections(fill_number=7005, pagination=oms.KEYSET)
+
+    parameters = oms._lumisections_parameters(319579, None, None, None)
+    assert oms._has_unique_sort_key("lumisections", parameters)
+    assert oms._has_unique_sort_key(
+        "hltpathrates", oms._hltpathrates_parameters(319579, "HLT_Path_v1")
+    )
+    assert not oms._has_unique_sort_key("runs", {"sort": "start_time"})
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_get_runs_by_numbers(runs_stub, workers):
+    numbers = [1003, 1001, 1002, 1050, 1060, 1249, 999, 1300, 1002]
+    runs, missing = oms.get_runs_by_numbers(
+        numbers, workers=workers, silent=True, inside_cern_gpn=True
+    )
+
+    assert list(runs) == [1001, 1002, 1003, 1050, 1060, 1249]
+    assert all(runs[number]["run_number"] == number for number in runs)
+    assert missing == [999, 1300]
+    # 999-1003, 1050-1060, 1249 and 1300, each fitting on one page
+    assert runs_stub.request_count == 4
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_get_runs_with_units_once(monkeypatch, workers):
+    runs = make_runs(1000, 1249)
+    for run in runs:
+        run["meta"] = {"row": {"energy": {"units": "GeV"}}}
+
+    with OMSStubServer({"runs": runs}) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        kwargs = {"silent": True, "inside_cern_gpn": True, "workers": workers}
+        units = {}
+        compact = oms.get_runs(1000, 1249, units=units, shard_size=100, **kwargs)
+        full = oms.get_runs(1000, 1249, **kwargs)
+
+    assert units == {"energy": "GeV"}
+    assert all("energy_unit" not in run for run in compact)
+    assert all(run["energy_unit"] == "GeV" for run in full)
+    assert [run["run_number"] for run in compact] == list(range(1000, 1250))
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import pytest
+
+from stub_server import OMSStubServer, make_hltpath_tables, make_resource, make_runs
+from wbmcrawlr import oms, retry
+from wbmcrawlr.checkpoint import Checkpoint
+from wbmcrawlr.sinks import create_sink, read_records
+
+
+class Interrupted(Exception):
+    pass
+
+
+def interrupt_after(request_count):
+    requests = []
+
+    def hook(table, parameters, response):
+        requests.append(table)
+        if len(requests) == request_count:
+            raise Interrupted()
+
+    return hook
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(retry, "BACKOFF", 0)
+
+
+@pytest.fixture
+def runs_stub(runs_stub):
+    runs_stub.tables["runs"].extend(make_runs(1250, 1949))
+    return runs_stub
+
+
+def crawl(basename, method, arguments, keep=None, interrupt=None, **kwargs):
+    checkpoint = Checkpoint("{}.ndjson.checkpoint".format(basename))
+    sink = create_sink(basename, "ndjson", keep=keep)
+    checkpoint.written = sink.flush
+    if interrupt:
+        oms.add_request_hook(interrupt)
+    try:
+        with sink:
+            sink.write_all(method(*arguments, checkpoint=checkpoint, **kwargs))
+    finally:
+        if interrupt:
+            oms.remove_request_hook(interrupt)
+    return checkpoint, sink
+
+
+def resume(basename, method, arguments, **kwargs):
+    checkpoint = Checkpoint("{}.ndjson.checkpoint".format(basename))
+    return crawl(basename, method, arguments, checkpoint.written_count, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "kwargs, request_count",
+    [
+        ({}, 6),
+        ({"pagination": oms.KEYSET}, 6),
+        ({"workers": 3}, 6),
+        ({"workers": 3, "shard_size": 200}, 6),
+        ({"adaptive": True}, 3),
+    ],
+)
+def test_resume_interrupted_runs(tmpdir, runs_stub, kwargs, request_count):
+    basename = str(tmpdir.join("oms_runs"))
+    arguments = (1000, 1949)
+    kwargs.update(silent=True, inside_cern_gpn=True)
+
+    with pytest.raises(Interrupted):
+        interrupt = interrupt_after(request_count)
+        crawl(basename, oms.iter_runs, arguments, interrupt=interrupt, **kwargs)
+
+    checkpoint, sink = resume(basename, oms.iter_runs, arguments, **kwargs)
+
+    runs = read_records(sink.path)
+    assert [run["run_number"] for run in runs] == list(range(1000, 1950))
+
+
+def test_resume_interrupted_all_hltpathrates(tmpdir, monkeypatch):
+    basename = str(tmpdir.join("oms_hltrates"))
+    kwargs = {"silent": True, "inside_cern_gpn": True, "workers": 2}
+
+    with OMSStubServer(make_hltpath_tables()) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        with pytest.raises(Interrupted):
+            crawl(
+                basename,
+                oms.iter_all_hltpathrates,
+                (1000,),
+                interrupt=interrupt_after(8),
+                **kwargs
+            )
+        resume(basename, oms.iter_all_hltpathrates, (1000,), **kwargs)
+        expected = oms.get_all_hltpathrates(1000, **kwargs)
+
+    assert read_records(basename + ".ndjson") == expected
+
+
+@pytest.mark.parametrize("strategy", oms.HLTPATHRATES_STRATEGIES)
+def test_resume_all_hltpathrates_with_empty_path(tmpdir, monkeypatch, strategy):
+    basename = str(tmpdir.join("oms_hltrates"))
+    kwargs = {"silent": True, "inside_cern_gpn": True, "strategy": strategy}
+    tables = make_hltpath_tables(path_count=3)
+    tables["hltpathinfo"].append(
+        make_resource("hltpathinfo", {"run_number": 1000, "path_name": "HLT_Empty"})
+    )
+
+    with OMSStubServer(tables) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        crawl(basename, oms.iter_all_hltpathrates, (1000,), **kwargs)
+        del server.requests[:]
+        resume(basename, oms.iter_all_hltpathrates, (1000,), **kwargs)
+
+    assert not [path for path in server.requests if "hltpathrates" in path]
+    assert len(read_records(basename + ".ndjson")) == 3 * 30
+
+
+def test_server_errors_are_retried(runs_stub, no_backoff):
+    runs_stub.fail_next(500, count=2)
+    runs = oms.get_runs(1000, 1949, silent=True, inside_cern_gpn=True)
+    assert len(runs) == 950
+    assert runs_stub.request_count == 10 + 2
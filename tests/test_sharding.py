@@ -0,0 +1,44 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from wbmcrawlr.sharding import plan_shards
+
+
+def test_plan_shards():
+    def count(begin, end):
+        return end - begin + 1
+
+    assert plan_shards(count, 1, 10, shard_size=3) == [
+        (1, 3, 3),
+        (4, 5, 2),
+        (6, 8, 3),
+        (9, 10, 2),
+    ]
+    assert plan_shards(count, 1, 10, shard_size=10) == [(1, 10, 10)]
+
+
+def test_plan_shards_skips_empty_ranges():
+    numbers = [5, 6, 7, 8, 100]
+
+    def count(begin, end):
+        return len([n for n in numbers if begin <= n <= end])
+
+    shards = plan_shards(count, 1, 200, shard_size=2)
+    assert [shard[2] for shard in shards] == [2, 2, 1]
+    assert all(begin <= end for begin, end, _ in shards)
+    # Resources added before the first or after the last one are still covered
+    assert shards[0][0] == 1
+    assert shards[-1][1] == 200
+
+
+def test_plan_shards_single_number_exceeding_shard_size():
+    assert plan_shards(lambda begin, end: 50, 7, 7, shard_size=10) == [(7, 7, 50)]
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import io
+import json
+
+import pytest
+
+from wbmcrawlr.sinks import create_sink, read_records
+
+RECORDS = [
+    {"run_number": 1, "components": ["DAQ", "DQM"], "end_time": None},
+    {"run_number": 2, "components": [], "end_time": "2018-11-19T22:08:01Z"},
+]
+
+
+@pytest.mark.parametrize("records", [RECORDS, RECORDS[:1], []])
+def test_json_sink_matches_json_dumps(tmpdir, records):
+    with create_sink(str(tmpdir.join("oms_runs")), "json") as sink:
+        sink.write_all(records)
+
+    with io.open(sink.path, encoding="utf-8") as file:
+        assert file.read() == json.dumps(records, indent=2)
+    assert sink.count == len(records)
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson"])
+def test_read_records(tmpdir, output_format):
+    with create_sink(str(tmpdir.join("oms_runs")), output_format) as sink:
+        sink.write_all(RECORDS)
+
+    assert sink.path.endswith(output_format)
+    assert read_records(sink.path) == RECORDS
+
+
+def test_resume_interrupted_json_sink(tmpdir):
+    sink = create_sink(str(tmpdir.join("oms_runs")), "json")
+    sink.write_all(RECORDS)
+    sink.flush()
+    sink._file.close()  # Killed before closing the array
+
+    with io.open(sink.path, encoding="utf-8") as file:
+        content = file.read()
+    assert not content.endswith("]")
+    assert read_records(sink.path) == RECORDS
+
+    with io.open(sink.path, "w", encoding="utf-8") as file:
+        file.write(content[:-10])  # Incomplete last record
+    assert read_records(sink.path) == RECORDS[:1]
+
+    with create_sink(str(tmpdir.join("oms_runs")), "json", keep=1) as sink:
+        sink.write(RECORDS[1])
+    assert read_records(sink.path) == RECORDS
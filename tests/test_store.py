@@ -0,0 +1,174 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import sqlite3
+
+import pytest
+
+from stub_server import OMSStubServer, make_lumisections, make_resource
+from wbmcrawlr import oms, store as store_module
+from wbmcrawlr.sinks import create_sink, read_records
+from wbmcrawlr.store import Store
+
+
+def lumisection_records(run_number, fill_number, count):
+    lumisections = make_lumisections(
+        run_number,
+        1,
+        count,
+        fill_number=fill_number,
+        end_time=None,
+        components=["PIXEL", "TRACKER"],
+    )
+    return [lumisection["attributes"] for lumisection in lumisections]
+
+
+@pytest.fixture
+def store(tmpdir):
+    with Store(str(tmpdir.join("oms.sqlite"))) as store:
+        yield store
+
+
+def test_upsert_replaces_records(store):
+    lumisections = lumisection_records(1001, 7000, 10)
+    assert store.upsert("lumisections", lumisections) == 10
+    assert store.get_lumisections(1001) == lumisections
+
+    lumisections[3]["end_time"] = "2018-07-01T00:01:00Z"
+    store.upsert("lumisections", lumisections[3:5])
+    assert store.count("lumisections") == 10
+    assert store.get_lumisections(1001)[3]["end_time"] == "2018-07-01T00:01:00Z"
+
+
+def test_select(store):
+    store.upsert("lumisections", lumisection_records(1002, 7001, 5))
+    store.upsert("lumisections", lumisection_records(1001, 7000, 5))
+    store.upsert("lumisections", lumisection_records(1003, 7001, 5))
+
+    by_fill = store.get_lumisections(fill_number=7001)
+    assert [(ls["run_number"], ls["lumisection_number"]) for ls in by_fill] == [
+        (1002, n) for n in range(1, 6)
+    ] + [(1003, n) for n in range(1, 6)]
+
+    assert store.count("lumisections", start_time=("2018-07-02", None)) == 10
+    assert store.count("lumisections", lumisection_number=(2, 3)) == 6
+
+    with pytest.raises(ValueError):
+        store.select("lumisections", components="PIXEL")
+    with pytest.raises(ValueError):
+        store.select("hltpathinfo")
+
+
+def test_indexes(store):
+    connection = sqlite3.connect(store.path)
+    rows = connection.execute("SELECT name FROM sqlite_master WHERE type='index'")
+    indexes = {row[0] for row in rows}
+    connection.close()
+    assert {
+        "runs_fill_number",
+        "runs_start_time",
+        "fills_start_time",
+        "lumisections_fill_number",
+        "lumisections_start_time",
+        "hltpathrates_path_name",
+    } <= indexes
+
+
+def test_sqlite_sink(tmpdir):
+    basename = str(tmpdir.join("oms_runs"))
+    runs = [{"run_number": n, "fill_number": n // 10} for n in range(1000, 1025)]
+
+    with create_sink(basename, "sqlite", table="runs") as sink:
+        sink.write_all(runs[:15])
+        assert sink.flush() == 15
+    assert sink.path == str(tmpdir.join("oms.sqlite"))
+
+    # Another crawl overlapping the first one
+    with create_sink(basename, "sqlite", table="runs") as sink:
+        sink.write_all(runs[10:])
+
+    assert read_records(sink.path, "runs") == runs
+    with Store(sink.path) as store:
+        assert store.get_runs(1020, None) == runs[20:]
+        assert store.get_runs(fill_number=101) == runs[10:20]
+
+
+def test_coverage(store):
+    assert store.uncovered_ranges("runs", 10, 20) == [(10, 20)]
+    store.add_coverage("runs", 12, 13)
+    store.add_coverage("runs", 17, 18)
+    assert store.uncovered_ranges("runs", 10, 20) == [(10, 11), (14, 16), (19, 20)]
+
+    store.add_coverage("runs", 14, 16)
+    assert store.uncovered_ranges("runs", 10, 20) == [(10, 11), (19, 20)]
+    assert store.uncovered_ranges("runs", 12, 18) == []
+    assert store.uncovered_ranges("fills", 12, 18) == [(12, 18)]
+
+
+@pytest.fixture
+def read_through(store, monkeypatch):
+    """
+    Runs 1000 - 1249 of which the last one is still ongoing, and lumisections
+    of run 1000 and the ongoing run
+    """
+
+    def run(number):
+        end_time = None if number == 1249 else "2018-07-01T00:00:00Z"
+        attributes = {"run_number": number, "sequence": "GLOBAL-RUN"}
+        attributes.update({"fill_number": 7000, "end_time": end_time})
+        return make_resource("runs", attributes)
+
+    lumisections = make_lumisections(1000, 1, 30, fill_number=7000)
+    lumisections += make_lumisections(1249, 1, 30, fill_number=7000)
+
+    tables = {"runs": [run(n) for n in range(1000, 1250)]}
+    tables["lumisections"] = lumisections
+    with OMSStubServer(tables) as server:
+        monkeypatch.setattr(oms, "OMS_API_URL", server.url)
+        monkeypatch.setattr(store_module, "_store", store)
+        yield server
+
+
+def test_get_runs_reads_through_store(read_through):
+    kwargs = {"silent": True, "inside_cern_gpn": True}
+    expected = list(oms.iter_runs(1000, 1249, **kwargs))
+    read_through.requests[:] = []
+
+    runs = oms.get_runs(1000, 1099, **kwargs)
+    assert runs == expected[:100]
+    assert read_through.request_count == 1
+
+    assert oms.get_runs(1000, 1099, **kwargs) == runs
+    assert read_through.request_count == 1
+
+    # Only 1100 - 1249 is missing, the ongoing run 1249 is requested every time
+    assert oms.get_runs(1050, 1249, **kwargs) == expected[50:]
+    assert read_through.request_count == 1 + 2
+    assert oms.get_runs(1050, 1249, **kwargs) == expected[50:]
+    assert read_through.request_count == 1 + 2 + 1
+
+
+def test_get_lumisections_reads_through_store(read_through):
+    kwargs = {"silent": True, "inside_cern_gpn": True}
+
+    lumisections = oms.get_lumisections(1000, **kwargs)
+    assert [ls["lumisection_number"] for ls in lumisections] == list(range(1, 31))
+    # The lumisections and whether the run has ended
+    assert read_through.request_count == 2
+
+    assert oms.get_lumisections(1000, **kwargs) == lumisections
+    assert read_through.request_count == 2
+
+    # Lumisections of the ongoing run are requested again
+    oms.get_lumisections(1249, **kwargs)
+    oms.get_lumisections(1249, **kwargs)
+    assert read_through.request_count == 2 + 2 * 2
@@ -0,0 +1,67 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+from wbmcrawlr.sync import missing_ranges, merge_resources, sync_resources
+
+
+def run(number, end_time="2018-11-19T22:08:01Z"):
+    return {"run_number": number, "end_time": end_time}
+
+
+def test_missing_ranges():
+    stored = [run(10), run(11), run(12)]
+    assert missing_ranges([], "run_number", 1, 20) == [(1, 20)]
+    assert missing_ranges(stored, "run_number", 10, 20) == [(13, 20)]
+    assert missing_ranges(stored, "run_number", 5, 20) == [(13, 20)]
+    assert missing_ranges(stored, "run_number", 10, 12) == []
+
+
+def test_missing_ranges_open_entries():
+    stored = [run(10), run(11, end_time=None), run(12)]
+    assert missing_ranges(stored, "run_number", 10, 20) == [(11, 11), (13, 20)]
+    assert missing_ranges(stored, "run_number", 10, 12) == [(11, 11)]
+
+
+def test_missing_ranges_spread_open_entries():
+    stored = [run(number) for number in range(100, 200)]
+    for number in (120, 121, 150, 199):
+        stored[number - 100] = run(number, end_time=None)
+    assert missing_ranges(stored, "run_number", 100, 250) == [
+        (120, 121),
+        (150, 150),
+        (199, 250),
+    ]
+
+
+def test_merge_resources():
+    stored = [run(11, end_time=None), run(10)]
+    merged = merge_resources(stored, [run(11), run(12)], "run_number")
+    assert merged == [run(10), run(11), run(12)]
+
+
+def test_sync_resources():
+    calls = []
+
+    def get_runs(begin, end, **kwargs):
+        calls.append((begin, end))
+        return [run(number) for number in range(begin, end + 1)]
+
+    stored = [run(10), run(11, end_time=None)]
+    runs = sync_resources(stored, get_runs, "run_number", 10, 13)
+    assert calls == [(11, 13)]  # The open run 11 is adjacent to the newer ones
+    assert runs == [run(10), run(11), run(12), run(13)]
+
+    calls[:] = []
+    stored = [run(10, end_time=None), run(11), run(12)]
+    runs = sync_resources(stored, get_runs, "run_number", 10, 13)
+    assert calls == [(10, 10), (13, 13)]
+    assert runs == [run(10), run(11), run(12), run(13)]
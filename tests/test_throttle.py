@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import sys
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+from wbmcrawlr import main, oms, retry, throttle
+from wbmcrawlr.throttle import Throttle, retry_after
+
+
+class Response(object):
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+def test_retry_after():
+    assert retry_after(Response(headers={"Retry-After": "3"})) == 3
+    assert retry_after(Response(), default=7) == 7
+    assert retry_after(Response(headers={"Retry-After": "100000"})) == 300
+
+    date = formatdate(time.time() + 60, usegmt=True)
+    seconds = retry_after(Response(headers={"Retry-After": date}))
+    assert 55 < seconds <= 60
+
+
+def test_rate_limit():
+    limiter = Throttle(rate=50, burst=1)
+    start = time.time()
+    for _ in range(11):
+        with limiter:
+            pass
+    assert time.time() - start >= 0.19
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"rate": 0}, {"rate": -1}, {"max_in_flight": 0}]
+)
+def test_non_positive_limits(kwargs):
+    with pytest.raises(ValueError):
+        Throttle(**kwargs)
+
+
+@pytest.mark.parametrize("option", ["--rate-limit", "--max-in-flight"])
+def test_non_positive_limit_arguments(monkeypatch, option):
+    monkeypatch.setattr(sys, "argv", ["wbmcrawl", "--runs", "1", "2", option, "0"])
+    with pytest.raises(SystemExit):
+        main.parse_arguments()
+
+
+def test_max_in_flight():
+    limiter = Throttle(rate=None, max_in_flight=2)
+    lock = threading.Lock()
+    in_flight = [0]
+    peak = [0]
+
+    def request():
+        with limiter:
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            time.sleep(0.02)
+            with lock:
+                in_flight[0] -= 1
+
+    threads = [threading.Thread(target=request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+
+
+def test_throttling_response_slows_down():
+    limiter = Throttle(rate=8)
+    limiter.observe(Response(429, {"Retry-After": "0.2"}))
+    assert limiter.rate == 4
+
+    start = time.time()
+    with limiter:
+        pass
+    assert time.time() - start >= 0.15
+
+    for _ in range(100):
+        limiter.observe(Response())
+    assert limiter.rate == 8
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_get_runs_backs_off_when_throttled(monkeypatch, runs_stub, status):
+    monkeypatch.setattr(retry, "BACKOFF", 0)
+    limiter = Throttle(rate=100)
+    monkeypatch.setattr(throttle, "_throttle", limiter)
+    runs_stub.fail_next(status, headers={"Retry-After": "0.3"})
+
+    start = time.time()
+    result = oms.get_runs(1000, 1249, silent=True, inside_cern_gpn=True)
+
+    assert len(result) == 250
+    assert time.time() - start >= 0.25
+    assert runs_stub.request_count == 3 + 1
+    assert limiter.rate < 100
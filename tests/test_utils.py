@@ -10,7 +10,11 @@
 # granted to it by virtue of its status as an Intergovernmental Organization
 # or submit itself to any jurisdiction.
 
-from wbmcrawlr.utils import flatten_resource, progress_bar, calc_page_count, split_filling_scheme
+import pytest
+
+from wbmcrawlr import utils
+from wbmcrawlr.utils import flatten_resource, progress_bar, calc_page_count, split_filling_scheme, \
+    collapse_numbers, iter_split_filling_scheme, split_filling_schemes, loads
 
 
 def test_flatten():
@@ -136,6 +140,36 @@ def test_flatten():
     }
 
 
+def test_flatten_units_once():
+    units = {}
+    runs = [
+        {
+            "type": "runs",
+            "attributes": {"run_number": number, "energy": 6369.0},
+            "meta": {"row": {"energy": {"units": "GeV"}}},
+        }
+        for number in [1, 2]
+    ]
+
+    assert [flatten_resource(run, units) for run in runs] == [
+        {"run_number": 1, "energy": 6369.0},
+        {"run_number": 2, "energy": 6369.0},
+    ]
+    assert units == {"energy": "GeV"}
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_loads(monkeypatch, fast):
+    if fast:
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(utils, "orjson", None)
+    content = '{"data": [{"name": "\u00b5b", "value": 1.5, "open": null}]}'
+    assert loads(content.encode("utf-8")) == {
+        "data": [{"name": "\u00b5b", "value": 1.5, "open": None}]
+    }
+
+
 def test_progress_bar():
     assert (
         "[--------------------------------------------------] 0.00% "
@@ -251,3 +285,52 @@ def test_split_filling_scheme_2():
         assert data['injection_scheme'] == '25ns_985b_973_872_908_96bpi_15inj'
 
 
+
+
+def test_collapse_numbers():
+    assert collapse_numbers([]) == []
+    assert collapse_numbers([7, 3, 4, 4, 5]) == [(3, 5), (7, 7)]
+    assert collapse_numbers([7, 3, 4, 4, 5], max_gap=1) == [(3, 7)]
+    assert collapse_numbers([1, 10, 30], max_gap=9) == [(1, 10), (30, 30)]
+
+
+FILLING_SCHEMES = [
+    "25ns_2556b_2544_2215_2332_144bpi_20injV3",
+    "Single_12b_9_1_9_1bpi_12inj_V2",
+    "50ns_1374b_1368_0_1262_144bpi_12inj_V1",
+    "100_150ns_648Pb_620_619_52_36bpi_20inj_V2",
+    "multiple_injections",
+    None,
+    "",
+]
+
+
+def test_iter_split_filling_scheme_matches_split_filling_scheme():
+    schemes = FILLING_SCHEMES * 3
+    fills = [{"fill_number": i, "injection_scheme": s} for i, s in enumerate(schemes)]
+    expected = [split_filling_scheme(dict(fill)) for fill in fills]
+    assert list(iter_split_filling_scheme(dict(fill) for fill in fills)) == expected
+
+
+def test_split_filling_schemes():
+    table = split_filling_schemes(FILLING_SCHEMES * 3)
+    assert len(table) == len(FILLING_SCHEMES) * 3
+    for index, filling_scheme in enumerate(FILLING_SCHEMES * 3):
+        expected = split_filling_scheme({"injection_scheme": filling_scheme})
+        del expected["injection_scheme"]
+        assert table.row(index) == expected
+
+
+def test_split_filling_schemes_typed():
+    table = split_filling_schemes(FILLING_SCHEMES[1:3], typed=True)
+    assert table.schema["injection_scheme_bunches"] == "q"
+    assert list(table["injection_scheme_bunches"]) == [12, 1374]
+    assert list(table["injection_scheme_injections"]) == [12, 12]
+    assert list(table["injection_scheme_special_info"]) == ["V2", "V1"]
+
+    table = split_filling_schemes(FILLING_SCHEMES, typed=True)
+    assert table.schema["injection_scheme_ip2"] == "q"
+    ip2 = [row["injection_scheme_ip2"] for row in table.rows()]
+    assert ip2 == [2544, 1, 0] + [None] * 4
+
+    assert len(split_filling_schemes([])) == 0
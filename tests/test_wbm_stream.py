@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+import io
+
+import pytest
+
+from stub_server import NoCookiesCredentialsManager, WBMStubServer, make_run_summaries
+from wbmcrawlr import retry, wbm
+from wbmcrawlr.sinks import create_sink, read_records
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(wbm, "get_credentials_manager", NoCookiesCredentialsManager)
+    monkeypatch.setattr(wbm, "default_user_certificate_paths", lambda: None)
+    with WBMStubServer({"RunSummary": make_run_summaries(1000, 1999)}) as server:
+        monkeypatch.setattr(wbm, "WBM_URL", server.url)
+        yield server
+
+
+def test_iter_xml_items_handles_nested_elements():
+    content = (
+        b"<cmsdb><runInfo><run>1</run><stopTime/><tag a='x'>y</tag></runInfo>"
+        b"<runInfo><run>2</run><key>a</key><key>b</key></runInfo></cmsdb>"
+    )
+    records = list(wbm.iter_xml_items(io.BytesIO(content), "runInfo"))
+
+    tag = {"@a": "x", "#text": "y"}
+    assert records[0] == {"run": "1", "stopTime": None, "tag": tag}
+    assert records[1] == {"run": "2", "key": ["a", "b"]}
+
+
+def test_streamed_runs_match_parsed_document(server):
+    runs = list(wbm.iter_run_summary_by_range(1000, 1099, chunk_size=None))
+    document = wbm.get_run_summary_by_range(1000, 1099, chunk_size=None)
+
+    assert runs == document["cmsdb"]["runInfo"]
+    assert [run["run"] for run in runs] == [str(n) for n in range(1099, 999, -1)]
+
+
+def test_streamed_runs_are_yielded_lazily(server):
+    runs = wbm.iter_run_summary_by_range(1000, 1999)
+    assert server.request_count == 0
+    assert next(runs)["run"] == "1999"
+    runs.close()
+
+
+def test_single_chunk_is_not_held_in_memory(server, monkeypatch):
+    monkeypatch.setattr(wbm, "_iter_chunks", None)
+    runs = wbm.iter_run_summary_by_range(1000, 1999, chunk_size=None)
+    assert next(runs)["run"] == "1999"
+    assert len(list(runs)) == 999
+    assert server.request_count == 1
+
+
+def test_empty_range(server):
+    assert list(wbm.iter_run_summary_by_range(5000, 5010)) == []
+
+
+@pytest.mark.parametrize("output_format", ["json", "ndjson", "sqlite"])
+def test_streamed_runs_into_sink(server, tmpdir, output_format):
+    basename = str(tmpdir.join("wbm_runs"))
+    with create_sink(basename, output_format, table="wbm_runs") as sink:
+        sink.write_all(wbm.iter_run_summary_by_range(1000, 1199))
+
+    records = read_records(sink.path, "wbm_runs")
+    assert sink.count == len(records) == 200
+    assert {record["run"] for record in records} == {str(n) for n in range(1000, 1200)}
+
+
+def test_chunked_range_matches_single_request(server):
+    document = wbm.get_run_summary_by_range(1000, 1099, chunk_size=None)
+    assert server.request_count == 1
+
+    chunked = wbm.get_run_summary_by_range(1000, 1099, chunk_size=30, workers=3)
+    assert chunked == document
+    assert server.request_count == 1 + 4
+    ranges = [path.split("?")[1].split("&FORMAT")[0] for path in server.requests[1:]]
+    assert sorted(ranges) == [
+        "RUN_BEGIN=1000&RUN_END=1009",
+        "RUN_BEGIN=1010&RUN_END=1039",
+        "RUN_BEGIN=1040&RUN_END=1069",
+        "RUN_BEGIN=1070&RUN_END=1099",
+    ]
+
+
+def test_chunked_range_with_few_runs(server):
+    document = wbm.get_run_summary_by_range(1999, 2100, chunk_size=50)
+    assert document["cmsdb"]["runInfo"]["run"] == "1999"
+
+    assert wbm.get_run_summary_by_range(3000, 3100, chunk_size=50)["cmsdb"] is None
+
+
+def test_failing_chunk_is_retried_alone(server, monkeypatch):
+    monkeypatch.setattr(retry, "BACKOFF", 0)
+    server.fail_next(500)
+
+    runs = list(wbm.iter_run_summary_by_range(1000, 1199, chunk_size=50, workers=1))
+
+    assert [run["run"] for run in runs] == [str(n) for n in range(1199, 999, -1)]
+    assert server.request_count == 4 + 1
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Adjust the OMS page size to the observed latency and size of the responses.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+MIN_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50000
+MAX_PAGE_BYTES = 32 * 1024 * 1024
+TARGET_PAGE_SECONDS = 2.0
+PAGE_TIMEOUT = 60
+PROBE_INTERVAL = 20
+
+
+class AdaptivePageSize(object):
+    """
+    Doubles the page size while pages arrive quickly and halves it when they
+    are slow, too big or fail, always staying within minimum and maximum.
+
+    A failed page size is remembered as upper bound, the page size then only
+    grows below it. Every PROBE_INTERVAL pages held back by the upper bound,
+    the size halfway between the page size and the upper bound is tried.
+
+    >>> page_size = AdaptivePageSize(100)
+    >>> page_size.record(rows=100, seconds=0.1, size=20000)
+    >>> page_size.value
+    200
+    """
+
+    def __init__(
+        self,
+        initial,
+        minimum=MIN_PAGE_SIZE,
+        maximum=MAX_PAGE_SIZE,
+        target_seconds=TARGET_PAGE_SECONDS,
+        max_bytes=MAX_PAGE_BYTES,
+        probe_interval=PROBE_INTERVAL,
+    ):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+        self.probe_interval = probe_interval
+        self.value = self._clamp(initial)
+        self.upper_bound = None
+        self._succeeded = None
+        self._held_back = 0
+
+    def _clamp(self, value):
+        return int(max(self.minimum, min(self.maximum, value)))
+
+    def record(self, rows, seconds, size):
+        """
+        :param rows: Number of rows the page contained
+        :param seconds: Time it took to retrieve the page
+        :param size: Size of the response in bytes
+        """
+        if rows < self.value:  # Last page, nothing learned about bigger pages
+            return
+        self._succeeded = self.value
+
+        if seconds > self.target_seconds:
+            new_value = self.value // 2
+        elif seconds < self.target_seconds / 2:
+            new_value = self._grow()
+        else:
+            new_value = self.value
+
+        if rows and size:
+            new_value = min(new_value, self.max_bytes * rows // size)
+
+        self.value = self._clamp(new_value)
+
+    def _grow(self):
+        """
+        :return: Doubled page size, kept below the upper bound except for
+            an occasional probe
+        """
+        if self.upper_bound is None or self.value * 2 < self.upper_bound:
+            return self.value * 2
+
+        self._held_back += 1
+        if self._held_back < self.probe_interval:
+            return self.value
+        self._held_back = 0
+        return (self.value + self.upper_bound) // 2
+
+    def failed(self):
+        """
+        Remember the page size as upper bound after a failed request and
+        fall back to the last successful page size below it, or half of it.
+
+        :return: False if the page size is already at its minimum
+        """
+        if self.value <= self.minimum:
+            return False
+        self.upper_bound = self.value
+        self._held_back = 0
+        if self._succeeded is not None and self._succeeded < self.value:
+            self.value = self._clamp(self._succeeded)
+        else:
+            self.value = self._clamp(self.value // 2)
+        return True
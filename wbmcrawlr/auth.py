@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Caches the CERN GPN connectivity probe and CERN SSO cookies.
+
+Probing the GPN costs up to TIMEOUT_TIME and an SSO handshake several round
+trips, so both are done once and reused until their time to live expires.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+from urllib.parse import urlparse
+
+from cernrequests import get_sso_cookies
+from future import standard_library
+
+from wbmcrawlr.metrics import phase
+from wbmcrawlr.utils import check_oms_connectivity
+
+standard_library.install_aliases()
+
+CONNECTIVITY_TTL = 10 * 60
+COOKIE_TTL = 60 * 60
+
+AUTHENTICATION_STATUS_CODES = (401, 302)
+
+
+def needs_authentication(response):
+    """
+    :return: True if the response (or one of its redirects) asks for SSO login
+    """
+    if response.status_code in AUTHENTICATION_STATUS_CODES:
+        return True
+    return any(
+        r.status_code in AUTHENTICATION_STATUS_CODES for r in response.history
+    )
+
+
+class CredentialsManager(object):
+    """
+    Remembers whether OMS is reachable from within the CERN GPN and the SSO
+    cookies per host, each for a limited time.
+    """
+
+    def __init__(self, connectivity_ttl=CONNECTIVITY_TTL, cookie_ttl=COOKIE_TTL):
+        self.connectivity_ttl = connectivity_ttl
+        self.cookie_ttl = cookie_ttl
+        self._inside_cern_gpn = None
+        self._probed_at = 0
+        self._cookies = {}
+        self._lock = threading.RLock()
+
+    def inside_cern_gpn(self, refresh=False):
+        """
+        :return: True if OMS can be accessed without authentication
+        """
+        with self._lock:
+            expired = time.time() - self._probed_at > self.connectivity_ttl
+            if refresh or self._inside_cern_gpn is None or expired:
+                with phase("connectivity"):
+                    self._inside_cern_gpn = check_oms_connectivity()
+                self._probed_at = time.time()
+            return self._inside_cern_gpn
+
+    def get_cookies(self, url, cert=None, refresh=False, stale=None):
+        """
+        :param url: URL of the CERN website you want to access
+        :param cert: (certificate, key) tuple, defaults to the cernrequests ones
+        :param stale: Cookies that were rejected. With refresh, new cookies are
+            only fetched if no other thread replaced them in the meantime.
+        :return: CERN SSO cookies valid for the host of the url
+        """
+        host = urlparse(url).netloc
+        with self._lock:
+            cookies, fetched_at = self._cookies.get(host, (None, 0))
+            expired = time.time() - fetched_at > self.cookie_ttl
+            refresh = refresh and (stale is None or cookies is stale)
+            if refresh or cookies is None or expired:
+                print("Getting SSO Cookies for {}...".format(host))
+                with phase("sso"):
+                    cookies = get_sso_cookies(url, cert, verify=False)
+                self._cookies[host] = (cookies, time.time())
+            return cookies
+
+    def invalidate_cookies(self, url=None):
+        with self._lock:
+            if url is None:
+                self._cookies.clear()
+            else:
+                self._cookies.pop(urlparse(url).netloc, None)
+
+    def reset(self):
+        with self._lock:
+            self._inside_cern_gpn = None
+            self._probed_at = 0
+            self._cookies.clear()
+
+
+_manager = CredentialsManager()
+
+
+def get_credentials_manager():
+    return _manager
@@ -0,0 +1,192 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+On-disk cache for raw OMS and WBM responses.
+
+Entries are addressed by the SHA-256 of the request URL and expire after a
+per-table time to live. When the cache grows beyond its size cap the least
+recently used entries are removed.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import shutil
+import threading
+import time
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+FOREVER = None
+OPEN_TTL = 60
+DEFAULT_TTL = 24 * 60 * 60
+MAX_SIZE = 512 * 1024 * 1024
+
+# Closed runs, fills and lumisections never change. Responses that contain
+# rows which are still open are cached for OPEN_TTL instead, see oms.py
+TABLE_TTLS = {
+    "runs": FOREVER,
+    "fills": FOREVER,
+    "lumisections": FOREVER,
+    "hltpathinfo": FOREVER,
+    "hltpathrates": FOREVER,
+    "RunSummary": DEFAULT_TTL,
+}
+
+
+def default_cache_directory():
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".cache"
+    )
+    return os.path.join(base, "wbmcrawlr")
+
+
+def cache_key(url):
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(object):
+    """
+    >>> cache = ResponseCache("/tmp/wbmcrawlr", max_size=10 * 1024 * 1024)
+    >>> cache.set("https://cmsoms.cern.ch/agg/api/v1/runs?...", b"{...}", ttl=60)
+    >>> cache.get("https://cmsoms.cern.ch/agg/api/v1/runs?...")
+    b'{...}'
+    """
+
+    def __init__(self, directory=None, max_size=MAX_SIZE, ttls=None):
+        self.directory = directory or default_cache_directory()
+        self.max_size = max_size
+        self.ttls = dict(TABLE_TTLS)
+        self.ttls.update(ttls or {})
+        self._size = None
+        self._lock = threading.Lock()
+
+    def ttl(self, table):
+        return self.ttls.get(table, DEFAULT_TTL)
+
+    def _path(self, url):
+        key = cache_key(url)
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, url):
+        """
+        :return: Cached content of the url or None if missing or expired
+        """
+        path = self._path(url)
+        try:
+            with open(path, "rb") as file:
+                expires_at = float(file.readline())
+                content = file.read()
+        except (IOError, OSError, ValueError):
+            return None
+
+        if expires_at >= 0 and expires_at < time.time():
+            self._remove(path)
+            return None
+
+        os.utime(path, None)  # Mark as recently used
+        return content
+
+    def set(self, url, content, ttl=FOREVER):
+        """
+        :param ttl: Seconds until the entry expires, FOREVER if it never does
+        """
+        path = self._path(url)
+        expires_at = -1 if ttl is FOREVER else time.time() + ttl
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        temporary_path = "{}.{}.tmp".format(path, threading.current_thread().ident)
+        with open(temporary_path, "wb") as file:
+            file.write("{}\n".format(expires_at).encode("ascii"))
+            file.write(content)
+        os.rename(temporary_path, path)
+
+        with self._lock:
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+        self._evict()
+
+    def _entries(self):
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _evict(self):
+        """
+        Remove least recently used entries until the cache fits max_size
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            if self._size <= self.max_size:
+                return
+            entries = sorted(self._entries())
+            for _, size, path in entries:
+                if self._size <= self.max_size * 0.9:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._size -= size
+
+    @property
+    def size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def clear(self):
+        with self._lock:
+            if os.path.isdir(self.directory):
+                shutil.rmtree(self.directory)
+            self._size = 0
+
+
+_cache = None
+
+
+def get_cache():
+    """
+    :return: The cache used by oms and wbm, None if caching is disabled
+    """
+    return _cache
+
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
@@ -0,0 +1,83 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Remember how far a crawl got, so an interrupted crawl can be resumed.
+
+The checkpoint maps a step of the crawl (a query, a shard or a path) to its
+progress, together with the number of records that were written to the
+output when that progress was saved.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+import threading
+from urllib.parse import urlencode
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+
+def query_key(table, parameters):
+    return "{}?{}".format(table, urlencode(sorted(parameters.items())))
+
+
+class Checkpoint(object):
+    """
+    >>> checkpoint = Checkpoint("oms_runs.ndjson.checkpoint", written=lambda: sink.count)
+    >>> oms.get_runs(313052, 327564, checkpoint=checkpoint)
+    """
+
+    def __init__(self, path, written=None):
+        """
+        :param written: Callable returning the number of records written so far
+        """
+        self.path = path
+        self.written = written
+        self._lock = threading.Lock()
+        self._state = {"steps": {}, "written": 0}
+        if os.path.exists(path):
+            with io.open(path, "r", encoding="utf-8") as file:
+                self._state = json.load(file)
+
+    @property
+    def written_count(self):
+        """
+        :return: Number of records written when the checkpoint was last saved
+        """
+        return self._state["written"]
+
+    def get(self, key, default=None):
+        return self._state["steps"].get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            self._state["steps"][key] = value
+            if self.written is not None:
+                self._state["written"] = self.written()
+            self._save()
+
+    def _save(self):
+        temporary_path = "{}.tmp".format(self.path)
+        with io.open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(json.dumps(self._state))
+        os.rename(temporary_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
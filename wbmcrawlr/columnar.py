@@ -0,0 +1,200 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Column oriented storage for large OMS tables such as lumisections and
+hltpathrates.
+
+Instead of one dict per row, every field is kept in one column. Integer, float
+and boolean fields are stored in typed arrays, everything else in lists. Missing
+values (None) in typed columns are stored as 0 and marked in a null mask.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from array import array
+from collections import OrderedDict
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+# bool has to be checked before int, since bool is a subclass of int
+TYPECODES = [(bool, "b"), (int, "q"), (float, "d")]
+
+
+def _typecode(value):
+    for value_type, typecode in TYPECODES:
+        if isinstance(value, value_type):
+            return typecode
+    return None
+
+
+def _fits(typecode, value):
+    if value is None:
+        return False
+    if typecode == "b":
+        return isinstance(value, bool)
+    if typecode == "q":
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _typed_column(values):
+    """
+    :return: Typed array of the values if all but the missing ones fit one,
+        otherwise a list, and the set of indices of the missing values
+    """
+    present = [value for value in values if value is not None]
+    for _, typecode in TYPECODES:
+        if present and all(_fits(typecode, value) for value in present):
+            nulls = set(i for i, value in enumerate(values) if value is None)
+            return array(typecode, [value or 0 for value in values]), nulls
+    return list(values), set()
+
+
+class ColumnarTable(object):
+    """
+    >>> table = ColumnarTable()
+    >>> table.extend(oms.iter_lumisections(319579))
+    >>> table["recorded_lumi"]
+    array('d', [...])
+    >>> table.row(0)["recorded_lumi"]  # None if missing, 0 in the array
+    """
+
+    def __init__(self):
+        self.columns = OrderedDict()
+        self.nulls = {}  # Column name to indices of missing values in typed columns
+        self._length = 0
+
+    def _create_column(self, key, value):
+        """
+        Typed columns are also created for None and for records added later,
+        with all values so far missing
+        """
+        typecode = "d" if value is None else _typecode(value)
+        if typecode is None:
+            return [None] * self._length
+        self.nulls[key] = set(range(self._length))
+        return array(typecode, [0] * self._length)
+
+    def _all_missing(self, key):
+        return len(self.nulls[key]) == self._length
+
+    def _retype(self, key, column, value):
+        """
+        :return: Column that the value fits into, the typed array if possible
+        """
+        nulls = self.nulls[key]
+        typecode = _typecode(value)
+        if typecode is not None and self._all_missing(key):
+            return array(typecode, [0] * len(column))
+        if column.typecode == "q" and _fits("d", value):
+            return array("d", column)
+        del self.nulls[key]
+        return [self._value(column, index, nulls) for index in range(len(column))]
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        :param columns: Mapping of column name to a list of values, all lists
+            having the same length
+        """
+        table = cls()
+        for key, values in columns.items():
+            table.columns[key], nulls = _typed_column(values)
+            if isinstance(table.columns[key], array):
+                table.nulls[key] = nulls
+            table._length = len(values)
+        return table
+
+    def append(self, record):
+        for key, value in record.items():
+            if key not in self.columns:
+                self.columns[key] = self._create_column(key, value)
+
+        for key, column in self.columns.items():
+            value = record.get(key)
+            if isinstance(column, array):
+                if value is None:
+                    self.nulls[key].add(self._length)
+                    value = 0
+                elif not _fits(column.typecode, value) or self._all_missing(key):
+                    column = self.columns[key] = self._retype(key, column, value)
+            column.append(value)
+
+        self._length += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+        return self
+
+    @property
+    def schema(self):
+        """
+        :return: Column name to typecode, None for generic columns
+        """
+        return OrderedDict(
+            (key, column.typecode if isinstance(column, array) else None)
+            for key, column in self.columns.items()
+        )
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def row(self, index):
+        return dict(
+            (key, self._value(column, index, self.nulls.get(key)))
+            for key, column in self.columns.items()
+        )
+
+    @staticmethod
+    def _value(column, index, nulls=None):
+        if nulls and index in nulls:
+            return None
+        value = column[index]
+        if isinstance(column, array) and column.typecode == "b":
+            return bool(value)
+        return value
+
+    def rows(self):
+        for index in range(self._length):
+            yield self.row(index)
+
+    def to_numpy(self):
+        """
+        :return: dict of column name to numpy array, requires numpy. Typed
+            columns with missing values become masked arrays.
+        """
+        import numpy
+
+        dtypes = {"b": bool, "q": numpy.int64, "d": numpy.float64}
+        arrays = OrderedDict()
+        for key, column in self.columns.items():
+            if isinstance(column, array):
+                arrays[key] = numpy.array(column, dtype=dtypes[column.typecode])
+                if self.nulls[key]:
+                    mask = numpy.zeros(len(column), dtype=bool)
+                    mask[list(self.nulls[key])] = True
+                    arrays[key] = numpy.ma.masked_array(arrays[key], mask=mask)
+            else:
+                arrays[key] = numpy.array(column, dtype=object)
+        return arrays
@@ -19,10 +19,16 @@ from future import standard_library
 
 standard_library.install_aliases()
 import argparse
-import json
 
-from wbmcrawlr import oms
-from wbmcrawlr.utils import save_to_disk, check_oms_connectivity, get_oms_cookie
+from wbmcrawlr import oms, wbm
+from wbmcrawlr.session import POOL_SIZE, set_pool_size
+from wbmcrawlr.sinks import SINKS, create_sink, read_records, sink_path
+from wbmcrawlr.auth import get_credentials_manager
+from wbmcrawlr.cache import ResponseCache, set_cache
+from wbmcrawlr.checkpoint import Checkpoint
+from wbmcrawlr.metrics import Metrics, set_metrics
+from wbmcrawlr.sync import sync_resources
+from wbmcrawlr.throttle import MAX_IN_FLIGHT, RATE, Throttle, set_throttle
 
 
 def parse_arguments():
@@ -37,7 +43,112 @@ def parse_arguments():
         action="store_true",
     )
 
-    resource_group = parser.add_mutually_exclusive_group(required=True)
+    parser.add_argument(
+        "--workers",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Number of concurrent requests: shards of the --runs or --fills "
+        "range, pages, --all-hltrates paths or --wbm-runs chunks (default: 1)",
+    )
+
+    parser.add_argument(
+        "--rate-limit",
+        metavar="N",
+        type=float,
+        default=RATE,
+        help="Maximum number of requests per second (default: {})".format(RATE),
+    )
+
+    parser.add_argument(
+        "--max-in-flight",
+        metavar="N",
+        type=int,
+        default=MAX_IN_FLIGHT,
+        help="Maximum number of requests at the same time, regardless of "
+        "--workers (default: {})".format(MAX_IN_FLIGHT),
+    )
+
+    parser.add_argument(
+        "--pagination",
+        choices=oms.PAGINATIONS,
+        default=oms.OFFSET,
+        help="Select pages by offset or by the last retrieved number "
+        "(default: {})".format(oms.OFFSET),
+    )
+
+    parser.add_argument(
+        "--adaptive-page-size",
+        help="Grow or shrink the page size depending on how fast pages arrive",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--hltrates-strategy",
+        choices=oms.HLTPATHRATES_STRATEGIES,
+        default=oms.PER_PATH,
+        help="Request --all-hltrates per path or all paths at once "
+        "(default: {})".format(oms.PER_PATH),
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        metavar="N",
+        type=int,
+        default=wbm.CHUNK_SIZE,
+        help="Number of runs per --wbm-runs request, chunks are requested by "
+        "--workers at the same time (default: {})".format(wbm.CHUNK_SIZE),
+    )
+
+    parser.add_argument(
+        "--output-format",
+        choices=sorted(SINKS),
+        default="json",
+        help="Format of the output file, sqlite upserts all resource types "
+        "into oms.sqlite (default: json)",
+    )
+
+    parser.add_argument(
+        "--sync",
+        help="Only retrieve runs or fills that are new or still open and merge "
+        "them into the existing output file",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--resume",
+        help="Continue an interrupted crawl with the same arguments where it "
+        "stopped",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--stats",
+        help="Print the number, size and latency of the requests and the time "
+        "spent per phase after the crawl",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--stats-file",
+        metavar="PATH",
+        help="Write the request statistics to PATH, as JSON if it ends with "
+        ".json, in the Prometheus text format otherwise",
+    )
+
+    parser.add_argument(
+        "--no-cache",
+        help="Do not read or write the local response cache",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--clear-cache",
+        help="Remove all entries from the local response cache",
+        action="store_true",
+    )
+
+    resource_group = parser.add_mutually_exclusive_group()
     resource_group.add_argument(
         "--runs", metavar=("min", "max"), nargs=2, type=int, help="Retrieve Runs"
     )
@@ -60,58 +171,165 @@ def parse_arguments():
         type=int,
         help="Hlt rates for all available paths per lumisection",
     )
+    resource_group.add_argument(
+        "--wbm-runs",
+        metavar=("min", "max"),
+        nargs=2,
+        type=int,
+        help="Retrieve the WBM run summaries",
+    )
+
+    args = parser.parse_args()
+    resources = [args.runs, args.fills, args.lumisections]
+    resources += [args.hltrates, args.all_hltrates, args.wbm_runs]
+    if args.sync and not (args.runs or args.fills):
+        parser.error("--sync can only be used with --runs or --fills")
+    if args.wbm_runs and (args.sync or args.resume):
+        parser.error("--sync and --resume can not be used with --wbm-runs")
+    if args.sync and args.resume:
+        parser.error("--sync and --resume can not be combined")
+    if args.chunk_size <= 0:
+        parser.error("--chunk-size must be a positive number of runs")
+    if args.rate_limit <= 0:
+        parser.error("--rate-limit must be a positive number of requests")
+    if args.max_in_flight <= 0:
+        parser.error("--max-in-flight must be a positive number of requests")
+    if not args.clear_cache and not any(resources):
+        parser.error(
+            "one of the arguments --runs --fills --lumisections --hltrates "
+            "--all-hltrates --wbm-runs is required"
+        )
+    return args
 
-    return parser.parse_args()
+
+def crawl_wbm_runs(arguments, output_format, chunk_size, workers):
+    print("Getting WBM run summaries {} - {}".format(*arguments))
+    runs = wbm.iter_run_summary_by_range(
+        *arguments, chunk_size=chunk_size, workers=workers
+    )
+    with create_sink("wbm_runs", output_format, table="wbm_runs") as sink:
+        sink.write_all(runs)
+    print("Stored {} runs in '{}'".format(sink.count, sink.path))
 
 
 def main():
 
     args = parse_arguments()
 
+    if not (args.stats or args.stats_file):
+        crawl(args)
+        return
+
+    metrics = Metrics()
+    set_metrics(metrics)
+    try:
+        crawl(args)
+    finally:
+        set_metrics(None)
+        if args.stats:
+            print()
+            print(metrics.summary())
+        if args.stats_file:
+            metrics.write(args.stats_file)
+            print("Stored request statistics in '{}'".format(args.stats_file))
+
+
+def crawl(args):
+    if args.clear_cache:
+        cache = ResponseCache()
+        print("Clearing cache in '{}'".format(cache.directory))
+        cache.clear()
+
+    if not args.no_cache:
+        set_cache(ResponseCache())
+
+    if args.wbm_runs:
+        set_throttle(Throttle(rate=args.rate_limit, max_in_flight=args.max_in_flight))
+        crawl_wbm_runs(args.wbm_runs, args.output_format, args.chunk_size, args.workers)
+        return
+
     if args.runs:
-        resource_name = "runs"
-        method = oms.get_runs
+        resource_name = table = "runs"
+        method = oms.iter_runs
         arguments = args.runs
     elif args.fills:
-        resource_name = "fills"
-        method = oms.get_fills
+        resource_name = table = "fills"
+        method = oms.iter_fills
         arguments = args.fills
     elif args.lumisections:
-        resource_name = "lumisections"
-        method = oms.get_lumisections
+        resource_name = table = "lumisections"
+        method = oms.iter_lumisections
         arguments = args.lumisections
     elif args.hltrates:
-        resource_name = "hltrates"
-        method = oms.get_hltpathrates
+        resource_name, table = "hltrates", "hltpathrates"
+        method = oms.iter_hltpathrates
         arguments = args.hltrates
     elif args.all_hltrates:
-        resource_name = "hltrates"
-        method = oms.get_all_hltpathrates
+        resource_name, table = "hltrates", "hltpathrates"
+        method = oms.iter_all_hltpathrates
         arguments = args.all_hltrates
     else:
-        raise NotImplementedError
+        return
+
+    if args.workers > POOL_SIZE:
+        set_pool_size(args.workers)
+
+    set_throttle(Throttle(rate=args.rate_limit, max_in_flight=args.max_in_flight))
 
-    kwargs = {}
+    kwargs = {"workers": args.workers, "pagination": args.pagination}
 
-    if not check_oms_connectivity():
-        kwargs["inside_cern_gpn"] = False
-        kwargs["cookies"] = get_oms_cookie()
+    if args.adaptive_page_size:
+        kwargs["adaptive"] = True
+
+    if not get_credentials_manager().inside_cern_gpn():
+        print("OMS is not reachable within the CERN GPN, using SSO cookies")
 
     #extra_arguments = {}
 
     if args.split_filling_scheme and args.fills:
         kwargs['split_filling_scheme'] = True
 
-    response = method(*arguments, **kwargs)
-    
+    if args.all_hltrates:
+        kwargs["strategy"] = args.hltrates_strategy
+
+    basename = "oms_{}".format(resource_name)
+    path = sink_path(basename, args.output_format)
+
+    if args.sync:
+        key = "{}_number".format(resource_name[:-1])
+        stored = read_records(path, table)
+        print("Found {} {} in '{}'".format(len(stored), resource_name, path))
+        records = sync_resources(stored, method, key, *arguments, **kwargs)
+        with create_sink(basename, args.output_format, table=table) as sink:
+            sink.write_all(records)
+        print("Stored {} {} in '{}'".format(sink.count, resource_name, sink.path))
+        return
+
+    command = [resource_name] + [str(argument) for argument in arguments]
+    checkpoint = Checkpoint("{}.checkpoint".format(path))
+
+    if args.resume:
+        if checkpoint.get("command") != command:
+            print("There is no interrupted crawl of {} to resume".format(command))
+            return
+        print("Resuming after {} {}".format(checkpoint.written_count, resource_name))
+        sink = create_sink(
+            basename, args.output_format, keep=checkpoint.written_count, table=table
+        )
+    else:
+        checkpoint.remove()
+        checkpoint = Checkpoint(checkpoint.path)
+        checkpoint.set("command", command)
+        sink = create_sink(basename, args.output_format, table=table)
 
-    #print("Value of HTTP Response ", response)
+    checkpoint.written = sink.flush
+    kwargs["checkpoint"] = checkpoint
 
-    content = json.dumps(response, indent=2)
+    with sink:
+        sink.write_all(method(*arguments, **kwargs))
 
-    filename = "oms_{}.json".format(resource_name)
-    save_to_disk(filename, content=content)
-    print("Stored {} {} in '{}'".format(len(response), resource_name, filename))
+    checkpoint.remove()
+    print("Stored {} {} in '{}'".format(sink.count, resource_name, sink.path))
 
 
 if __name__ == "__main__":
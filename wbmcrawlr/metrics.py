@@ -0,0 +1,374 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Timing and metrics of the OMS and WBM request path.
+
+While a collector is set with set_metrics(), every request to OMS or WBM is
+recorded with its latency, response size, status and attempt, and the time
+spent in each phase of a crawl is summed up:
+
+- connectivity: probing whether OMS is reachable within the CERN GPN
+- sso: getting CERN SSO cookies
+- throttle: waiting for the rate limit
+- network: sending requests until the response headers arrived
+- decode: parsing JSON and XML responses. Streamed WBM responses are
+  received while they are parsed, so this includes their transfer.
+- flatten: flattening OMS resources into records
+- write: writing records to the output sink
+
+Any object with the methods of Metrics can be set as collector, e.g. to
+forward the measurements to a monitoring system.
+
+>>> metrics = Metrics()
+>>> set_metrics(metrics)
+>>> runs = oms.get_runs(326941, 327564)
+>>> print(metrics.summary())
+>>> metrics.write("wbmcrawlr_stats.prom")
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+PHASES = ["connectivity", "sso", "throttle", "network", "decode", "flatten", "write"]
+
+REQUEST_FIELDS = ["source", "resource", "status", "seconds", "bytes", "attempt"]
+
+
+class _Phase(object):
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started_at = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_phase(self.name, time.time() - self.started_at)
+
+
+class _NoPhase(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+def _percentile(values, percent):
+    """
+    :param values: Sorted list of numbers
+    """
+    if not values:
+        return 0
+    index = int(round(percent / 100 * (len(values) - 1)))
+    return values[index]
+
+
+def _label(value):
+    return '"{}"'.format(str(value).replace("\\", "\\\\").replace('"', '\\"'))
+
+
+class Metrics(object):
+    """
+    Collects requests and phase timings of one crawl, thread safe
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.retries = 0
+        self.phases = OrderedDict((name, [0, 0.0]) for name in PHASES)
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def record_request(self, source, resource, status, seconds, size, attempt=1):
+        """
+        :param source: "oms" or "wbm"
+        :param resource: OMS table or WBM servlet, e.g. "runs"
+        :param seconds: Latency until the response headers arrived
+        :param size: Length of the response body in bytes
+        :param attempt: 1 for the first attempt, 2 for the first retry, ...
+        """
+        record = (source, resource, status, seconds, size, attempt)
+        with self._lock:
+            self.requests.append(record)
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            phase = self.phases.setdefault(name, [0, 0.0])
+            phase[0] += 1
+            phase[1] += seconds
+
+    def phase(self, name):
+        """
+        >>> with metrics.phase("decode"):
+        ...     resource = json.loads(content)
+        """
+        return _Phase(self, name)
+
+    def timed(self, name, function):
+        """
+        :return: function, with its calls added to the given phase
+        """
+
+        def call(*args, **kwargs):
+            with self.phase(name):
+                return function(*args, **kwargs)
+
+        return call
+
+    def _groups(self):
+        """
+        :return: OrderedDict of (source, resource) to statistics of its requests
+        """
+        groups = OrderedDict()
+        with self._lock:
+            requests = list(self.requests)
+        for source, resource, status, seconds, size, attempt in requests:
+            group = groups.setdefault(
+                (source, resource),
+                {"statuses": OrderedDict(), "latencies": [], "bytes": 0},
+            )
+            group["statuses"][status] = group["statuses"].get(status, 0) + 1
+            group["latencies"].append(seconds)
+            group["bytes"] += size
+        return groups
+
+    def as_dict(self):
+        resources = []
+        for (source, resource), group in self._groups().items():
+            latencies = sorted(group["latencies"])
+            resources.append(
+                OrderedDict(
+                    [
+                        ("source", source),
+                        ("resource", resource),
+                        ("requests", len(latencies)),
+                        ("bytes", group["bytes"]),
+                        ("statuses", group["statuses"]),
+                        ("seconds", sum(latencies)),
+                        ("mean_seconds", sum(latencies) / len(latencies)),
+                        ("p50_seconds", _percentile(latencies, 50)),
+                        ("p95_seconds", _percentile(latencies, 95)),
+                        ("max_seconds", latencies[-1]),
+                    ]
+                )
+            )
+
+        with self._lock:
+            phases = OrderedDict(
+                (name, {"count": count, "seconds": seconds})
+                for name, (count, seconds) in self.phases.items()
+            )
+            requests = [OrderedDict(zip(REQUEST_FIELDS, r)) for r in self.requests]
+            retries = self.retries
+
+        return OrderedDict(
+            [
+                ("elapsed_seconds", time.time() - self.started_at),
+                ("retries", retries),
+                ("phases", phases),
+                ("resources", resources),
+                ("requests", requests),
+            ]
+        )
+
+    def summary(self):
+        """
+        :return: Human readable summary, e.g. for printing after a crawl
+        """
+        content = self.as_dict()
+        requests = content["requests"]
+        lines = [
+            "Requests: {}, retries: {}, {:.1f} MB, {:.1f}s elapsed".format(
+                len(requests),
+                content["retries"],
+                sum(request["bytes"] for request in requests) / 1e6,
+                content["elapsed_seconds"],
+            )
+        ]
+        for resource in content["resources"]:
+            statuses = ", ".join(
+                "{}x {}".format(count, status)
+                for status, count in resource["statuses"].items()
+            )
+            lines.append(
+                "  {:4s} {:20s} {:6d} requests {:10.1f} kB  mean {:.3f}s  "
+                "p95 {:.3f}s  max {:.3f}s  ({})".format(
+                    resource["source"],
+                    resource["resource"],
+                    resource["requests"],
+                    resource["bytes"] / 1000,
+                    resource["mean_seconds"],
+                    resource["p95_seconds"],
+                    resource["max_seconds"],
+                    statuses,
+                )
+            )
+        lines.append("Phases:")
+        for name, phase in content["phases"].items():
+            lines.append(
+                "  {:14s} {:8d} calls {:10.3f}s".format(
+                    name, phase["count"], phase["seconds"]
+                )
+            )
+        return "\n".join(lines)
+
+    def to_prometheus(self):
+        """
+        :return: Metrics in the Prometheus text exposition format
+        """
+        lines = []
+
+        def add(name, kind, description, samples):
+            """
+            :param samples: (suffix, labels, value) tuples, labels being a
+                list of (name, value) tuples
+            """
+            lines.append("# HELP wbmcrawlr_{} {}".format(name, description))
+            lines.append("# TYPE wbmcrawlr_{} {}".format(name, kind))
+            for suffix, labels, value in samples:
+                label_text = ",".join(
+                    "{}={}".format(key, _label(label)) for key, label in labels
+                )
+                label_text = "{{{}}}".format(label_text) if label_text else ""
+                lines.append(
+                    "wbmcrawlr_{}{}{} {}".format(name, suffix, label_text, value)
+                )
+
+        groups = self._groups()
+        request_samples = []
+        latency_samples = []
+        for (source, resource), group in groups.items():
+            labels = [("source", source), ("resource", resource)]
+            for status, count in group["statuses"].items():
+                request_samples.append(("", labels + [("status", status)], count))
+
+            latencies = sorted(group["latencies"])
+            for quantile in (0.5, 0.95):
+                value = _percentile(latencies, quantile * 100)
+                latency_samples.append(("", labels + [("quantile", quantile)], value))
+            latency_samples.append(("_sum", labels, sum(latencies)))
+            latency_samples.append(("_count", labels, len(latencies)))
+
+        add("requests_total", "counter", "Requests to OMS and WBM", request_samples)
+        add(
+            "request_seconds",
+            "summary",
+            "Latency until the response headers arrived",
+            latency_samples,
+        )
+        add(
+            "response_bytes_total",
+            "counter",
+            "Length of the response bodies",
+            [
+                ("", [("source", source), ("resource", resource)], group["bytes"])
+                for (source, resource), group in groups.items()
+            ],
+        )
+        with self._lock:
+            retries = self.retries
+            phases = [(name, list(phase)) for name, phase in self.phases.items()]
+        add("retries_total", "counter", "Retried requests", [("", [], retries)])
+        add(
+            "phase_seconds_total",
+            "counter",
+            "Time spent per phase of the crawl",
+            [("", [("phase", name)], seconds) for name, (_, seconds) in phases],
+        )
+        add(
+            "phase_calls_total",
+            "counter",
+            "Number of timed calls per phase of the crawl",
+            [("", [("phase", name)], count) for name, (count, _) in phases],
+        )
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """
+        Write the metrics as JSON if path ends with .json, in the Prometheus
+        text format otherwise
+        """
+        if path.endswith(".json"):
+            content = json.dumps(self.as_dict(), indent=2)
+        else:
+            content = self.to_prometheus()
+        with io.open(path, "w", encoding="utf-8") as file:
+            file.write(content)
+
+
+_metrics = None
+
+
+def get_metrics():
+    """
+    :return: The collector of the request path, None if disabled
+    """
+    return _metrics
+
+
+def set_metrics(metrics):
+    """
+    Record requests and phase timings in the given collector, None to stop
+    """
+    global _metrics
+    _metrics = metrics
+
+
+def record_response(source, resource, response, attempt=1, size=None):
+    """
+    Record a requests.Response if metrics are collected
+
+    :param size: Length of the body, defaults to len(response.content)
+    """
+    metrics = _metrics
+    if metrics is None:
+        return
+    if size is None:
+        size = len(response.content)
+    seconds = response.elapsed.total_seconds()
+    metrics.record_request(
+        source, resource, response.status_code, seconds, size, attempt
+    )
+
+
+def phase(name):
+    """
+    Time the block as the given phase if metrics are collected
+
+    >>> with phase("decode"):
+    ...     resource = json.loads(content)
+    """
+    metrics = _metrics
+    if metrics is None:
+        return _NO_PHASE
+    return metrics.phase(name)
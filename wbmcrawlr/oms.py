@@ -20,11 +20,15 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from builtins import range
+from collections import OrderedDict
+from itertools import chain
 from urllib.parse import urlencode
 
-import json
-import requests
+import threading
+import time
+
 from future import standard_library
+from requests import RequestException
 
 from wbmcrawlr.urls import OMS_API_URL, OMS_ALTERNATIVE_API_URL
 
@@ -32,48 +36,200 @@ from wbmcrawlr.constants import CERT_TUPLE
 
 standard_library.install_aliases()
 
-import cernrequests
-
+from cernrequests.certs import default_user_certificate_paths
+
+from wbmcrawlr.adaptive import AdaptivePageSize, PAGE_TIMEOUT
+from wbmcrawlr.auth import get_credentials_manager, needs_authentication
+from wbmcrawlr.cache import FOREVER, OPEN_TTL, get_cache
+from wbmcrawlr.checkpoint import query_key
+from wbmcrawlr.columnar import ColumnarTable
+from wbmcrawlr.metrics import phase, record_response
+from wbmcrawlr.retry import REQUEST_RETRIES, call_with_retries, raise_for_server_error
+from wbmcrawlr.session import get_session
+from wbmcrawlr.sharding import SHARD_SIZE, plan_shards
+from wbmcrawlr.store import get_store
+from wbmcrawlr.throttle import throttled
 from wbmcrawlr.utils import flatten_resource, print_progress, calc_page_count, \
-    check_oms_connectivity, split_filling_scheme
+    iter_split_filling_scheme, iter_ordered, collapse_numbers, loads
 
 PAGE_SIZE = 1000
+PATH_RETRIES = 2
+BATCH_WORKERS = 4
+MAX_GAP = 20
+
+PER_PATH = "per-path"
+BULK = "bulk"
+HLTPATHRATES_STRATEGIES = [PER_PATH, BULK]
+
+OFFSET = "offset"
+KEYSET = "keyset"
+PAGINATIONS = [OFFSET, KEYSET]
+
+# Sort keys that are unique within a query, given equality filters on the
+# listed fields, as KEYSET pagination requires
+KEYSET_SORT_KEYS = {
+    "runs": ("run_number", []),
+    "fills": ("fill_number", []),
+    "lumisections": ("lumisection_number", ["run_number"]),
+    "hltpathrates": ("last_lumisection_number", ["run_number", "path_name"]),
+}
+
+_request_hooks = []
+
+
+def add_request_hook(hook):
+    """
+    Register a callable that is invoked after every OMS request as
+    hook(table, parameters, response)
+    """
+    _request_hooks.append(hook)
+
+
+def remove_request_hook(hook):
+    _request_hooks.remove(hook)
+
+
+class RequestCounter(object):
+    """
+    Request hook counting the number of OMS requests
+
+    >>> counter = RequestCounter()
+    >>> add_request_hook(counter)
+    >>> get_runs(326941, 326942, silent=True)
+    >>> counter.count
+    1
+    """
 
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
 
-def _get_oms_resource_within_cern_gpn(relative_url):
+    def __call__(self, table, parameters, response):
+        with self._lock:
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+def _get_oms_resource_within_cern_gpn(relative_url, session=None, timeout=None):
     url = "{}{}".format(OMS_API_URL, relative_url)
-    return requests.get(url)
+    session = session or get_session()
+    return throttled(session.get, url, timeout=timeout)
 
 
-def _get_oms_resource_authenticated(relative_url, cookies=None):
+def _get_oms_resource_authenticated(
+    relative_url, cookies=None, session=None, timeout=None
+):
     url = "{}{}".format(OMS_ALTERNATIVE_API_URL, relative_url)
+    credentials = get_credentials_manager()
     if cookies is None:
-        print("Getting SSO Cookies for {}...".format(url))
-        print("Looking for certificates in {}".format(CERT_TUPLE))
+        cookies = credentials.get_cookies(url, CERT_TUPLE)
+
+    session = session or get_session()
+    kwargs = {"cert": default_user_certificate_paths(), "verify": False}
+    response = throttled(session.get, url, cookies=cookies, timeout=timeout, **kwargs)
+
+    if needs_authentication(response):  # Cookies expired, get new ones once
+        cookies = credentials.get_cookies(url, CERT_TUPLE, refresh=True, stale=cookies)
+        response = throttled(
+            session.get, url, cookies=cookies, timeout=timeout, **kwargs
+        )
+
+    return response
+
+
+def _cache_ttl(cache, table, parameters, resource):
+    """
+    Responses that can still change are only cached for a short time. These
+    are responses without rows or with rows without an end time (e.g. the
+    ongoing run), the last page of a paginated query, which receives the
+    rows added to the requested range, and single row pages, which are only
+    requested for their total resource count (see count_resources). The total
+    resource count of an earlier page may be outdated, iter_resources follows
+    the newest one.
+    """
+    ttl = cache.ttl(table)
+    rows = resource.get("data") or []
+    is_open = not rows or any(
+        row.get("attributes", {}).get("end_time", "") is None for row in rows
+    )
+
+    if "page[limit]" in parameters:
+        offset = int(parameters.get("page[offset]", 0))
+        limit = int(parameters["page[limit]"])
+        total = resource.get("meta", {}).get("totalResourceCount", 0)
+        is_open = is_open or limit == 1 or offset + limit >= total
+
+    if is_open and (ttl is FOREVER or ttl > OPEN_TTL):
+        return OPEN_TTL
+    return ttl
+
+
+def _get_oms_resource(
+    table,
+    parameters,
+    cookies=None,
+    inside_cern_gpn=True,
+    session=None,
+    timeout=None,
+    retries=REQUEST_RETRIES,
+):
+    """
+    Connection errors, server errors, throttling responses and undecodable
+    responses are retried up to `retries` times with exponential backoff.
+    Requests are rate limited by the shared throttle.
 
-        cookies = cernrequests.get_sso_cookies(url, CERT_TUPLE, verify=False)
-        print("The cookies are {}".format(cookies))
+    :return: (resource, size) tuple, size being the response length in bytes
+    """
+    relative_url = "{table}?{parameters}".format(
+        table=table, parameters=urlencode(parameters)
+    )
+
+    cache = get_cache()
+    cache_url = "{}{}".format(OMS_API_URL, relative_url)
+    if cache is not None:
+        content = cache.get(cache_url)
+        if content is not None:
+            with phase("decode"):
+                return loads(content), len(content)
+
+    attempts = [0]
+
+    def request():
+        attempts[0] += 1
+        if inside_cern_gpn:  # Within CERN GPN
+            response = _get_oms_resource_within_cern_gpn(
+                relative_url, session, timeout
+            )
+        else:  # Outside CERN GPN, requires authentication
+            response = _get_oms_resource_authenticated(
+                relative_url, cookies, session, timeout
+            )
 
-    return cernrequests.get(url, cookies=cookies, verify=False)
+        for hook in _request_hooks:
+            hook(table, parameters, response)
+        record_response("oms", table, response, attempts[0])
 
+        raise_for_server_error(response)
+        with phase("decode"):
+            return response, loads(response.content)
 
-def get_oms_resource(table, parameters, cookies=None, inside_cern_gpn=True):
-    parameters = urlencode(parameters)
-    relative_url = "{table}?{parameters}".format(table=table, parameters=parameters)
+    response, resource = call_with_retries(request, retries)
+    if cache is not None and response.ok:
+        ttl = _cache_ttl(cache, table, parameters, resource)
+        cache.set(cache_url, response.content, ttl)
+    return resource, len(response.content)
 
-    if inside_cern_gpn:  # Within CERN GPN
-        response = _get_oms_resource_within_cern_gpn(relative_url)
-    else:  # Outside CERN GPN, requires authentication
-        response = _get_oms_resource_authenticated(relative_url, cookies)
-        print("Inside get_oms_resource")
-        print("The response is {}".format(response))
-        
-    return response.json()
+
+def get_oms_resource(table, parameters, **kwargs):
+    return _get_oms_resource(table, parameters, **kwargs)[0]
 
 
 def _get_single_resource(table, parameters, **kwargs):
     if "inside_cern_gpn" not in kwargs:
-        kwargs['inside_cern_gpn'] = check_oms_connectivity()
+        kwargs["inside_cern_gpn"] = get_credentials_manager().inside_cern_gpn()
     data = get_oms_resource(table, parameters, **kwargs)["data"]
     assert len(data) == 1, "More than 1 {} were returned".format(table)
     return data[0]
@@ -89,86 +245,615 @@ def get_fill(fill_number, **kwargs):
     return _get_single_resource("fills", parameters, **kwargs)
 
 
-def _get_resources_page(table, parameters, page, page_size, **kwargs):
+def _get_resources_page(table, parameters, page, page_size, start=0, **kwargs):
     assert page >= 1, "Page number cant be lower than 1"
-    params = {"page[offset]": (page - 1) * page_size, "page[limit]": page_size}
+    params = {
+        "page[offset]": start + (page - 1) * page_size,
+        "page[limit]": page_size,
+    }
     params.update(parameters)
-    
-    oms_resource = get_oms_resource(table, params, **kwargs)
-    print("Inside get_resources_page")
-
     return get_oms_resource(table, params, **kwargs)
 
 
-def get_resources(table, parameters, page_size=PAGE_SIZE, silent=False, **kwargs):
+def _iter_resources_pages(
+    table, parameters, pages, page_size, workers=1, start=0, **kwargs
+):
+    """
+    Yields (page, response) tuples in page order.
+
+    With workers > 1 up to that many page requests are in flight at the same
+    time. Responses are still yielded in page order, so at most `workers`
+    pages are held in memory.
+
+    :param start: Offset of the first page
+    """
+
+    def get_page(page):
+        return _get_resources_page(
+            table, parameters, page, page_size, start=start, **kwargs
+        )
+
+    return iter_ordered(get_page, pages, workers)
+
+
+def _sort_value(parameters, resource):
+    return resource["attributes"][parameters["sort"].lstrip("-")]
+
+
+def _has_unique_sort_key(table, parameters):
+    """
+    :return: True if no two rows of the query share the value of the sort key,
+        e.g. lumisections sorted by lumisection_number within one run, but
+        not within a fill
+    """
+    if table not in KEYSET_SORT_KEYS or "sort" not in parameters:
+        return False
+    key, scope = KEYSET_SORT_KEYS[table]
+    filters = ["filter[{}][EQ]".format(field) for field in scope]
+    return parameters["sort"].lstrip("-") == key and all(
+        name in parameters for name in filters
+    )
+
+
+def _keyset_parameters(parameters, after):
+    """
+    :return: parameters selecting everything after the value `after` of the
+        sort key in sort order
+    """
+    sort = parameters["sort"]
+    key = sort.lstrip("-")
+    operator = "LT" if sort.startswith("-") else "GT"
+    params = dict(parameters)
+    params["filter[{}][{}]".format(key, operator)] = after
+    return params
+
+
+def _iter_keyset_pages(table, parameters, response, page_size, **kwargs):
+    """
+    Yields (page, response) tuples, each page selecting the rows after the last
+    row of the previous page with a filter on the sort key instead of an offset.
+    Pages are requested until one is not full, so rows added at the end of the
+    range during the crawl are retrieved as well.
+    """
+    page = 1
+    while len(response["data"]) >= page_size:
+        after = _sort_value(parameters, response["data"][-1])
+        params = _keyset_parameters(parameters, after)
+        response = _get_resources_page(table, params, 1, page_size, **kwargs)
+        page += 1
+        yield page, response
+
+
+def _iter_adaptive_pages(
+    table,
+    parameters,
+    response,
+    resource_count,
+    page_sizer,
+    pagination,
+    start=0,
+    **kwargs
+):
+    """
+    Yields (page, response) tuples, choosing the size of every page with
+    page_sizer. Failed or rejected pages are requested again with a smaller
+    page size, see AdaptivePageSize.failed, until the minimum is reached.
+    """
+    offset = start + len(response["data"])
+    page = 1
+    limit = page_sizer.value
+
+    def has_more(rows):
+        if pagination == KEYSET:  # Until a page is not full, see _iter_keyset_pages
+            return len(rows) >= limit
+        return offset < resource_count and rows
+
+    while has_more(response["data"]):
+        if pagination == KEYSET:
+            after = _sort_value(parameters, response["data"][-1])
+            params = _keyset_parameters(parameters, after)
+            params["page[offset]"] = 0
+        else:
+            params = dict(parameters)
+            params["page[offset]"] = offset
+        params["page[limit]"] = page_sizer.value
+
+        started_at = time.time()
+        try:
+            next_response, size = _get_oms_resource(
+                table, params, timeout=PAGE_TIMEOUT, retries=0, **kwargs
+            )
+            rows = next_response["data"]
+        except (RequestException, ValueError, KeyError, TypeError):
+            if not page_sizer.failed():
+                raise
+            continue
+
+        page_sizer.record(len(rows), time.time() - started_at, size)
+        if not rows:
+            return
+
+        if pagination != KEYSET:  # Newer than the count of a cached first page
+            total = next_response["meta"]["totalResourceCount"]
+            resource_count = max(resource_count, total)
+
+        limit = params["page[limit]"]
+        page += 1
+        offset += len(rows)
+        response = next_response
+        yield page, response
+
+
+def _flatten_page(response, units):
+    with phase("flatten"):
+        return [flatten_resource(resource, units) for resource in response["data"]]
+
+
+def iter_resources(
+    table,
+    parameters,
+    page_size=PAGE_SIZE,
+    silent=False,
+    workers=1,
+    pagination=OFFSET,
+    adaptive=False,
+    checkpoint=None,
+    units=None,
+    **kwargs
+):
+    """
+    Retrieve all resources of an OMS table matching the given parameters,
+    yielding them page by page as they arrive.
+
+    With OFFSET pagination pages are selected with page[offset]. With KEYSET
+    pagination each page filters on the sort key being past the last row of
+    the previous page, which keeps the cost per page constant and does not
+    shift when rows are added during the crawl. Rows added at the end of the
+    range during the crawl are retrieved too. KEYSET requires a sort key that
+    is unique within the query, see KEYSET_SORT_KEYS, and fetches pages one
+    after another.
+
+    With adaptive=True page_size is only the initial page size. It grows
+    while pages arrive quickly and shrinks when they are slow, too large or
+    rejected by the server. Adaptive pages are fetched one after another.
+
+    With a checkpoint the progress is saved after every page and a query
+    that was interrupted before continues after the last saved page.
+
+    :param workers: Maximum number of page requests in flight at the same time
+    :param pagination: OFFSET or KEYSET
+    :param adaptive: Adjust the page size to the observed latency
+    :param checkpoint: wbmcrawlr.checkpoint.Checkpoint
+    :param units: dict receiving the units of the run or fill fields once,
+        instead of a {key}_unit field in every run or fill
+    """
+    assert pagination in PAGINATIONS, "Unknown pagination {}".format(pagination)
+    assert pagination != KEYSET or _has_unique_sort_key(
+        table, parameters
+    ), "KEYSET pagination requires a unique sort key, use OFFSET for this query"
     if "inside_cern_gpn" not in kwargs:
-        kwargs['inside_cern_gpn'] = check_oms_connectivity()
+        kwargs["inside_cern_gpn"] = get_credentials_manager().inside_cern_gpn()
+
+    key = query_key(table, parameters)
+    state = checkpoint.get(key) if checkpoint is not None else None
+    start = state["offset"] if state else 0
+    if state and start >= state["total"]:
+        return  # Completed before
 
     if not silent:
         print("Getting initial response...", end="\r")
 
-    response = _get_resources_page(
-        table, parameters, page=1, page_size=page_size, **kwargs
-    )
-    print("Inside get_resources")
-    
-    resource_count = response["meta"]["totalResourceCount"]
-    page_count = calc_page_count(resource_count, page_size)
+    keyset_resume = state and pagination == KEYSET and state["after"] is not None
+    if keyset_resume:
+        first_parameters = _keyset_parameters(parameters, state["after"])
+        response = _get_resources_page(
+            table, first_parameters, page=1, page_size=page_size, **kwargs
+        )
+        resource_count = start + response["meta"]["totalResourceCount"]
+    else:
+        response = _get_resources_page(
+            table, parameters, page=1, page_size=page_size, start=start, **kwargs
+        )
+        resource_count = response["meta"]["totalResourceCount"]
+
+    page_count = calc_page_count(resource_count - start, page_size)
 
     if not silent:
         print(" " * 100, end="\r")
         print("Total number of {}: {}".format(table, resource_count))
+        if start:
+            print("Resuming after {} {}".format(start, table))
         print()
 
-    resources = [flatten_resource(resource) for resource in response["data"]]
+    def save_progress(yielded_count, response):
+        if checkpoint is None:
+            return
+        after = state["after"] if state else None
+        if response["data"] and "sort" in parameters:
+            after = _sort_value(parameters, response["data"][-1])
+        progress = {"offset": start + yielded_count, "total": resource_count}
+        progress["after"] = after
+        checkpoint.set(key, progress)
+
+    yielded_count = len(response["data"])
+    for resource in _flatten_page(response, units):
+        yield resource
+    save_progress(yielded_count, response)
+
+    def further_pages(page):
+        """
+        Pages after the planned ones, while a newer total count asks for them
+        """
+        while start + yielded_count < resource_count:
+            page += 1
+            response = _get_resources_page(
+                table, parameters, page, page_size, start=start, **kwargs
+            )
+            if not response["data"]:
+                return
+            yield page, response
+
+    pages = range(2, page_count + 1)
+    page_sizer = AdaptivePageSize(page_size)
+    if adaptive:
+        responses = _iter_adaptive_pages(
+            table,
+            parameters,
+            response,
+            resource_count,
+            page_sizer,
+            pagination,
+            start=start,
+            **kwargs
+        )
+    elif pagination == KEYSET:
+        responses = _iter_keyset_pages(
+            table, parameters, response, page_size, **kwargs
+        )
+    else:
+        responses = chain(
+            _iter_resources_pages(
+                table,
+                parameters,
+                pages,
+                page_size,
+                workers=workers,
+                start=start,
+                **kwargs
+            ),
+            further_pages(page_count),
+        )
 
-    for page in range(2, page_count + 1):
+    for page, response in responses:
+        if pagination != KEYSET:  # Newer than the count of a cached first page
+            total = response["meta"]["totalResourceCount"]
+            resource_count = max(resource_count, total)
+        if adaptive:  # Estimate the remaining pages with the current page size
+            remaining = resource_count - start - yielded_count - len(response["data"])
+            page_count = page + calc_page_count(max(remaining, 0), page_sizer.value)
+        page_count = max(page_count, page)  # Rows added during a KEYSET crawl
         if not silent:
             print_progress(page, page_count, text="Page {}/{}".format(page, page_count))
-        response = _get_resources_page(table, parameters, page, page_size, **kwargs)
-        resources.extend([flatten_resource(resource) for resource in response["data"]])
+        yielded_count += len(response["data"])
+        for resource in _flatten_page(response, units):
+            yield resource
+        save_progress(yielded_count, response)
 
     if not silent:
         print()
         print()
 
-    assert len(resources) == resource_count, "Oops, not enough resources were returned"
-    return resources
+    if pagination == KEYSET:  # Rows may have been added during the crawl
+        assert (
+            start + yielded_count >= resource_count
+        ), "Oops, not enough resources were returned"
+    else:
+        assert (
+            start + yielded_count == resource_count
+        ), "Oops, not enough resources were returned"
 
 
-def get_runs(begin, end, **kwargs):
-    """"
-    >>> get_runs(317512, 317512)
+def get_resources(table, parameters, page_size=PAGE_SIZE, **kwargs):
+    """
+    Retrieve all resources of an OMS table matching the given parameters.
 
+    :param workers: Maximum number of page requests in flight at the same time
     """
-    print("Getting runs {} - {} from CMS OMS".format(begin, end))
-    parameters = {
+    return list(iter_resources(table, parameters, page_size=page_size, **kwargs))
+
+
+def count_resources(table, parameters, **kwargs):
+    """
+    :return: Number of resources matching the parameters, using a single row
+        request
+    """
+    if "inside_cern_gpn" not in kwargs:
+        kwargs["inside_cern_gpn"] = get_credentials_manager().inside_cern_gpn()
+
+    response = _get_resources_page(table, parameters, page=1, page_size=1, **kwargs)
+    return response["meta"]["totalResourceCount"]
+
+
+def _iter_sharded(
+    table, make_parameters, begin, end, page_size, workers, shard_size, **kwargs
+):
+    """
+    Split [begin, end] into shards of about shard_size resources, retrieve up
+    to `workers` shards at the same time and yield their resources in order.
+    """
+    silent = kwargs.pop("silent", False)
+    checkpoint = kwargs.pop("checkpoint", None)
+    units = kwargs.pop("units", None)
+    kwargs.pop("pagination", None)
+    if "inside_cern_gpn" not in kwargs:
+        kwargs["inside_cern_gpn"] = get_credentials_manager().inside_cern_gpn()
+
+    def count(shard_begin, shard_end):
+        return count_resources(table, make_parameters(shard_begin, shard_end), **kwargs)
+
+    # A resumed crawl has to use the same shards as the interrupted one
+    plan_key = "shards:{}".format(query_key(table, make_parameters(begin, end)))
+    shards = checkpoint.get(plan_key) if checkpoint is not None else None
+
+    if shards is None:
+        if not silent:
+            print("Planning shards of at most {} {}...".format(shard_size, table))
+        shards = plan_shards(count, begin, end, shard_size)
+        if checkpoint is not None:
+            checkpoint.set(plan_key, shards)
+
+    if len(shards) <= 1:  # Nothing to split, request the pages concurrently
+        for resource in iter_resources(
+            table,
+            make_parameters(begin, end),
+            page_size=page_size,
+            silent=silent,
+            workers=workers,
+            checkpoint=checkpoint,
+            units=units,
+            **kwargs
+        ):
+            yield resource
+        return
+
+    def shard_key(shard):
+        return query_key(table, make_parameters(shard[0], shard[1]))
+
+    if checkpoint is not None:
+        shards = [shard for shard in shards if not checkpoint.get(shard_key(shard))]
+
+    if not silent:
+        print("Total number of {}: {}".format(table, sum(s[2] for s in shards)))
+        print()
+
+    def get_shard(shard):
+        shard_begin, shard_end, _ = shard
+        return get_resources(
+            table,
+            make_parameters(shard_begin, shard_end),
+            page_size=page_size,
+            silent=True,
+            pagination=KEYSET,
+            units=units,
+            **kwargs
+        )
+
+    shard_count = len(shards)
+    for i, (shard, resources) in enumerate(iter_ordered(get_shard, shards, workers), 1):
+        if not silent:
+            text = "Shard {}/{}: {} - {}".format(i, shard_count, shard[0], shard[1])
+            print_progress(i, shard_count, text=text)
+        for resource in resources:
+            yield resource
+        if checkpoint is not None:
+            done = {"offset": len(resources), "total": len(resources), "after": None}
+            checkpoint.set(shard_key(shard), done)
+
+    if not silent:
+        print()
+        print()
+
+
+def _iter_number_range(
+    table, make_parameters, begin, end, page_size, shard_size=SHARD_SIZE, **kwargs
+):
+    """
+    With workers > 1 the range is split into shards that are retrieved at the
+    same time, otherwise the range is retrieved page by page.
+    """
+    if kwargs.get("workers", 1) > 1:
+        workers = kwargs.pop("workers")
+        return _iter_sharded(
+            table, make_parameters, begin, end, page_size, workers, shard_size, **kwargs
+        )
+    return iter_resources(
+        table, make_parameters(begin, end), page_size=page_size, **kwargs
+    )
+
+
+def _runs_parameters(begin, end):
+    return {
         "filter[run_number][GE]": begin,
         "filter[run_number][LE]": end,
         "filter[sequence][EQ]": "GLOBAL-RUN",
         "sort": "run_number",
     }
 
-    return get_resources("runs", parameters, page_size=100, **kwargs)
 
+def iter_runs(begin, end, **kwargs):
+    """
+    :param workers: Number of shards of the run range retrieved at once
+    :param shard_size: Approximate number of runs per shard
+    """
+    print("Getting runs {} - {} from CMS OMS".format(begin, end))
+    return _iter_number_range(
+        "runs", _runs_parameters, begin, end, page_size=100, **kwargs
+    )
 
-def get_fills(begin, end, **kwargs):
-    print("Getting fills {} - {} from CMS OMS".format(begin, end))
-    parameters = {
+
+def _covered_until(resources, key, end):
+    """
+    :return: Highest number up to which the retrieved range can not change
+        anymore: before the first still open resource, at most the highest
+        retrieved number because later ones may still be added.
+    """
+    numbers = [resource[key] for resource in resources]
+    open_numbers = [
+        resource[key] for resource in resources if resource.get("end_time") is None
+    ]
+    if open_numbers:
+        return min(open_numbers) - 1
+    return min(max(numbers), end) if numbers else None
+
+
+def _read_through(store, table, key, method, begin, end, **kwargs):
+    """
+    Request only the parts of [begin, end] that are not completely stored yet,
+    store them and answer the whole range from the store.
+    """
+    for range_begin, range_end in store.uncovered_ranges(table, begin, end):
+        resources = list(method(range_begin, range_end, **kwargs))
+        store.upsert(table, resources)
+        covered_until = _covered_until(resources, key, range_end)
+        if covered_until is not None and covered_until >= range_begin:
+            store.add_coverage(table, range_begin, covered_until)
+    return store.select(table, **{key: (begin, end)})
+
+
+def get_runs(begin, end, **kwargs):
+    """"
+    With a store set by wbmcrawlr.store.set_store only the runs that are not
+    stored or still ongoing are requested.
+
+    >>> get_runs(317512, 317512)
+
+    """
+    store = get_store()
+    if store is None:
+        return list(iter_runs(begin, end, **kwargs))
+    return _read_through(store, "runs", "run_number", iter_runs, begin, end, **kwargs)
+
+
+def _fills_parameters(begin, end):
+    return {
         "filter[fill_number][GE]": begin,
         "filter[fill_number][LE]": end,
         "sort": "fill_number",
     }
 
+
+def iter_fills(begin, end, **kwargs):
+    """
+    :param workers: Number of shards of the fill range retrieved at once
+    :param shard_size: Approximate number of fills per shard
+    """
+    print("Getting fills {} - {} from CMS OMS".format(begin, end))
+
     split_scheme = kwargs.pop("split_filling_scheme", False)
 
+    fills = _iter_number_range(
+        "fills", _fills_parameters, begin, end, page_size=100, **kwargs
+    )
     if not split_scheme:
-        return get_resources("fills", parameters, page_size=100, **kwargs)
-    else:
-        fills = get_resources("fills", parameters, page_size=100, **kwargs)
-        for fill in fills:
-            split_filling_scheme(fill)
         return fills
+    return iter_split_filling_scheme(fills)
+
+
+def get_fills(begin, end, **kwargs):
+    """
+    With a store set by wbmcrawlr.store.set_store only the fills that are not
+    stored or still ongoing are requested.
+    """
+    store = get_store()
+    if store is None:
+        return list(iter_fills(begin, end, **kwargs))
+
+    split_scheme = kwargs.pop("split_filling_scheme", False)
+    fills = _read_through(
+        store, "fills", "fill_number", iter_fills, begin, end, **kwargs
+    )
+    if split_scheme:
+        return list(iter_split_filling_scheme(fills))
+    return fills
+
+
+def _get_resources_by_numbers(
+    table,
+    key,
+    numbers,
+    page_size=100,
+    workers=BATCH_WORKERS,
+    max_gap=MAX_GAP,
+    silent=False,
+    **kwargs
+):
+    """
+    Look up resources by an arbitrary list of numbers with as few range
+    queries as possible. Consecutive numbers are collapsed into one range,
+    neighbouring ranges at most max_gap numbers apart are joined as well and
+    the rows in between are dropped. Up to `workers` ranges are requested at
+    the same time.
+
+    :return: (resources, missing) tuple, resources being an OrderedDict of
+        number to resource in ascending order and missing the sorted list of
+        numbers that were not found
+    """
+    if "inside_cern_gpn" not in kwargs:
+        kwargs["inside_cern_gpn"] = get_credentials_manager().inside_cern_gpn()
+
+    wanted = set(numbers)
+    ranges = collapse_numbers(wanted, max_gap)
+
+    if not silent:
+        print(
+            "Getting {} {} in {} queries from CMS OMS".format(
+                len(wanted), table, len(ranges)
+            )
+        )
+
+    def get_range(number_range):
+        parameters = {
+            "filter[{}][GE]".format(key): number_range[0],
+            "filter[{}][LE]".format(key): number_range[1],
+            "sort": key,
+        }
+        return get_resources(
+            table, parameters, page_size=page_size, silent=True, **kwargs
+        )
+
+    resources = OrderedDict()
+    for _, range_resources in iter_ordered(get_range, ranges, workers):
+        for resource in range_resources:
+            if resource[key] in wanted:
+                resources[resource[key]] = resource
+
+    missing = sorted(wanted.difference(resources))
+    if missing and not silent:
+        print("{} {} not found: {}".format(len(missing), table, missing))
+    return resources, missing
+
+
+def get_runs_by_numbers(run_numbers, **kwargs):
+    """
+    >>> runs, missing = get_runs_by_numbers([317512, 317513, 320000])
+    >>> runs[317512]["fill_number"]
+
+    :param workers: Number of range queries retrieved at once
+    :param max_gap: Join ranges if at most that many run numbers lie between
+    :return: (runs, missing) tuple, runs being an OrderedDict of run number to
+        run and missing the sorted list of run numbers that were not found
+    """
+    return _get_resources_by_numbers("runs", "run_number", run_numbers, **kwargs)
+
+
+def get_fills_by_numbers(fill_numbers, **kwargs):
+    """
+    :param workers: Number of range queries retrieved at once
+    :param max_gap: Join ranges if at most that many fill numbers lie between
+    :return: (fills, missing) tuple, fills being an OrderedDict of fill number
+        to fill and missing the sorted list of fill numbers that were not found
+    """
+    return _get_resources_by_numbers("fills", "fill_number", fill_numbers, **kwargs)
 
 
 def get_lumisection_count(run_number, **kwargs):
@@ -181,19 +866,10 @@ def get_lumisection_count(run_number, **kwargs):
         "sort": "lumisection_number"
     }
 
-    if "inside_cern_gpn" not in kwargs:
-        kwargs['inside_cern_gpn'] = check_oms_connectivity()
-
-    response = _get_resources_page(
-        "lumisections", parameters, page_size=1, page=1, **kwargs
-    )
-    resource_count = response["meta"]["totalResourceCount"]
-    return resource_count
+    return count_resources("lumisections", parameters, **kwargs)
 
 
-def get_lumisections(
-    run_number=None, fill_number=None, start_time=None, end_time=None, **kwargs
-):
+def _lumisections_parameters(run_number, fill_number, start_time, end_time):
     assert (
         bool(run_number) ^ bool(fill_number) ^ bool(start_time and end_time)
     ), "Specify either run number or fill number or time range"
@@ -207,49 +883,234 @@ def get_lumisections(
         parameters["filter[start_time][GE]"] = start_time
         parameters["filter[end_time][LE]"] = end_time
     parameters["sort"] = "lumisection_number"
+    return parameters
+
+
+def iter_lumisections(
+    run_number=None, fill_number=None, start_time=None, end_time=None, **kwargs
+):
+    parameters = _lumisections_parameters(run_number, fill_number, start_time, end_time)
+    return iter_resources("lumisections", parameters, page_size=5000, **kwargs)
+
+
+def _is_closed(store, table, key, number, **kwargs):
+    """
+    :return: True if the run or fill has ended, asking OMS unless the store
+        already knows
+    """
+    stored = store.select(table, **{key: number})
+    if stored and stored[0].get("end_time") is not None:
+        return True
+
+    parameters = {"filter[{}][EQ]".format(key): number}
+    route = ("inside_cern_gpn", "cookies")
+    kwargs = dict((name, value) for name, value in kwargs.items() if name in route)
+    try:
+        resource = _get_single_resource(table, parameters, **kwargs)
+    except AssertionError:  # Does not exist (yet)
+        return False
+    return resource["attributes"].get("end_time") is not None
+
 
-    return get_resources("lumisections", parameters, page_size=5000, **kwargs)
+def get_lumisections(
+    run_number=None, fill_number=None, start_time=None, end_time=None, **kwargs
+):
+    """
+    With a store set by wbmcrawlr.store.set_store the lumisections of a run or
+    fill are only requested until the run or fill has ended and its
+    lumisections are stored.
+    """
+    store = get_store()
+    if store is None or not (run_number or fill_number):
+        return list(
+            iter_lumisections(run_number, fill_number, start_time, end_time, **kwargs)
+        )
+
+    table, key = ("runs", "run_number") if run_number else ("fills", "fill_number")
+    number = run_number or fill_number
+    name = "lumisections:{}".format(key)
+    if not store.uncovered_ranges(name, number, number):
+        return store.get_lumisections(run_number, fill_number)
+
+    lumisections = list(iter_lumisections(run_number, fill_number, **kwargs))
+    store.upsert("lumisections", lumisections)
+    is_open = any(ls.get("end_time") is None for ls in lumisections)
+    if not is_open and _is_closed(store, table, key, number, **kwargs):
+        store.add_coverage(name, number, number)
+    return store.get_lumisections(run_number, fill_number)
+
+
+def get_lumisections_columnar(
+    run_number=None, fill_number=None, start_time=None, end_time=None, **kwargs
+):
+    """
+    Like get_lumisections but returns a ColumnarTable
+    """
+    return ColumnarTable().extend(
+        iter_lumisections(run_number, fill_number, start_time, end_time, **kwargs)
+    )
 
 
 def get_hltpathinfos(run_number, **kwargs):
     parameters = {"filter[run_number][EQ]": run_number}
+    kwargs["pagination"] = OFFSET  # Not sorted, no key to continue after
 
     return get_resources("hltpathinfo", parameters, page_size=1000, **kwargs)
 
 
-def get_hltpathrates(run_number, path_name, **kwargs):
-    parameters = {
+def _hltpathrates_parameters(run_number, path_name):
+    return {
         "filter[last_lumisection_number][GT]": 0,
         "filter[path_name][EQ]": path_name,
         "filter[run_number][EQ]": run_number,
         "sort": "last_lumisection_number",
         "group[granularity]": "lumisection",
     }
-    return get_resources("hltpathrates", parameters, page_size=10000, **kwargs)
 
 
-def get_all_hltpathrates(run_number, silent=False, **kwargs):
+def iter_hltpathrates(run_number, path_name, **kwargs):
+    parameters = _hltpathrates_parameters(run_number, path_name)
+    return iter_resources("hltpathrates", parameters, page_size=10000, **kwargs)
+
+
+def get_hltpathrates(run_number, path_name, **kwargs):
+    return list(iter_hltpathrates(run_number, path_name, **kwargs))
+
+
+def get_hltpathrates_columnar(run_number, path_name, **kwargs):
+    """
+    Like get_hltpathrates but returns a ColumnarTable
+    """
+    return ColumnarTable().extend(iter_hltpathrates(run_number, path_name, **kwargs))
+
+
+def _get_hltpathrates_with_retry(run_number, path_name, retries, **kwargs):
+    for attempt in range(retries + 1):
+        try:
+            return get_hltpathrates(run_number, path_name, silent=True, **kwargs)
+        except (RequestException, ValueError, AssertionError, KeyError) as e:
+            if attempt == retries:
+                raise
+            print()
+            print("Retrying {} after error: {}".format(path_name, e))
+
+
+def iter_run_hltpathrates(run_number, page_size=10000, **kwargs):
+    """
+    Yields the hltpathrates of all paths of a run in one paginated query,
+    ordered by lumisection and not grouped by path.
+    """
+    parameters = {
+        "filter[last_lumisection_number][GT]": 0,
+        "filter[run_number][EQ]": run_number,
+        # Rows of one lumisection need a stable order across the pages
+        "sort": "last_lumisection_number,path_name",
+        "group[granularity]": "lumisection",
+    }
+    kwargs["pagination"] = OFFSET  # last_lumisection_number repeats per path
+    return iter_resources("hltpathrates", parameters, page_size=page_size, **kwargs)
+
+
+def _iter_hltpathrates_per_path(run_number, path_names, workers, retries, **kwargs):
+    def get_path_rates(path_name):
+        return _get_hltpathrates_with_retry(run_number, path_name, retries, **kwargs)
+
+    return iter_ordered(get_path_rates, path_names, workers)
+
+
+def _iter_hltpathrates_bulk(run_number, path_names, workers, **kwargs):
+    rates_by_path = OrderedDict((path_name, []) for path_name in path_names)
+    for hltpathrate in iter_run_hltpathrates(
+        run_number, silent=True, workers=workers, **kwargs
+    ):
+        rates_by_path.setdefault(hltpathrate["path_name"], []).append(hltpathrate)
+    return iter(rates_by_path.items())
+
+
+def iter_all_hltpathrates(
+    run_number,
+    silent=False,
+    workers=1,
+    retries=PATH_RETRIES,
+    strategy=PER_PATH,
+    **kwargs
+):
+    """
+    Yields the hltpathrates of all paths of a run, ordered by path.
+
+    With the PER_PATH strategy every path is requested on its own, with up to
+    `workers` paths at the same time. The BULK strategy requests the rates of
+    all paths in one paginated query and groups them by path afterwards, which
+    needs far fewer requests but keeps the whole run in memory.
+
+    :param workers: Number of paths (or pages with BULK) retrieved at once
+    :param retries: How often a failing path is retried before giving up
+    :param strategy: PER_PATH or BULK
+    :param checkpoint: wbmcrawlr.checkpoint.Checkpoint, completed paths are
+        skipped when resuming
+    """
+    checkpoint = kwargs.pop("checkpoint", None)
+    assert strategy in HLTPATHRATES_STRATEGIES, "Unknown strategy {}".format(
+        strategy
+    )
+
     if not silent:
         print("Retrieving all hltpathrates for run number {}".format(run_number))
         print("Getting list of available hltpathinfos...")
 
+    # Decide on the route once. The cookies are taken from the credentials
+    # manager by every request, so all workers use the same refreshed ones.
+    if "inside_cern_gpn" not in kwargs:
+        kwargs["inside_cern_gpn"] = get_credentials_manager().inside_cern_gpn()
+
     hltpathinfos = get_hltpathinfos(run_number, silent=True, **kwargs)
 
     path_info_count = len(hltpathinfos)
 
     path_names = [pathinfo["path_name"] for pathinfo in hltpathinfos]
 
-    hltpathrates = []
+    def path_key(path_name):
+        return "hltpathrates:{}:{}".format(run_number, path_name)
 
-    for i, path_name in enumerate(path_names, 1):
+    def is_done(path_name):
+        return checkpoint is not None and checkpoint.get(path_key(path_name))
 
-        print_progress(
-            i,
-            path_info_count,
-            text="Path {}/{}: {:80s}".format(i, path_info_count, path_name),
-        )
-        hltpathrates.extend(
-            get_hltpathrates(run_number, path_name, silent=True, **kwargs)
+    if checkpoint is not None:
+        path_names = [path_name for path_name in path_names if not is_done(path_name)]
+
+    if not path_names and path_info_count:  # All paths done before
+        results = iter([])
+    elif strategy == BULK:
+        results = _iter_hltpathrates_bulk(run_number, path_names, workers, **kwargs)
+    else:
+        results = _iter_hltpathrates_per_path(
+            run_number, path_names, workers, retries, **kwargs
         )
 
-    return hltpathrates
+    for i, (path_name, hltpathrates) in enumerate(results, 1):
+        if not silent:
+            print_progress(
+                i,
+                max(i, path_info_count),
+                text="Path {}/{}: {:80s}".format(i, path_info_count, path_name),
+            )
+        if is_done(path_name):  # Only found by BULK, not in hltpathinfos
+            continue
+        for hltpathrate in hltpathrates:
+            yield hltpathrate
+        if checkpoint is not None:
+            # A dict, so paths without rates are done as well
+            checkpoint.set(path_key(path_name), {"count": len(hltpathrates)})
+
+
+def get_all_hltpathrates(run_number, silent=False, **kwargs):
+    return list(iter_all_hltpathrates(run_number, silent=silent, **kwargs))
+
+
+def get_all_hltpathrates_columnar(run_number, silent=False, **kwargs):
+    """
+    Like get_all_hltpathrates but returns a ColumnarTable
+    """
+    return ColumnarTable().extend(
+        iter_all_hltpathrates(run_number, silent=silent, **kwargs)
+    )
@@ -0,0 +1,400 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Coroutine versions of the wbmcrawlr.oms getters for asyncio applications.
+
+Requests are sent with aiohttp (pip install aiohttp) if it is installed.
+Every getter uses one connection pool for all of its requests, pass
+session=create_session() to share the pool between calls. Without aiohttp
+the requests are sent by the blocking wbmcrawlr.oms client in the default
+executor, so the event loop is not blocked either way.
+
+All pages of a query, and all paths of get_all_hltpathrates, are requested
+concurrently within the limits of the shared throttle. Requires Python 3.5.
+
+>>> loop = asyncio.get_event_loop()
+>>> runs = loop.run_until_complete(get_runs(326941, 326942))
+"""
+import asyncio
+import weakref
+from functools import partial
+from urllib.parse import urlencode
+
+from wbmcrawlr import oms
+from wbmcrawlr.auth import get_credentials_manager, needs_authentication
+from wbmcrawlr.cache import get_cache
+from wbmcrawlr.constants import CERT_TUPLE
+from wbmcrawlr.retry import (
+    REQUEST_RETRIES,
+    RETRYABLE_EXCEPTIONS,
+    backoff_delay,
+    raise_for_server_error,
+)
+from wbmcrawlr.session import POOL_SIZE
+from wbmcrawlr.throttle import get_throttle
+from wbmcrawlr.utils import (
+    calc_page_count,
+    flatten_resource,
+    iter_split_filling_scheme,
+    loads,
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def create_session(pool_size=POOL_SIZE):
+    """
+    :return: aiohttp.ClientSession keeping up to pool_size connections alive,
+        None if aiohttp is not installed
+    """
+    if aiohttp is None:
+        return None
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+
+
+async def _run_blocking(function, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, partial(function, *args, **kwargs))
+
+
+class _Response(object):
+    """
+    requests.Response like view of an aiohttp response, as expected by the
+    request hooks and the retry and authentication helpers
+    """
+
+    def __init__(self, response, content=b""):
+        self.status_code = response.status
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.content = content
+        self.ok = response.status < 400
+        self.history = [_Response(redirect) for redirect in response.history]
+
+    def json(self):
+        return loads(self.content)
+
+
+_ssl_contexts = {}
+
+
+def _create_ssl_context(cert_paths):
+    """
+    Client certificate for requests from outside the CERN GPN, without
+    verifying the server like the blocking client (verify=False)
+    """
+    import ssl
+
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    context.load_cert_chain(*cert_paths)
+    return context
+
+
+async def _ssl_context():
+    """
+    :return: SSL context with the user certificate, loaded once per
+        certificate and reused by all requests
+    """
+    from cernrequests.certs import default_user_certificate_paths
+
+    cert_paths = tuple(default_user_certificate_paths())
+    if cert_paths not in _ssl_contexts:
+        context = await _run_blocking(_create_ssl_context, cert_paths)
+        _ssl_contexts.setdefault(cert_paths, context)
+    return _ssl_contexts[cert_paths]
+
+
+# Caps the requests in flight of the coroutines of one event loop
+_gates = weakref.WeakKeyDictionary()
+
+
+def _gate(throttle):
+    """
+    :return: asyncio.Semaphore allowing throttle.max_in_flight requests of
+        the running event loop at the same time
+    """
+    loop = asyncio.get_event_loop()
+    gate = _gates.get(loop)
+    if gate is None or gate[0] is not throttle:
+        gate = (throttle, asyncio.Semaphore(throttle.max_in_flight))
+        _gates[loop] = gate
+    return gate[1]
+
+
+async def _acquire(throttle):
+    """
+    Wait for a token of the throttle without blocking the event loop
+    """
+    delay = throttle.take_token()
+    while delay > 0:
+        await asyncio.sleep(delay)
+        delay = throttle.take_token()
+
+
+async def _send(session, url, throttle, **kwargs):
+    if throttle is None:
+        async with session.get(url, **kwargs) as response:
+            return _Response(response, await response.read())
+
+    # The semaphore is released on cancellation as well
+    async with _gate(throttle):
+        await _acquire(throttle)
+        async with session.get(url, **kwargs) as response:
+            response = _Response(response, await response.read())
+    throttle.observe(response)
+    return response
+
+
+async def _request(session, table, parameters, inside_cern_gpn, cookies, timeout):
+    relative_url = "{table}?{parameters}".format(
+        table=table, parameters=urlencode(parameters)
+    )
+    kwargs = {}
+    if timeout is not None:
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+    if inside_cern_gpn:
+        url = "{}{}".format(oms.OMS_API_URL, relative_url)
+    else:
+        url = "{}{}".format(oms.OMS_ALTERNATIVE_API_URL, relative_url)
+        credentials = get_credentials_manager()
+        if cookies is None:
+            cookies = await _run_blocking(credentials.get_cookies, url, CERT_TUPLE)
+        kwargs["ssl"] = await _ssl_context()
+
+    throttle = get_throttle()
+    response = await _send(session, url, throttle, cookies=cookies, **kwargs)
+
+    if not inside_cern_gpn and needs_authentication(response):
+        cookies = await _run_blocking(
+            credentials.get_cookies, url, CERT_TUPLE, refresh=True, stale=cookies
+        )
+        response = await _send(session, url, throttle, cookies=cookies, **kwargs)
+
+    for hook in oms._request_hooks:
+        hook(table, parameters, response)
+
+    raise_for_server_error(response)
+    return response, response.json()
+
+
+async def get_oms_resource(
+    table,
+    parameters,
+    session=None,
+    inside_cern_gpn=None,
+    cookies=None,
+    timeout=None,
+    retries=REQUEST_RETRIES,
+):
+    """
+    Coroutine version of oms.get_oms_resource, using the same cache, request
+    hooks, retries and throttle.
+
+    :param session: aiohttp.ClientSession, if None the blocking client is used
+    """
+    if inside_cern_gpn is None:
+        inside_cern_gpn = await _run_blocking(
+            get_credentials_manager().inside_cern_gpn
+        )
+
+    if session is None:
+        return await _run_blocking(
+            oms.get_oms_resource,
+            table,
+            parameters,
+            cookies=cookies,
+            inside_cern_gpn=inside_cern_gpn,
+            timeout=timeout,
+            retries=retries,
+        )
+
+    cache = get_cache()
+    cache_url = "{}{}?{}".format(oms.OMS_API_URL, table, urlencode(parameters))
+    if cache is not None:
+        content = cache.get(cache_url)
+        if content is not None:
+            return loads(content)
+
+    retryable = (aiohttp.ClientError, asyncio.TimeoutError) + RETRYABLE_EXCEPTIONS
+    for attempt in range(retries + 1):
+        try:
+            response, resource = await _request(
+                session, table, parameters, inside_cern_gpn, cookies, timeout
+            )
+            break
+        except retryable as e:
+            if attempt == retries:
+                raise
+            delay = backoff_delay(attempt)
+            print()
+            print("{}, retrying in {:.1f}s".format(e, delay))
+            await asyncio.sleep(delay)
+
+    if cache is not None and response.ok:
+        ttl = oms._cache_ttl(cache, table, parameters, resource)
+        cache.set(cache_url, response.content, ttl)
+    return resource
+
+
+async def _with_session(coroutine_function, session, **kwargs):
+    """
+    Await coroutine_function(session=...), with a temporary aiohttp session
+    if none was given
+    """
+    if session is not None or aiohttp is None:
+        return await coroutine_function(session=session, **kwargs)
+    async with create_session() as session:
+        return await coroutine_function(session=session, **kwargs)
+
+
+async def _get_single_resource(table, parameters, session=None, **kwargs):
+    async def get(session):
+        return await get_oms_resource(table, parameters, session=session, **kwargs)
+
+    data = (await _with_session(get, session))["data"]
+    assert len(data) == 1, "More than 1 {} were returned".format(table)
+    return data[0]
+
+
+async def get_run(run_number, **kwargs):
+    parameters = {"filter[run_number][EQ]": run_number, "sort": "-run_number"}
+    return await _get_single_resource("runs", parameters, **kwargs)
+
+
+async def get_fill(fill_number, **kwargs):
+    parameters = {"filter[fill_number][EQ]": fill_number, "sort": "-fill_number"}
+    return await _get_single_resource("fills", parameters, **kwargs)
+
+
+async def _get_resources(table, parameters, page_size, session, units=None, **kwargs):
+    if kwargs.get("inside_cern_gpn") is None:
+        kwargs["inside_cern_gpn"] = await _run_blocking(
+            get_credentials_manager().inside_cern_gpn
+        )
+
+    async def get_page(page):
+        params = {
+            "page[offset]": (page - 1) * page_size,
+            "page[limit]": page_size,
+        }
+        params.update(parameters)
+        return await get_oms_resource(table, params, session=session, **kwargs)
+
+    first_response = await get_page(1)
+    resource_count = first_response["meta"]["totalResourceCount"]
+    pages = range(2, calc_page_count(resource_count, page_size) + 1)
+    responses = [first_response]
+    responses += await asyncio.gather(*[get_page(page) for page in pages])
+
+    # The total count of a cached first page may be outdated, see oms._cache_ttl
+    page = len(responses)
+    resource_count = max(r["meta"]["totalResourceCount"] for r in responses)
+    while page * page_size < resource_count and responses[-1]["data"]:
+        page += 1
+        responses.append(await get_page(page))
+        total = responses[-1]["meta"]["totalResourceCount"]
+        resource_count = max(resource_count, total)
+
+    resources = [
+        flatten_resource(resource, units)
+        for response in responses
+        for resource in response["data"]
+    ]
+    assert (
+        len(resources) == resource_count
+    ), "Oops, not enough resources were returned"
+    return resources
+
+
+async def get_resources(
+    table, parameters, page_size=oms.PAGE_SIZE, session=None, **kwargs
+):
+    """
+    Coroutine version of oms.get_resources. The first page tells the number
+    of resources, all further pages are requested at the same time.
+
+    :param session: aiohttp.ClientSession shared between calls
+    :param units: dict receiving the units of the run or fill fields once,
+        instead of a {key}_unit field in every run or fill
+    """
+    return await _with_session(
+        partial(_get_resources, table, parameters, page_size), session, **kwargs
+    )
+
+
+async def get_runs(begin, end, **kwargs):
+    parameters = oms._runs_parameters(begin, end)
+    return await get_resources("runs", parameters, page_size=100, **kwargs)
+
+
+async def get_fills(begin, end, **kwargs):
+    split_scheme = kwargs.pop("split_filling_scheme", False)
+    parameters = oms._fills_parameters(begin, end)
+    fills = await get_resources("fills", parameters, page_size=100, **kwargs)
+    if split_scheme:
+        return list(iter_split_filling_scheme(fills))
+    return fills
+
+
+async def get_lumisections(
+    run_number=None, fill_number=None, start_time=None, end_time=None, **kwargs
+):
+    parameters = oms._lumisections_parameters(
+        run_number, fill_number, start_time, end_time
+    )
+    return await get_resources("lumisections", parameters, page_size=5000, **kwargs)
+
+
+async def get_hltpathinfos(run_number, **kwargs):
+    parameters = {"filter[run_number][EQ]": run_number}
+    return await get_resources("hltpathinfo", parameters, page_size=1000, **kwargs)
+
+
+async def get_hltpathrates(run_number, path_name, **kwargs):
+    parameters = oms._hltpathrates_parameters(run_number, path_name)
+    return await get_resources("hltpathrates", parameters, page_size=10000, **kwargs)
+
+
+async def _get_all_hltpathrates(run_number, session, **kwargs):
+    # Every request takes the current cookies from the credentials manager,
+    # so expired ones are refreshed once for all paths
+    if kwargs.get("inside_cern_gpn") is None:
+        kwargs["inside_cern_gpn"] = await _run_blocking(
+            get_credentials_manager().inside_cern_gpn
+        )
+
+    hltpathinfos = await get_hltpathinfos(run_number, session=session, **kwargs)
+    path_names = [pathinfo["path_name"] for pathinfo in hltpathinfos]
+    rates_per_path = await asyncio.gather(
+        *[
+            get_hltpathrates(run_number, path_name, session=session, **kwargs)
+            for path_name in path_names
+        ]
+    )
+    return [rate for rates in rates_per_path for rate in rates]
+
+
+async def get_all_hltpathrates(run_number, session=None, **kwargs):
+    """
+    Coroutine version of oms.get_all_hltpathrates, requesting all paths at the
+    same time. The rates are returned ordered by path.
+    """
+    return await _with_session(
+        partial(_get_all_hltpathrates, run_number), session, **kwargs
+    )
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Retry transient request failures with exponential backoff and jitter.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import random
+import time
+
+from future import standard_library
+from requests import HTTPError, RequestException
+
+from wbmcrawlr.metrics import get_metrics
+
+standard_library.install_aliases()
+
+REQUEST_RETRIES = 3
+BACKOFF = 0.5
+MAX_BACKOFF = 30
+
+# Connection problems, timeouts, server errors, throttling and truncated JSON
+# responses
+RETRYABLE_EXCEPTIONS = (RequestException, ValueError)
+
+
+def raise_for_server_error(response):
+    """
+    Raise HTTPError for 5xx and 429 Too Many Requests responses, which are
+    worth retrying
+    """
+    if response.status_code >= 500 or response.status_code == 429:
+        kind = "Server Error" if response.status_code >= 500 else "Client Error"
+        raise HTTPError(
+            "{} {} for url: {}".format(response.status_code, kind, response.url),
+            response=response,
+        )
+
+
+def backoff_delay(attempt, backoff=BACKOFF, max_backoff=MAX_BACKOFF):
+    """
+    :return: Random delay between 0 and backoff * 2^attempt, at most max_backoff
+    """
+    return random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+
+
+def call_with_retries(
+    function, retries=REQUEST_RETRIES, backoff=BACKOFF, exceptions=RETRYABLE_EXCEPTIONS
+):
+    """
+    Call function until it does not raise a retryable exception, at most
+    retries + 1 times.
+
+    :param exceptions: Exception types worth retrying
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function()
+        except exceptions as e:
+            if attempt == retries:
+                raise
+            metrics = get_metrics()
+            if metrics is not None:
+                metrics.record_retry()
+            delay = backoff_delay(attempt, backoff)
+            print()
+            print("{}, retrying in {:.1f}s".format(e, delay))
+            time.sleep(delay)
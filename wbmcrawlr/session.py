@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Shared HTTP session with connection pooling and keep-alive.
+
+Every OMS, WBM and connectivity request goes through the session returned by
+get_session() unless a session is passed explicitly, so consecutive requests
+to the same host reuse the already established TCP and TLS connection.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+
+import requests
+from future import standard_library
+from requests.adapters import HTTPAdapter
+
+standard_library.install_aliases()
+
+POOL_SIZE = 10
+
+_session = None
+_lock = threading.Lock()
+
+
+def create_session(pool_size=POOL_SIZE):
+    """
+    :param pool_size: Maximum number of connections kept alive per host
+    :return: requests.Session with a connection pool of the given size
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session():
+    """
+    :return: The shared session, created on first use
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+
+def set_session(session):
+    """
+    Replace the shared session, e.g. with one that has a bigger pool
+    """
+    global _session
+    with _lock:
+        old_session, _session = _session, session
+    if old_session is not None and old_session is not session:
+        old_session.close()
+
+
+def set_pool_size(pool_size):
+    set_session(create_session(pool_size))
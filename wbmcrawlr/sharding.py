@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Split a run or fill number range into shards of similar resource count.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+SHARD_SIZE = 1000
+
+
+def _bisect(count, begin, end, shard_size, total=None):
+    if total is None:
+        total = count(begin, end)
+
+    if total == 0:
+        return []
+
+    if total <= shard_size or begin == end:
+        return [(begin, end, total)]
+
+    middle = (begin + end) // 2
+    left_total = count(begin, middle)
+    right_total = total - left_total
+
+    return _bisect(count, begin, middle, shard_size, left_total) + _bisect(
+        count, middle + 1, end, shard_size, right_total
+    )
+
+
+def _merge_neighbours(shards, shard_size):
+    """
+    Merge consecutive shards as long as they stay within shard_size. The gaps
+    between shards hold no resources, so they can be merged as well.
+    """
+    merged = []
+    for begin, end, total in shards:
+        if merged and merged[-1][2] + total <= shard_size:
+            previous_begin, _, previous_total = merged.pop()
+            begin, total = previous_begin, previous_total + total
+        merged.append((begin, end, total))
+    return merged
+
+
+def plan_shards(count, begin, end, shard_size=SHARD_SIZE):
+    """
+    Bisect [begin, end] until every part holds at most shard_size resources.
+
+    >>> plan_shards(lambda b, e: e - b + 1, 1, 10, shard_size=3)
+    [(1, 3, 3), (4, 5, 2), (6, 8, 3), (9, 10, 2)]
+
+    The first and last shard are stretched to begin and end, so that
+    resources added at the end of an open range, e.g. a new run, are still
+    retrieved by the last shard.
+
+    :param count: Callable returning the number of resources in [begin, end]
+    :return: List of (begin, end, count) tuples in ascending order, without
+        empty shards
+    """
+    shards = _merge_neighbours(_bisect(count, begin, end, shard_size), shard_size)
+    if shards:
+        shards[0] = (begin,) + shards[0][1:]
+        shards[-1] = shards[-1][:1] + (end, shards[-1][2])
+    return shards
@@ -0,0 +1,226 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Output sinks that write records to disk as they arrive.
+
+>>> with NdjsonSink("oms_runs.ndjson") as sink:
+...     for run in oms.iter_runs(313052, 327564):
+...         sink.write(run)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+
+from future import standard_library
+
+from wbmcrawlr.metrics import get_metrics
+from wbmcrawlr.store import STORE_PATH, Store
+
+standard_library.install_aliases()
+
+
+def _create_directory(path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        print("Creating directory '{}'".format(directory))
+        os.makedirs(directory)
+
+
+class Sink(object):
+    extension = None
+    filename = None  # Fixed file name for sinks shared by all resource types
+
+    def __init__(self, path, keep=None, table=None):
+        """
+        :param keep: Number of records of an existing file to keep and append
+            to, e.g. when resuming an interrupted crawl. None overwrites it.
+        :param table: Resource type, only used by sinks storing several types
+        """
+        self.path = path
+        self.count = 0
+        _create_directory(path)
+
+        kept = read_records(path)[:keep] if keep else []
+        self._file = io.open(path, "w", encoding="utf-8")
+        self.write_all(kept)
+
+    def write(self, record):
+        raise NotImplementedError
+
+    def write_all(self, records):
+        metrics = get_metrics()
+        write = self.write if metrics is None else metrics.timed("write", self.write)
+        for record in records:
+            write(record)
+        return self
+
+    def flush(self):
+        """
+        :return: Number of records written to disk
+        """
+        self._file.flush()
+        return self.count
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class JsonSink(Sink):
+    """
+    Writes the same document as json.dumps(records, indent=2) without holding
+    all records in memory.
+    """
+
+    extension = "json"
+
+    def write(self, record):
+        content = json.dumps(record, indent=2).replace("\n", "\n  ")
+        self._file.write("{}  {}".format("[\n" if not self.count else ",\n", content))
+        self.count += 1
+
+    def close(self):
+        self._file.write("\n]" if self.count else "[]")
+        super(JsonSink, self).close()
+
+
+class NdjsonSink(Sink):
+    """
+    Writes one JSON document per line, see http://ndjson.org
+    """
+
+    extension = "ndjson"
+
+    def write(self, record):
+        self._file.write(json.dumps(record))
+        self._file.write("\n")
+        self.count += 1
+
+
+class SqliteSink(Sink):
+    """
+    Upserts the records into a table of a wbmcrawlr.store.Store, one
+    transaction per flush() or per batch_size records. Records stored by
+    earlier crawls are kept.
+    """
+
+    extension = "sqlite"
+    filename = STORE_PATH
+    batch_size = 1000
+
+    def __init__(self, path, keep=None, table=None):
+        """
+        :param keep: Number of records stored before an interruption. They are
+            still in the store, upserting them again is harmless.
+        :param table: Store table, e.g. "runs"
+        """
+        self.path = path
+        self.table = table
+        self.count = keep or 0
+        self._pending = []
+        _create_directory(path)
+        self._store = Store(path)
+
+    def write(self, record):
+        self._pending.append(record)
+        self.count += 1
+        if len(self._pending) >= self.batch_size:
+            self._upsert()
+
+    def _upsert(self):
+        if self._pending:
+            self._store.upsert(self.table, self._pending)
+            self._pending = []
+
+    def flush(self):
+        self._upsert()
+        return self.count
+
+    def close(self):
+        self._upsert()
+        self._store.close()
+
+
+SINKS = {"json": JsonSink, "ndjson": NdjsonSink, "sqlite": SqliteSink}
+
+
+def sink_path(basename, output_format):
+    """
+    >>> sink_path("oms_runs", "ndjson")
+    'oms_runs.ndjson'
+    >>> sink_path("oms_runs", "sqlite")
+    'oms.sqlite'
+    """
+    sink = SINKS[output_format]
+    if sink.filename is not None:
+        return os.path.join(os.path.dirname(basename), sink.filename)
+    return "{}.{}".format(basename, sink.extension)
+
+
+def create_sink(basename, output_format, keep=None, table=None):
+    """
+    :param table: Resource type, e.g. "runs", required for the sqlite format
+    """
+    path = sink_path(basename, output_format)
+    return SINKS[output_format](path, keep=keep, table=table)
+
+
+def _read_json_array(content):
+    """
+    :return: Complete records of a JSON array, which a crawl that was killed
+        may have left without its last records and the closing bracket
+    """
+    decoder = json.JSONDecoder()
+    records = []
+    index = content.find("[") + 1
+    if not index:
+        return records
+
+    while True:
+        while index < len(content) and content[index] in " \t\r\n,":
+            index += 1
+        if index >= len(content) or content[index] == "]":
+            return records
+        try:
+            record, index = decoder.raw_decode(content, index)
+        except ValueError:  # Incomplete last record
+            return records
+        records.append(record)
+
+
+def read_records(path, table=None):
+    """
+    :param table: Resource type, required for the sqlite format
+    :return: List of records previously written by a sink, empty if none
+    """
+    if not os.path.exists(path):
+        return []
+    if path.endswith(".sqlite"):
+        with Store(path) as store:
+            return store.select(table)
+    with io.open(path, "r", encoding="utf-8") as file:
+        if path.endswith(".ndjson"):
+            # A crawl that was killed may have left an incomplete last line
+            lines = [line for line in file if line.endswith("\n")]
+            return [json.loads(line) for line in lines if line.strip()]
+        return _read_json_array(file.read())
@@ -0,0 +1,291 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Local SQLite store of retrieved OMS resources.
+
+Every resource type has its own table. The primary key and the most queried
+attributes are stored as columns, the complete record as JSON. Records are
+upserted, so crawling an overlapping range again updates the stored rows
+instead of duplicating them.
+
+The store also keeps track of which number ranges of a table are stored
+completely, so that only the rest has to be requested from OMS, see
+oms.get_runs with set_store().
+
+>>> with Store("oms.sqlite") as store:
+...     store.upsert("lumisections", oms.get_lumisections(319579))
+...     lumisections = store.get_lumisections(fill_number=7005)
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+from future import standard_library
+
+standard_library.install_aliases()
+
+STORE_PATH = "oms.sqlite"
+
+TableSchema = namedtuple("TableSchema", ["keys", "columns", "indexes"])
+
+TABLES = OrderedDict(
+    [
+        (
+            "runs",
+            TableSchema(
+                keys=["run_number"],
+                columns=["fill_number", "start_time", "end_time"],
+                indexes=["fill_number", "start_time"],
+            ),
+        ),
+        (
+            "fills",
+            TableSchema(
+                keys=["fill_number"],
+                columns=["start_time", "end_time"],
+                indexes=["start_time"],
+            ),
+        ),
+        (
+            "lumisections",
+            TableSchema(
+                keys=["run_number", "lumisection_number"],
+                columns=["fill_number", "start_time", "end_time"],
+                indexes=["fill_number", "start_time"],
+            ),
+        ),
+        (
+            "hltpathrates",
+            TableSchema(
+                keys=["run_number", "path_name", "last_lumisection_number"],
+                columns=["first_lumisection_number"],
+                indexes=["path_name"],
+            ),
+        ),
+        (
+            "wbm_runs",
+            TableSchema(
+                keys=["run"],
+                columns=["lhcFill", "startTime", "stopTime"],
+                indexes=["lhcFill"],
+            ),
+        ),
+    ]
+)
+
+
+_store = None
+
+
+def get_store():
+    """
+    :return: The store that oms.get_runs, get_fills and get_lumisections read
+        through, None if disabled
+    """
+    return _store
+
+
+def set_store(store):
+    """
+    Answer oms.get_runs, get_fills and get_lumisections from the given store
+    as far as possible, None to always ask OMS
+    """
+    global _store
+    _store = store
+
+
+def _schema(table):
+    if table not in TABLES:
+        raise ValueError("Unknown table {}".format(table))
+    return TABLES[table]
+
+
+class Store(object):
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock, self._connection:
+            for table, schema in TABLES.items():
+                columns = schema.keys + schema.columns
+                self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS {} ({}, record TEXT NOT NULL, "
+                    "PRIMARY KEY ({}))".format(
+                        table, ", ".join(columns), ", ".join(schema.keys)
+                    )
+                )
+                for column in schema.indexes:
+                    self._connection.execute(
+                        "CREATE INDEX IF NOT EXISTS {table}_{column} "
+                        "ON {table} ({column})".format(table=table, column=column)
+                    )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS coverage (name TEXT NOT NULL, "
+                "first_number INTEGER NOT NULL, last_number INTEGER NOT NULL, "
+                "PRIMARY KEY (name, first_number))"
+            )
+
+    def upsert(self, table, records):
+        """
+        Insert the records, replacing stored records with the same primary key,
+        in one transaction.
+
+        :return: Number of upserted records
+        """
+        schema = _schema(table)
+        columns = schema.keys + schema.columns
+        rows = [
+            tuple(record.get(column) for column in columns) + (json.dumps(record),)
+            for record in records
+        ]
+        statement = "INSERT OR REPLACE INTO {} ({}, record) VALUES ({})".format(
+            table, ", ".join(columns), ", ".join("?" * (len(columns) + 1))
+        )
+        with self._lock, self._connection:
+            self._connection.executemany(statement, rows)
+        return len(rows)
+
+    def _where(self, schema, conditions):
+        """
+        :param conditions: column=value for equality, column=(begin, end) for
+            an inclusive range, None as a bound is open
+        """
+        clauses = []
+        values = []
+        for column, value in sorted(conditions.items()):
+            if column not in schema.keys + schema.columns:
+                raise ValueError("Can not query by {}".format(column))
+            if isinstance(value, tuple):
+                begin, end = value
+                if begin is not None:
+                    clauses.append("{} >= ?".format(column))
+                    values.append(begin)
+                if end is not None:
+                    clauses.append("{} <= ?".format(column))
+                    values.append(end)
+            else:
+                clauses.append("{} = ?".format(column))
+                values.append(value)
+        where = " WHERE {}".format(" AND ".join(clauses)) if clauses else ""
+        return where, values
+
+    def select(self, table, **conditions):
+        """
+        >>> store.select("runs", fill_number=7005, start_time=("2018-07-01", None))
+
+        :return: List of records matching all conditions, ordered by primary key
+        """
+        schema = _schema(table)
+        where, values = self._where(schema, conditions)
+        statement = "SELECT record FROM {}{} ORDER BY {}".format(
+            table, where, ", ".join(schema.keys)
+        )
+        with self._lock:
+            rows = self._connection.execute(statement, values).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self, table, **conditions):
+        where, values = self._where(_schema(table), conditions)
+        statement = "SELECT COUNT(*) FROM {}{}".format(table, where)
+        with self._lock:
+            return self._connection.execute(statement, values).fetchone()[0]
+
+    def get_runs(self, begin=None, end=None, **conditions):
+        return self.select("runs", run_number=(begin, end), **conditions)
+
+    def get_fills(self, begin=None, end=None, **conditions):
+        return self.select("fills", fill_number=(begin, end), **conditions)
+
+    def get_lumisections(self, run_number=None, fill_number=None, **conditions):
+        if run_number is not None:
+            conditions["run_number"] = run_number
+        if fill_number is not None:
+            conditions["fill_number"] = fill_number
+        return self.select("lumisections", **conditions)
+
+    def get_hltpathrates(self, run_number, path_name=None, **conditions):
+        if path_name is not None:
+            conditions["path_name"] = path_name
+        return self.select("hltpathrates", run_number=run_number, **conditions)
+
+    def _coverage(self, name):
+        statement = (
+            "SELECT first_number, last_number FROM coverage WHERE name = ? "
+            "ORDER BY first_number"
+        )
+        return self._connection.execute(statement, (name,)).fetchall()
+
+    def add_coverage(self, name, begin, end):
+        """
+        Remember that all resources in [begin, end] are stored and will not
+        change anymore. Overlapping and adjacent ranges are merged.
+
+        :param name: Table and number the range refers to, e.g. "runs" or
+            "lumisections:fill_number"
+        """
+        with self._lock, self._connection:
+            merged = []
+            for range_begin, range_end in sorted(self._coverage(name) + [(begin, end)]):
+                if merged and range_begin <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+                else:
+                    merged.append((range_begin, range_end))
+            self._connection.execute("DELETE FROM coverage WHERE name = ?", (name,))
+            self._connection.executemany(
+                "INSERT INTO coverage (name, first_number, last_number) "
+                "VALUES (?, ?, ?)",
+                [(name, range_begin, range_end) for range_begin, range_end in merged],
+            )
+
+    def uncovered_ranges(self, name, begin, end):
+        """
+        :return: List of (begin, end) tuples of the parts of [begin, end] that
+            are not completely stored
+        """
+        with self._lock:
+            coverage = self._coverage(name)
+
+        ranges = []
+        for covered_begin, covered_end in coverage:
+            if covered_end < begin or covered_begin > end:
+                continue
+            if covered_begin > begin:
+                ranges.append((begin, covered_begin - 1))
+            begin = covered_end + 1
+        if begin <= end:
+            ranges.append((begin, end))
+        return ranges
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Incrementally update previously retrieved runs or fills.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from future import standard_library
+
+from wbmcrawlr.utils import collapse_numbers
+
+standard_library.install_aliases()
+
+
+def missing_ranges(stored, key, begin, end):
+    """
+    Determine which part of [begin, end] has to be requested again.
+
+    That is the still open entries (no end_time) and everything above the
+    highest stored number. Closed entries are never requested again, neither
+    are numbers below the lowest stored one.
+
+    >>> stored = [run(10), run(11, end_time=None), run(12)]
+    >>> missing_ranges(stored, "run_number", 10, 20)
+    [(11, 11), (13, 20)]
+
+    :param stored: Previously retrieved resources
+    :param key: Name of the number field, e.g. "run_number"
+    :return: List of (begin, end) tuples
+    """
+    numbers = [resource[key] for resource in stored if begin <= resource[key] <= end]
+    if not numbers:
+        return [(begin, end)]
+
+    open_numbers = [
+        resource[key]
+        for resource in stored
+        if begin <= resource[key] <= end and resource.get("end_time") is None
+    ]
+    ranges = collapse_numbers(open_numbers)
+
+    newer = (max(numbers) + 1, end)
+    if newer[0] <= end:
+        if ranges and ranges[-1][1] + 1 == newer[0]:  # Adjacent open entries
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append(newer)
+
+    return ranges
+
+
+def merge_resources(stored, retrieved, key):
+    """
+    :return: Resources sorted by key, retrieved ones replacing stored ones
+    """
+    merged = dict((resource[key], resource) for resource in stored)
+    merged.update((resource[key], resource) for resource in retrieved)
+    return [merged[number] for number in sorted(merged)]
+
+
+def sync_resources(stored, method, key, begin, end, **kwargs):
+    """
+    Retrieve only what is missing or may have changed since the last time
+
+    >>> runs = sync_resources(runs, oms.get_runs, "run_number", 313052, 327564)
+
+    :param method: e.g. oms.get_runs or oms.get_fills
+    :return: Merged list of stored and newly retrieved resources
+    """
+    retrieved = []
+    for range_begin, range_end in missing_ranges(stored, key, begin, end):
+        retrieved.extend(method(range_begin, range_end, **kwargs))
+    return merge_resources(stored, retrieved, key)
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# © Copyright 2018 CERN
+#
+# This software is distributed under the terms of the GNU General Public
+# Licence version 3 (GPL Version 3), copied verbatim in the file “LICENSE”
+#
+# In applying this licence, CERN does not waive the privileges and immunities
+# granted to it by virtue of its status as an Intergovernmental Organization
+# or submit itself to any jurisdiction.
+
+"""
+Client side rate limiting for OMS and WBM requests.
+
+Every request that reaches the network goes through the shared Throttle
+returned by get_throttle(). It combines a token bucket, limiting the number
+of requests per second, with a cap on the number of requests in flight at
+the same time. When the server answers 429 Too Many Requests or 503 Service
+Unavailable, all threads pause for the time given in the Retry-After header
+and the request rate is halved, then slowly raised again with every
+successful response.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+from future import standard_library
+
+from wbmcrawlr.metrics import phase
+
+standard_library.install_aliases()
+
+RATE = 20  # Requests per second
+BURST = 20
+MAX_IN_FLIGHT = 10
+MIN_RATE = 0.5
+THROTTLE_PAUSE = 5  # Seconds, if the server does not send Retry-After
+MAX_PAUSE = 300
+
+THROTTLING_STATUS_CODES = (429, 503)
+
+
+def retry_after(response, default=THROTTLE_PAUSE, maximum=MAX_PAUSE):
+    """
+    :return: Seconds to wait according to the Retry-After header, which is
+    either a number of seconds or an HTTP date
+    """
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return default
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        date = parsedate_tz(value)
+        if date is None:
+            return default
+        seconds = mktime_tz(date) - time.time()
+    return min(max(seconds, 0), maximum)
+
+
+class Throttle(object):
+    """
+    Token bucket rate limiter with a cap on concurrent requests
+
+    >>> throttle = Throttle(rate=5, max_in_flight=2)
+    >>> with throttle:
+    ...     response = session.get(url)
+    >>> throttle.observe(response)
+    """
+
+    def __init__(self, rate=RATE, burst=BURST, max_in_flight=MAX_IN_FLIGHT):
+        """
+        :param rate: Maximum number of requests per second, None for no limit
+        :param burst: Number of requests that can be sent at once after idling
+        :param max_in_flight: Maximum number of requests at the same time
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("Rate must be positive or None, not {}".format(rate))
+        if max_in_flight < 1:
+            raise ValueError(
+                "Max in flight must be at least 1, not {}".format(max_in_flight)
+            )
+
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_in_flight = max_in_flight
+        self._tokens = float(self.burst)
+        self._updated = time.time()
+        self._paused_until = 0
+        self._lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+
+    def take_token(self):
+        """
+        Take a token for one request without blocking, the cap on concurrent
+        requests is not checked.
+
+        :return: Seconds to wait before a token is available, 0 if one was taken
+        """
+        with self._lock:
+            now = time.time()
+            if now < self._paused_until:
+                return self._paused_until - now
+
+            if self.rate is None:
+                return 0
+
+            elapsed = max(now - self._updated, 0)
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Block until a request may be sent
+        """
+        self._in_flight.acquire()
+        try:
+            delay = self.take_token()
+            while delay > 0:
+                time.sleep(delay)
+                delay = self.take_token()
+        except BaseException:
+            self._in_flight.release()
+            raise
+
+    def release(self):
+        self._in_flight.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def pause(self, seconds):
+        """
+        Hold back all requests for the given number of seconds
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+            self._tokens = 0
+
+    def observe(self, response):
+        """
+        Slow down if the response says the server is overloaded, speed up
+        again towards the configured rate otherwise.
+        """
+        if response.status_code in THROTTLING_STATUS_CODES:
+            self.pause(retry_after(response))
+            with self._lock:
+                if self.rate is not None:
+                    self.rate = max(self.rate / 2, MIN_RATE)
+        elif self.rate is not None and self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.rate + 1 / self.rate, self.max_rate)
+
+
+def throttled(function, *args, **kwargs):
+    """
+    Call function(*args, **kwargs), which sends one request and returns the
+    response, within the limits of the shared throttle.
+    """
+    throttle = get_throttle()
+    if throttle is None:
+        with phase("network"):
+            return function(*args, **kwargs)
+
+    with phase("throttle"):
+        throttle.acquire()
+    try:
+        with phase("network"):
+            response = function(*args, **kwargs)
+    finally:
+        throttle.release()
+    throttle.observe(response)
+    return response
+
+
+_throttle = Throttle()
+
+
+def get_throttle():
+    """
+    :return: The shared throttle, None if requests are not limited
+    """
+    return _throttle
+
+
+def set_throttle(throttle):
+    """
+    Replace the shared throttle, e.g. with one allowing a higher rate, or
+    disable rate limiting with None
+    """
+    global _throttle
+    _throttle = throttle
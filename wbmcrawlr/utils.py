@@ -20,15 +20,26 @@ import cernrequests
 import requests
 from future import standard_library
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from wbmcrawlr.columnar import ColumnarTable
 from wbmcrawlr.constants import TIMEOUT_TIME
+from wbmcrawlr.session import get_session
 from wbmcrawlr.urls import OMS_API_URL, OMS_ALTERNATIVE_API_URL
 
 from wbmcrawlr.constants import CERT_TUPLE
 
 standard_library.install_aliases()
+import json
 import math
 import os
+import re
 import sys
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 
 
 def save_to_disk(path, content):
@@ -43,12 +54,31 @@ def save_to_disk(path, content):
             file.write(content.decode("utf-8"))
 
 
-def flatten_resource(response):
+def loads(content):
+    """
+    Decode a JSON response body, with orjson if it is installed
+
+    :param content: bytes
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content.decode("utf-8"))
+
+
+def flatten_resource(response, units=None):
+    """
+    :param units: dict receiving the units of the fields once, instead of a
+        {key}_unit field in every run or fill
+    """
     response_flat = response["attributes"]
     if response["type"] in ["runs", "fills"] and "meta" in response:
-        for key, value in response["meta"]["row"].items():
-            new_field_name = "{}_unit".format(key)
-            response_flat.update({new_field_name: value["units"]})
+        if units is None:
+            for key, value in response["meta"]["row"].items():
+                new_field_name = "{}_unit".format(key)
+                response_flat.update({new_field_name: value["units"]})
+        elif not units:
+            for key, value in response["meta"]["row"].items():
+                units[key] = value["units"]
     return response_flat
 
 
@@ -67,21 +97,22 @@ def print_progress(current, total, text="", *args, **kwargs):
     sys.stdout.flush()
 
 
-def check_connectivity(url):
+def check_connectivity(url, session=None):
     """
     Check if url can be accessed.
 
     :return: True if url can be accessed
     """
+    session = session or get_session()
     try:
-        requests.get(url, timeout=TIMEOUT_TIME)
+        session.get(url, timeout=TIMEOUT_TIME)
         return True
     except (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError) as e:
         return False
 
 
-def check_oms_connectivity():
-    return check_connectivity(OMS_API_URL)
+def check_oms_connectivity(session=None):
+    return check_connectivity(OMS_API_URL, session)
 
 
 def get_oms_cookie(silent=False):
@@ -93,9 +124,121 @@ def get_oms_cookie(silent=False):
 
 
 
+def iter_ordered(function, items, workers=1):
+    """
+    Like map(function, items) but with up to `workers` calls running at the
+    same time. Yields (item, result) tuples in the order of items, keeping at
+    most `workers` results in memory.
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, function(item)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(function, item)))
+            if len(pending) >= workers:
+                item, future = pending.popleft()
+                yield item, future.result()
+
+        while pending:
+            item, future = pending.popleft()
+            yield item, future.result()
+
+
 def calc_page_count(resource_count, page_size):
     return math.ceil(resource_count / page_size)
 
+
+def collapse_numbers(numbers, max_gap=0):
+    """
+    Collapse numbers into sorted (begin, end) ranges. Neighbouring ranges
+    are joined if at most max_gap numbers are missing in between.
+
+    >>> collapse_numbers([5, 1, 2, 3, 9, 10, 14])
+    [(1, 3), (5, 5), (9, 10), (14, 14)]
+    >>> collapse_numbers([5, 1, 2, 3, 9, 10, 14], max_gap=1)
+    [(1, 5), (9, 10), (14, 14)]
+    """
+    ranges = []
+    for number in sorted(set(numbers)):
+        if ranges and number - ranges[-1][1] <= max_gap + 1:
+            ranges[-1] = (ranges[-1][0], number)
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+FILLING_SCHEME_FIELDS = [
+    "spacing",
+    "bunches",
+    "ip1_5",
+    "ip2",
+    "ip8",
+    "trainlength",
+    "injections",
+    "special_info",
+]
+FILLING_SCHEME_KEYS = ["injection_scheme_{}".format(f) for f in FILLING_SCHEME_FIELDS]
+
+# Fields holding a count, e.g. "2556b" or "20inj"
+FILLING_SCHEME_COUNTS = ["bunches", "ip1_5", "ip2", "ip8", "trainlength", "injections"]
+
+LEADING_NUMBER_PATTERN = re.compile(r"^\d+")
+
+
+def _parse_filling_scheme(filling_scheme):
+    """
+    :return: List of the 8 filling scheme fields, see split_filling_scheme
+    """
+    if filling_scheme is None:
+        values = [None, None, None, None, None, None, None, None]
+    else:
+        values = filling_scheme.split("_")
+    # assert len(keys) == len(values), will fail for "100_150ns_648Pb_620_619_52_36bpi_20inj_V2"
+
+    if len(values) < 7 or len(values) > 8:
+        values = [None, None, None, None, None, None, None, None]
+
+    if len(values) == 7:
+        values.insert(0, None)
+    return values
+
+
+def _leading_number(value):
+    """
+    >>> _leading_number("2556b")
+    2556
+    """
+    match = LEADING_NUMBER_PATTERN.match(value) if value else None
+    return int(match.group()) if match else None
+
+
+def _filling_scheme_parser(typed=False):
+    """
+    :return: Function parsing a filling scheme into a tuple of its 8 fields,
+        parsing every distinct filling scheme only once
+    """
+    counts = [field in FILLING_SCHEME_COUNTS for field in FILLING_SCHEME_FIELDS]
+    parsed = {}
+
+    def parse(filling_scheme):
+        values = parsed.get(filling_scheme)
+        if values is None:
+            values = _parse_filling_scheme(filling_scheme)
+            if typed:
+                values = [
+                    _leading_number(value) if is_count else value
+                    for value, is_count in zip(values, counts)
+                ]
+            values = parsed[filling_scheme] = tuple(values)
+        return values
+
+    return parse
+
+
 def split_filling_scheme(dictionary):
     """
     See https://lpc.web.cern.ch/cgi-bin/fillingSchemeTab.py
@@ -118,33 +261,56 @@ def split_filling_scheme(dictionary):
     :param filling_scheme:
     :return:
     """
-    filling_scheme = dictionary['injection_scheme']
-    if filling_scheme is None:
-        values = [None, None, None, None, None, None, None, None]
-    else:
-        values = filling_scheme.split("_")
-    # assert len(keys) == len(values), will fail for "100_150ns_648Pb_620_619_52_36bpi_20inj_V2"
-
-    if len(values) < 7 or len(values) > 8:
-        values = [None, None, None, None, None, None, None, None]
+    values = _parse_filling_scheme(dictionary['injection_scheme'])
+    for counter, key in enumerate(FILLING_SCHEME_KEYS):
+        dictionary[key] = values[counter]
+    return dictionary
 
-    key_prefix = "injection_scheme_"
-    keys = [
-        'spacing',
-        'bunches',
-        'ip1_5',
-        'ip2',
-        'ip8',
-        'trainlength',
-        'injections',
-        'special_info'
-    ]
 
-    if len(values) == 7:
-        values.insert(0, None)
-
-    keys = ["{}{}".format(key_prefix, key) for key in keys]
+def iter_split_filling_scheme(fills, typed=False):
+    """
+    Like split_filling_scheme applied to every fill, but each distinct filling
+    scheme is only split once. Fills are updated and yielded one by one, so
+    this works on streamed fills as well.
 
-    for counter, key in enumerate(keys):
-        dictionary[key] = values[counter]
-    return dictionary
+    :param typed: Convert the counts (bunches, collisions, train length and
+        injections) to ints, e.g. "2556b" to 2556
+    """
+    parse = _filling_scheme_parser(typed)
+    fields = {}
+    for fill in fills:
+        filling_scheme = fill["injection_scheme"]
+        if filling_scheme not in fields:
+            fields[filling_scheme] = dict(
+                zip(FILLING_SCHEME_KEYS, parse(filling_scheme))
+            )
+        fill.update(fields[filling_scheme])
+        yield fill
+
+
+def split_filling_schemes(filling_schemes, typed=False):
+    """
+    Split a whole injection_scheme column at once. The thousands of fills of
+    the LHC history share a few hundred filling schemes, each distinct scheme
+    is split only once.
+
+    Schemes without the special info field are split like split_filling_scheme
+    splits them, shifted by one field, e.g. the bunches of
+    "25ns_2556b_2544_2215_2332_144bpi_20injV3" are the spacing, 25:
+
+    >>> schemes = ["25ns_2556b_2544_2215_2332_144bpi_20injV3"] * 2
+    >>> table = split_filling_schemes(schemes, typed=True)
+    >>> table["injection_scheme_bunches"]
+    array('q', [25, 25])
+
+    :param typed: Convert the counts (bunches, collisions, train length and
+        injections) to ints, stored in typed columns with missing values
+        masked
+    :return: ColumnarTable with the columns split_filling_scheme would add
+    """
+    parse = _filling_scheme_parser(typed)
+    rows = [parse(filling_scheme) for filling_scheme in filling_schemes]
+    columns = OrderedDict((key, []) for key in FILLING_SCHEME_KEYS)
+    for key, column in zip(FILLING_SCHEME_KEYS, zip(*rows)):
+        columns[key] = list(column)
+    return ColumnarTable.from_columns(columns)
@@ -19,34 +19,337 @@ from future import standard_library
 from wbmcrawlr.urls import WBM_URL
 
 standard_library.install_aliases()
-import cernrequests
+import io
+from collections import OrderedDict
+from xml.etree import ElementTree
+from xml.parsers.expat import ExpatError
+
 import xmltodict
-from cernrequests import get_sso_cookies
+from cernrequests.certs import default_user_certificate_paths
+
+from wbmcrawlr.auth import get_credentials_manager, needs_authentication
+from wbmcrawlr.cache import FOREVER, OPEN_TTL, get_cache
+from wbmcrawlr.metrics import phase, record_response
+from wbmcrawlr.retry import (
+    REQUEST_RETRIES,
+    RETRYABLE_EXCEPTIONS,
+    call_with_retries,
+    raise_for_server_error,
+)
+from wbmcrawlr.session import get_session
+from wbmcrawlr.throttle import throttled
+from wbmcrawlr.utils import iter_ordered
+
+CHUNK_SIZE = 500  # Runs per RunSummary request
+WORKERS = 4
+
+# Also retry responses that break off in the middle of the XML document
+XML_RETRYABLE_EXCEPTIONS = RETRYABLE_EXCEPTIONS + (ExpatError, ElementTree.ParseError)
 
 
-def _get_resource(servlet, parameters, cookies=None):
+def _resource_url(servlet, parameters):
     if "FORMAT" not in parameters:
         parameters["FORMAT"] = "XML"
 
     params = "&".join(["{}={}".format(key, value) for key, value in parameters.items()])
-    url = "{base}{servlet}?{params}".format(
+    return "{base}{servlet}?{params}".format(
         base=WBM_URL, servlet=servlet, params=params
     )
 
+
+def _request(url, cookies=None, session=None, stream=False):
+    """
+    Send an authenticated request, refreshing expired SSO cookies once
+
+    :param stream: Return as soon as the headers arrived, see response.raw
+    """
+    credentials = get_credentials_manager()
     if not cookies:
-        cookies = get_sso_cookies(url, verify=False)
+        cookies = credentials.get_cookies(url)
+
+    session = session or get_session()
+    cert = default_user_certificate_paths()
+    kwargs = {"cert": cert, "verify": False, "stream": stream}
+
+    response = throttled(session.get, url, cookies=cookies, **kwargs)
+
+    if needs_authentication(response):  # Cookies expired, get new ones once
+        cookies = credentials.get_cookies(url, refresh=True, stale=cookies)
+        response = throttled(session.get, url, cookies=cookies, **kwargs)
+
+    raise_for_server_error(response)
+    return response
+
+
+def _get_resource(
+    servlet, parameters, cookies=None, session=None, retries=REQUEST_RETRIES
+):
+    url = _resource_url(servlet, parameters)
+
+    cache = get_cache()
+    if cache is not None:
+        content = cache.get(url)
+        if content is not None:
+            with phase("decode"):
+                return xmltodict.parse(content)
+
+    attempts = [0]
+
+    def request():
+        attempts[0] += 1
+        response = _request(url, cookies, session)
+        record_response("wbm", servlet, response, attempts[0])
+        with phase("decode"):
+            return response, xmltodict.parse(response.content)
+
+    response, resource = call_with_retries(
+        request, retries, exceptions=XML_RETRYABLE_EXCEPTIONS
+    )
+
+    if cache is not None and response.ok:
+        cache.set(url, response.content, _cache_ttl(cache, servlet, resource))
+    return resource
+
+
+def _cache_ttl(cache, servlet, resource):
+    """
+    Like oms._cache_ttl, a RunSummary without runs or with a run without
+    stopTime can still change and is only cached for a short time
+    """
+    ttl = cache.ttl(servlet)
+    if servlet == "RunSummary":
+        run_infos = _run_infos(resource)
+        is_open = not run_infos or any(
+            run_info.get("stopTime") is None for run_info in run_infos
+        )
+        if is_open and (ttl is FOREVER or ttl > OPEN_TTL):
+            return OPEN_TTL
+    return ttl
+
+
+def _flat_record(element):
+    """
+    :return: OrderedDict of the child elements like xmltodict.parse returns
+        it, e.g. {"run": "319579", "lhcFill": "6921", ...}
+    """
+    record = OrderedDict()
+    for child in element:
+        if len(child) or child.attrib:
+            value = xmltodict.parse(ElementTree.tostring(child))[child.tag]
+        else:
+            value = child.text.strip() if child.text and child.text.strip() else None
+
+        if child.tag not in record:
+            record[child.tag] = value
+        elif isinstance(record[child.tag], list):
+            record[child.tag].append(value)
+        else:
+            record[child.tag] = [record[child.tag], value]
+    return record
+
+
+def iter_xml_items(source, tag):
+    """
+    Parse the XML document incrementally and yield every element with the
+    given tag as flat record. Yielded elements are removed from the tree, so
+    memory use does not grow with the size of the document.
+
+    :param source: File like object, e.g. response.raw
+    """
+    parents = []
+    for event, element in ElementTree.iterparse(source, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            continue
+
+        parents.pop()
+        if element.tag == tag:
+            yield _flat_record(element)
+            if parents:
+                parents[-1].remove(element)
+
+
+def _iter_timed(items):
+    """
+    Yield the items, adding the time spent producing them to the decode phase
+    """
+    while True:
+        with phase("decode"):
+            item = next(items, None)
+        if item is None:
+            return
+        yield item
 
-    response = cernrequests.get(url, cookies=cookies, verify=False)
-    return xmltodict.parse(response.content)
 
+def _iter_resource_items(
+    servlet, parameters, tag, cookies=None, session=None, retries=REQUEST_RETRIES
+):
+    """
+    Streaming version of _get_resource, yielding the items with the given tag
+    while the response is still arriving. Only the request is retried, a
+    response that breaks off while it is parsed raises, see _get_chunk_items.
+    Streamed responses are not written to the cache.
+    """
+    url = _resource_url(servlet, parameters)
 
-def _get_run_summary(parameters):
-    return _get_resource("RunSummary", parameters)
+    cache = get_cache()
+    content = cache.get(url) if cache is not None else None
+    if content is not None:
+        for item in _iter_timed(iter_xml_items(io.BytesIO(content), tag)):
+            yield item
+        return
+
+    attempts = [0]
+
+    def request():
+        attempts[0] += 1
+        return _request(url, cookies, session, stream=True)
+
+    response = call_with_retries(request, retries)
+    response.raw.decode_content = True
+    try:
+        for item in _iter_timed(iter_xml_items(response.raw, tag)):
+            yield item
+    finally:
+        record_response("wbm", servlet, response, attempts[0], response.raw.tell())
+        response.close()
+
+
+def _get_run_summary(parameters, **kwargs):
+    return _get_resource("RunSummary", parameters, **kwargs)
 
 
 def get_run_summary(run_number):
     return _get_run_summary({"RUN": run_number})
 
 
-def get_run_summary_by_range(run_number_from, run_number_to):
-    return _get_run_summary({"RUN_BEGIN": run_number_from, "RUN_END": run_number_to})
+def _run_chunks(begin, end, chunk_size):
+    """
+    >>> _run_chunks(1000, 2200, 500)
+    [(1701, 2200), (1201, 1700), (1000, 1200)]
+
+    :return: (begin, end) tuples covering the range, newest runs first like
+        the RunSummary servlet orders them
+    """
+    if not chunk_size or chunk_size <= 0:
+        return [(begin, end)]
+    return [
+        (max(chunk_end - chunk_size + 1, begin), chunk_end)
+        for chunk_end in range(end, begin - 1, -chunk_size)
+    ]
+
+
+def _run_infos(run_summary):
+    """
+    :return: List of the runInfo records of a RunSummary document, which
+        contains a single record instead of a list for one run and no cmsdb
+        content for none
+    """
+    run_infos = (run_summary["cmsdb"] or {}).get("runInfo", [])
+    return run_infos if isinstance(run_infos, list) else [run_infos]
+
+
+def _iter_chunks(get_chunk, begin, end, chunk_size, workers, cookies, session):
+    """
+    Request the chunks of the range with up to `workers` at the same time,
+    over one session. Without cookies every request takes the current ones
+    from the credentials manager, so expired cookies are refreshed once for
+    all chunks.
+
+    :return: Iterator of (chunk, result) tuples, newest chunk first
+    """
+    chunks = _run_chunks(begin, end, chunk_size)
+    session = session or get_session()
+
+    def get(chunk):
+        return get_chunk(chunk[0], chunk[1], cookies=cookies, session=session)
+
+    return iter_ordered(get, chunks, workers)
+
+
+def get_run_summary_by_range(
+    run_number_from,
+    run_number_to,
+    chunk_size=CHUNK_SIZE,
+    workers=WORKERS,
+    cookies=None,
+    session=None,
+    retries=REQUEST_RETRIES,
+):
+    """
+    Request the range in chunks of chunk_size runs, up to `workers` chunks at
+    the same time. Every chunk is retried on its own. The runs of all chunks
+    are merged into one RunSummary document, newest run first.
+
+    :param chunk_size: Runs per request, None for one request for the range
+    """
+
+    def get_chunk(begin, end, **kwargs):
+        parameters = {"RUN_BEGIN": begin, "RUN_END": end}
+        return _get_run_summary(parameters, retries=retries, **kwargs)
+
+    chunks = _run_chunks(run_number_from, run_number_to, chunk_size)
+    if len(chunks) == 1:
+        return get_chunk(
+            run_number_from, run_number_to, cookies=cookies, session=session
+        )
+
+    results = _iter_chunks(
+        get_chunk, run_number_from, run_number_to, chunk_size, workers, cookies, session
+    )
+    run_infos = [
+        run_info for _, run_summary in results for run_info in _run_infos(run_summary)
+    ]
+    if not run_infos:
+        return OrderedDict([("cmsdb", None)])
+    if len(run_infos) == 1:
+        run_infos = run_infos[0]
+    return OrderedDict([("cmsdb", OrderedDict([("runInfo", run_infos)]))])
+
+
+def iter_run_summary_by_range(
+    run_number_from,
+    run_number_to,
+    chunk_size=CHUNK_SIZE,
+    workers=WORKERS,
+    cookies=None,
+    session=None,
+    retries=REQUEST_RETRIES,
+):
+    """
+    Streaming version of get_run_summary_by_range, yielding one flat run
+    record at a time, newest run first. At most `workers` chunks are kept in
+    memory. Without chunk_size the whole range is streamed from a single
+    response, which is only retried until it starts arriving.
+
+    >>> with create_sink("wbm_runs", "ndjson") as sink:
+    ...     sink.write_all(iter_run_summary_by_range(319000, 320000))
+    """
+    if not chunk_size or chunk_size <= 0:
+        parameters = {"RUN_BEGIN": run_number_from, "RUN_END": run_number_to}
+        for run_info in _iter_resource_items(
+            "RunSummary", parameters, "runInfo", cookies, session, retries
+        ):
+            yield run_info
+        return
+
+    def get_chunk(begin, end, **kwargs):
+        parameters = {"RUN_BEGIN": begin, "RUN_END": end}
+
+        def get_items():
+            return list(
+                _iter_resource_items(
+                    "RunSummary", parameters, "runInfo", retries=0, **kwargs
+                )
+            )
+
+        return call_with_retries(
+            get_items, retries, exceptions=XML_RETRYABLE_EXCEPTIONS
+        )
+
+    results = _iter_chunks(
+        get_chunk, run_number_from, run_number_to, chunk_size, workers, cookies, session
+    )
+    for _, run_infos in results:
+        for run_info in run_infos:
+            yield run_info